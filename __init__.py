@@ -1,2 +1,10 @@
-from .viastitching_plugin import ViaStitchingPlugin
-ViaStitchingPlugin().register()
+try:
+    import pcbnew
+    import wx
+except ImportError:
+    # Imported outside KiCad (pytest collecting the tests from the repository root):
+    # there is no plugin to register
+    pass
+else:
+    from .viastitching_plugin import ViaStitchingPlugin
+    ViaStitchingPlugin().register()
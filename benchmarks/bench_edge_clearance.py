@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Benchmark: edge clearance check against outlines with many vertices
+#
+# Run from the repository root:
+#   python benchmarks/bench_edge_clearance.py
+#
+# Compares the bounded (indexed) clearance check with a full scan of every outline edge
+# and verifies both give the same answer (tests/test_geometry.py checks the distances
+# against the original pnt2line). The point in polygon test against the outline
+# shrunk by the clearance is timed too, the inset is mitered here (pcbnew rounds it) so
+# the few points around concave corners where it disagrees are counted.
+
+import os
+import sys
+import time
+
+from math import cos, pi, sin
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from viastitching_geometry import (
+    PolygonHitTester,
+    SegmentSet,
+    inset_contour,
+    lattice_points,
+)
+
+MM = 1000000
+CLEARANCE = int(0.5 * MM)
+
+
+def make_outline(vertices, radius):
+    # Wobbly circle: lots of short edges like an imported board outline
+    return [
+        (
+            int(radius + radius * (1 + 0.05 * sin(16 * a)) * cos(a)),
+            int(radius + radius * (1 + 0.05 * sin(16 * a)) * sin(a)),
+        )
+        for a in (2 * pi * i / vertices for i in range(vertices))
+    ]
+
+
+def main():
+    radius = 50 * MM
+    points = lattice_points(0, 0, 2 * radius, 2 * radius, 2 * MM, 2 * MM)
+
+    print(
+        "%10s %10s %14s %14s %10s %12s %8s"
+        % ("vertices", "points", "full [ms]", "bounded [ms]", "speedup", "inset [ms]", "differ")
+    )
+    for vertices in (100, 500, 1000, 2000):
+        outline = make_outline(vertices, radius)
+        segments = SegmentSet.Closed(outline)
+
+        start = time.perf_counter()
+        full = [d > CLEARANCE for d in segments.MinDistances(points)]
+        full_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bounded = segments.Clear(points, CLEARANCE)
+        bounded_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        inside = PolygonHitTester([inset_contour(outline, CLEARANCE)]).Contains(points)
+        inset_time = time.perf_counter() - start
+
+        assert full == bounded
+        # Points out of the outline are far from the edges too, only those inside count
+        outline_inside = PolygonHitTester([outline]).Contains(points)
+        print(
+            "%10d %10d %14.1f %14.1f %9.1fx %12.1f %8d"
+            % (
+                vertices,
+                len(points),
+                full_time * 1e3,
+                bounded_time * 1e3,
+                full_time / bounded_time,
+                inset_time * 1e3,
+                sum(
+                    a != b and hit for a, b, hit in zip(full, inside, outline_inside)
+                ),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
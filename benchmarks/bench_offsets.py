@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Benchmark: offset search of a single zone
+#
+# Run from the repository root:
+#   python benchmarks/bench_offsets.py [--size 50] [--steps 4] [--jobs N]
+#
+# Searches the Grid and Star offsets placing the most vias (see OffsetBatches) and
+# compares it with placing every trial with a new engine, checks both find the same via
+# count. With --jobs the search is also run across a process pool.
+
+import argparse
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, ".."))
+sys.path.insert(0, BENCHMARKS)
+
+import pcbnew_stub
+
+pcbnew_stub.install()
+
+from synthetic import MM, make_board
+from viastitching_board import GetViaGroup
+from viastitching_engine import FillSettings, OffsetBatches, PlacementEngine
+from viastitching_snapshot import SnapshotArea, SnapshotObstacles
+
+
+def search(areas, obstacles, settings, steps, executor=None):
+    start = time.perf_counter()
+    for progress, best, count in OffsetBatches(
+        areas, obstacles, settings, ["Grid", "Star"], steps, executor
+    ):
+        pass
+    return best, count, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offset search benchmark")
+    parser.add_argument("--size", type=float, default=50, help="zone side in mm")
+    parser.add_argument("--steps", type=int, default=4, help="offsets along each pitch")
+    parser.add_argument("--jobs", type=int, default=0, help="worker processes, if any")
+    args = parser.parse_args(argv)
+
+    density = (args.size / 50) ** 2
+    board, zone = make_board(
+        args.size,
+        tracks=int(300 * density),
+        pads=int(300 * density),
+        vias=int(100 * density),
+        zones=int(density),
+    )
+    obstacles = SnapshotObstacles(board, [zone], GetViaGroup(board))
+    settings = FillSettings(
+        via_size=6 * MM // 10,
+        drill_size=3 * MM // 10,
+        step_x=MM,
+        step_y=MM,
+        edge_clearance=MM // 2,
+        track_clearance=MM // 5,
+    )
+    area = SnapshotArea(zone, settings.edge_clearance)
+
+    best, count, elapsed = search([area], obstacles, settings, args.steps)
+    print(
+        "search:    %d vias, %s offset %d, %d nm, %.2f s"
+        % (count, best.pattern, best.offset_x, best.offset_y, elapsed)
+    )
+
+    start = time.perf_counter()
+    counts = [len(PlacementEngine(area, obstacles, settings).Place())]
+    for pattern in ("Grid", "Star"):
+        for j in range(args.steps):
+            for i in range(args.steps):
+                trial = settings.Replace(
+                    pattern=pattern,
+                    offset_x=MM * i // args.steps,
+                    offset_y=MM * j // args.steps,
+                )
+                counts.append(len(PlacementEngine(area, obstacles, trial).Place()))
+    elapsed = time.perf_counter() - start
+    assert max(counts) == count
+    print("one by one: %d vias, %.2f s" % (max(counts), elapsed))
+
+    if args.jobs:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            best, parallel, elapsed = search(
+                [area], obstacles, settings, args.steps, executor
+            )
+        assert parallel == count
+        print("parallel:  %d vias, %.2f s" % (parallel, elapsed))
+
+
+if __name__ == "__main__":
+    main()
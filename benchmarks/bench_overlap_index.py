@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Benchmark: obstacle lookup with and without the spatial index
+#
+# Run from the repository root:
+#   python benchmarks/bench_overlap_index.py
+#
+# The board (and the number of obstacles on it) grows at constant obstacle density while
+# the number of via candidates stays the same: the cost per candidate of a linear scan
+# grows with the obstacle count, the indexed lookup must stay (roughly) flat.
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from viastitching_geometry import SpatialIndex, grid_cell_size
+
+MM = 1000000
+DENSITY = 0.5  # obstacles per mm^2
+VIA = int(0.6 * MM)
+CLEARANCE = int(0.2 * MM)
+CANDIDATES = 2000
+
+
+def make_obstacles(count, board, rnd):
+    obstacles = []
+    for _ in range(count):
+        x = rnd.randrange(0, board)
+        y = rnd.randrange(0, board)
+        w = rnd.randrange(int(0.2 * MM), int(1.5 * MM))
+        h = rnd.randrange(int(0.2 * MM), int(1.5 * MM))
+        obstacles.append((x, y, x + w, y + h))
+    return obstacles
+
+
+def make_candidates(board, rnd):
+    return [(rnd.randrange(0, board), rnd.randrange(0, board)) for _ in range(CANDIDATES)]
+
+
+def linear_scan(obstacles, candidates):
+    hits = 0
+    r = VIA // 2 + CLEARANCE
+    for x, y in candidates:
+        for left, top, right, bottom in obstacles:
+            if left <= x + r and right >= x - r and top <= y + r and bottom >= y - r:
+                hits += 1
+                break
+    return hits
+
+
+def indexed(obstacles, candidates, board):
+    index = SpatialIndex(grid_cell_size(board, board, len(obstacles)))
+    for box in obstacles:
+        index.Insert(box, *box)
+    hits = 0
+    r = VIA // 2 + CLEARANCE
+    start = time.perf_counter()
+    for x, y in candidates:
+        if index.Query(x - r, y - r, x + r, y + r):
+            hits += 1
+    return hits, time.perf_counter() - start
+
+
+def main():
+    rnd = random.Random(1972)
+
+    print("%10s %14s %14s %14s" % ("obstacles", "linear [us]", "indexed [us]", "speedup"))
+    for count in (500, 1000, 2000, 4000, 8000, 16000):
+        board = int((count / DENSITY) ** 0.5) * MM
+        obstacles = make_obstacles(count, board, rnd)
+        candidates = make_candidates(board, rnd)
+
+        start = time.perf_counter()
+        linear_hits = linear_scan(obstacles, candidates)
+        linear_time = time.perf_counter() - start
+
+        indexed_hits, indexed_time = indexed(obstacles, candidates, board)
+
+        assert linear_hits == indexed_hits
+        print(
+            "%10d %14.2f %14.2f %13.1fx"
+            % (
+                count,
+                linear_time / CANDIDATES * 1e6,
+                indexed_time / CANDIDATES * 1e6,
+                linear_time / indexed_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
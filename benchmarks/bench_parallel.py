@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Benchmark: tile-parallel placement of a single large zone
+#
+# Run from the repository root:
+#   python benchmarks/bench_parallel.py [--size 200] [--jobs N]
+#
+# Places the vias of one synthetic zone serially and across a process pool (see
+# PlacementEngine.ParallelBatches), checks both give the same positions in the same
+# order and reports the speedup. Re-stitching after removing a few obstacles is compared
+# too.
+
+import argparse
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, ".."))
+sys.path.insert(0, BENCHMARKS)
+
+import pcbnew_stub
+
+pcbnew_stub.install()
+
+from synthetic import MM, make_board
+from viastitching_board import GetViaGroup
+from viastitching_engine import FillSettings, PlacementEngine
+from viastitching_snapshot import SnapshotArea, SnapshotObstacles
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    value = function(*args, **kwargs)
+    return value, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tile-parallel placement benchmark")
+    parser.add_argument("--size", type=float, default=200, help="zone side in mm")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    density = (args.size / 50) ** 2
+    board, zone = make_board(
+        args.size,
+        tracks=int(300 * density),
+        pads=int(300 * density),
+        vias=int(100 * density),
+        zones=int(density),
+    )
+    obstacles = SnapshotObstacles(board, [zone], GetViaGroup(board))
+
+    print("%8s %10s %12s %14s %10s" % ("pattern", "vias", "serial [s]", "parallel [s]", "speedup"))
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for pattern in ("Grid", "Star", "Hex", "Spiral"):
+            settings = FillSettings(
+                via_size=6 * MM // 10,
+                drill_size=3 * MM // 10,
+                step_x=MM,
+                step_y=MM,
+                edge_clearance=MM // 2,
+                track_clearance=MM // 5,
+                pattern=pattern,
+            )
+            area = SnapshotArea(zone, settings.edge_clearance)
+            serial, serial_time = timed(PlacementEngine(area, obstacles, settings).Place)
+            parallel, parallel_time = timed(
+                PlacementEngine(area, obstacles, settings).Place, executor=executor
+            )
+            assert serial == parallel, pattern
+
+            # Re-stitch with the state of the serial fill, both must agree again
+            state = PlacementEngine(area, obstacles, settings).Restitch().state
+            updates = [
+                PlacementEngine(area, obstacles[10:], settings, owned=serial).Restitch(
+                    state, pool
+                )
+                for pool in (None, executor)
+            ]
+            assert updates[0].add == updates[1].add, pattern
+            assert updates[0].remove == updates[1].remove, pattern
+            assert updates[0].state == updates[1].state, pattern
+
+            print(
+                "%8s %10d %12.2f %14.2f %9.1fx"
+                % (
+                    pattern,
+                    len(serial),
+                    serial_time,
+                    parallel_time,
+                    serial_time / max(parallel_time, 1e-9),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,720 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Minimal stand-in for the pcbnew module: only the small API surface used by the plugin
+# is implemented, enough to build synthetic boards and run the placement code outside
+# KiCad. Install it with install() before importing the plugin modules.
+#
+
+import sys
+
+from math import hypot
+
+F_Cu = 0
+B_Cu = 2
+In1_Cu = 4
+In2_Cu = 6
+In3_Cu = 8
+In4_Cu = 10
+COPPER_LAYERS = [F_Cu, In1_Cu, In2_Cu, In3_Cu, In4_Cu, B_Cu]
+LAYER_NAMES = {
+    F_Cu: "F.Cu",
+    B_Cu: "B.Cu",
+    In1_Cu: "In1.Cu",
+    In2_Cu: "In2.Cu",
+    In3_Cu: "In3.Cu",
+    In4_Cu: "In4.Cu",
+}
+UNDEFINED_LAYER = -1
+
+IU_PER_MM = 1000000
+IU_PER_MILS = 25400
+
+ARC_HIGH_DEF = 5000
+CORNER_STRATEGY_ROUND_ALL_CORNERS = 2
+
+_board = None
+
+
+def FromMM(value):
+    return int(round(value * IU_PER_MM))
+
+
+def ToMM(value):
+    return value / IU_PER_MM
+
+
+def FromMils(value):
+    return int(round(value * IU_PER_MILS))
+
+
+def ToMils(value):
+    return value / IU_PER_MILS
+
+
+def GetUserUnits():
+    return 1
+
+
+def GetBoard():
+    return _board
+
+
+def LoadBoard(filename):
+    board = BOARD.loaders[filename]()
+    board.filename = filename
+    return board
+
+
+def SaveBoard(filename, board):
+    board.filename = filename
+    board.saved += 1
+    return True
+
+
+def Refresh():
+    pass
+
+
+class VECTOR2I:
+    __slots__ = ("x", "y")
+
+    def __init__(self, x=0, y=0):
+        self.x = int(x)
+        self.y = int(y)
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+    def __repr__(self):
+        return "VECTOR2I(%d, %d)" % (self.x, self.y)
+
+
+wxPoint = VECTOR2I
+
+
+class BOX2I:
+    def __init__(self, pos=None, size=None):
+        pos = pos or VECTOR2I()
+        size = size or VECTOR2I()
+        self.x, self.y, self.w, self.h = pos.x, pos.y, size.x, size.y
+
+    @staticmethod
+    def FromCorners(left, top, right, bottom):
+        return BOX2I(VECTOR2I(left, top), VECTOR2I(right - left, bottom - top))
+
+    def GetLeft(self):
+        return self.x
+
+    def GetTop(self):
+        return self.y
+
+    def GetRight(self):
+        return self.x + self.w
+
+    def GetBottom(self):
+        return self.y + self.h
+
+    def GetWidth(self):
+        return self.w
+
+    def GetHeight(self):
+        return self.h
+
+    def Intersects(self, other):
+        return (
+            self.GetLeft() <= other.GetRight()
+            and self.GetRight() >= other.GetLeft()
+            and self.GetTop() <= other.GetBottom()
+            and self.GetBottom() >= other.GetTop()
+        )
+
+    def Contains(self, point):
+        return (
+            self.GetLeft() <= point.x <= self.GetRight()
+            and self.GetTop() <= point.y <= self.GetBottom()
+        )
+
+
+class LSET:
+    def __init__(self, layers=()):
+        self.layers = sorted(set(layers))
+
+    def Seq(self):
+        return list(self.layers)
+
+    def AddLayer(self, layer):
+        self.layers = sorted(set(self.layers) | {layer})
+        return self
+
+    def Contains(self, layer):
+        return layer in self.layers
+
+    @staticmethod
+    def AllCuMask():
+        return LSET(COPPER_LAYERS)
+
+
+class SHAPE_LINE_CHAIN:
+    def __init__(self, points=()):
+        self.points = [VECTOR2I(x, y) for x, y in points]
+
+    def PointCount(self):
+        return len(self.points)
+
+    def CPoint(self, index):
+        return self.points[index]
+
+    def Append(self, x, y=None):
+        if y is None:
+            self.points.append(VECTOR2I(x.x, x.y))
+        else:
+            self.points.append(VECTOR2I(x, y))
+
+
+class SHAPE_POLY_SET:
+    def __init__(self, other=None):
+        self.polygons = []
+        self.vertices = None
+        if other is not None:
+            for outline, holes in other.polygons:
+                self.polygons.append(
+                    (
+                        SHAPE_LINE_CHAIN((p.x, p.y) for p in outline.points),
+                        [SHAPE_LINE_CHAIN((p.x, p.y) for p in h.points) for h in holes],
+                    )
+                )
+
+    def AddPolygon(self, outline, holes=()):
+        self.polygons.append(
+            (SHAPE_LINE_CHAIN(outline), [SHAPE_LINE_CHAIN(h) for h in holes])
+        )
+        self.vertices = None
+        return self
+
+    def OutlineCount(self):
+        return len(self.polygons)
+
+    def Outline(self, index):
+        return self.polygons[index][0]
+
+    def HoleCount(self, index):
+        return len(self.polygons[index][1])
+
+    def Hole(self, index, hole):
+        return self.polygons[index][1][hole]
+
+    def TotalVertices(self):
+        return sum(
+            o.PointCount() + sum(h.PointCount() for h in holes)
+            for o, holes in self.polygons
+        )
+
+    def CVertex(self, index):
+        if self.vertices is None:
+            self.vertices = [
+                point
+                for outline, holes in self.polygons
+                for chain in [outline] + holes
+                for point in chain.points
+            ]
+        return self.vertices[index]
+
+    def BBox(self):
+        xs = [p.x for o, holes in self.polygons for c in [o] + holes for p in c.points]
+        ys = [p.y for o, holes in self.polygons for c in [o] + holes for p in c.points]
+        if not xs:
+            return BOX2I()
+        return BOX2I.FromCorners(min(xs), min(ys), max(xs), max(ys))
+
+    def Contains(self, point, subpoly=-1, accuracy=0):
+        inside = False
+        for outline, holes in self.polygons:
+            for chain in [outline] + holes:
+                pts = chain.points
+                for i in range(len(pts)):
+                    a = pts[i - 1]
+                    b = pts[i]
+                    if (a.y > point.y) != (b.y > point.y):
+                        x = a.x + (point.y - a.y) * (b.x - a.x) / (b.y - a.y)
+                        if point.x < x:
+                            inside = not inside
+        return inside
+
+    def IsEmpty(self):
+        return not self.polygons
+
+    def Deflate(self, amount, strategy, max_error):
+        # Corners are mitered rather than rounded, close enough for benchmarks
+        from viastitching_geometry import inset_contour
+
+        def shifted(chain, distance):
+            return SHAPE_LINE_CHAIN(
+                (int(round(x)), int(round(y)))
+                for x, y in inset_contour([(p.x, p.y) for p in chain.points], distance)
+            )
+
+        self.polygons = [
+            (shifted(outline, amount), [shifted(hole, -amount) for hole in holes])
+            for outline, holes in self.polygons
+        ]
+        self.vertices = None
+
+
+class NETCLASS:
+    def __init__(self, name="Default", clearance=FromMM(0.2)):
+        self.name = name
+        self.clearance = clearance
+
+    def GetName(self):
+        return self.name
+
+    def GetClearance(self):
+        return self.clearance
+
+
+class NETINFO_ITEM:
+    def __init__(self, board, name, code):
+        self.board = board
+        self.name = name
+        self.code = code
+        self.netclass = board.netclasses["Default"]
+
+    def GetNetname(self):
+        return self.name
+
+    def GetNetCode(self):
+        return self.code
+
+    def GetNetClass(self):
+        return self.netclass
+
+    def GetNetClassName(self):
+        return self.netclass.GetName()
+
+
+class BOARD_DESIGN_SETTINGS:
+    def __init__(self):
+        self.via_size = FromMM(0.6)
+        self.via_drill = FromMM(0.3)
+        self.clearance = FromMM(0.2)
+
+    def GetCurrentViaSize(self):
+        return self.via_size
+
+    def GetCurrentViaDrill(self):
+        return self.via_drill
+
+    def GetBiggestClearanceValue(self):
+        return self.clearance
+
+
+class BOARD_ITEM:
+    def __init__(self, board=None):
+        self.board = board
+        self.group = None
+        self.netcode = 0
+        self.layer = F_Cu
+        self.selected = False
+
+    def GetParentGroup(self):
+        return self.group
+
+    def GetNetCode(self):
+        return self.netcode
+
+    def SetNetCode(self, code):
+        self.netcode = code
+
+    def GetNet(self):
+        return self.board.nets_by_code.get(self.netcode) if self.board else None
+
+    def GetNetname(self):
+        net = self.GetNet()
+        return net.GetNetname() if net is not None else ""
+
+    def GetLayer(self):
+        return self.layer
+
+    def SetLayer(self, layer):
+        self.layer = layer
+
+    def GetLayerSet(self):
+        return LSET([self.layer])
+
+    def IsOnLayer(self, layer):
+        return self.GetLayerSet().Contains(layer)
+
+    def IsSelected(self):
+        return self.selected
+
+    def GetOwnClearance(self, layer=None, source=None):
+        net = self.GetNet()
+        if net is None:
+            return self.board.netclasses["Default"].GetClearance()
+        return net.GetNetClass().GetClearance()
+
+
+class PCB_TRACK(BOARD_ITEM):
+    def __init__(self, board=None):
+        super().__init__(board)
+        self.start = VECTOR2I()
+        self.end = VECTOR2I()
+        self.width = FromMM(0.25)
+
+    def SetStart(self, point):
+        self.start = VECTOR2I(point.x, point.y)
+
+    def SetEnd(self, point):
+        self.end = VECTOR2I(point.x, point.y)
+
+    def GetStart(self):
+        return self.start
+
+    def GetEnd(self):
+        return self.end
+
+    def SetWidth(self, width):
+        self.width = width
+
+    def GetWidth(self):
+        return self.width
+
+    def GetBoundingBox(self):
+        r = self.width // 2
+        return BOX2I.FromCorners(
+            min(self.start.x, self.end.x) - r,
+            min(self.start.y, self.end.y) - r,
+            max(self.start.x, self.end.x) + r,
+            max(self.start.y, self.end.y) + r,
+        )
+
+
+class PCB_ARC(PCB_TRACK):
+    def __init__(self, board=None):
+        super().__init__(board)
+        self.mid = VECTOR2I()
+
+    def SetMid(self, point):
+        self.mid = VECTOR2I(point.x, point.y)
+
+    def GetMid(self):
+        return self.mid
+
+    def GetCenter(self):
+        (ax, ay), (bx, by), (cx, cy) = (
+            (self.start.x, self.start.y),
+            (self.mid.x, self.mid.y),
+            (self.end.x, self.end.y),
+        )
+        d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+        ux = (
+            (ax * ax + ay * ay) * (by - cy)
+            + (bx * bx + by * by) * (cy - ay)
+            + (cx * cx + cy * cy) * (ay - by)
+        ) / d
+        uy = (
+            (ax * ax + ay * ay) * (cx - bx)
+            + (bx * bx + by * by) * (ax - cx)
+            + (cx * cx + cy * cy) * (bx - ax)
+        ) / d
+        return VECTOR2I(round(ux), round(uy))
+
+    def GetRadius(self):
+        c = self.GetCenter()
+        return hypot(self.start.x - c.x, self.start.y - c.y)
+
+    def GetBoundingBox(self):
+        # Conservative: whole circle box
+        c = self.GetCenter()
+        r = int(self.GetRadius()) + self.width // 2 + 1
+        return BOX2I.FromCorners(c.x - r, c.y - r, c.x + r, c.y + r)
+
+
+class PCB_VIA(PCB_TRACK):
+    def __init__(self, board=None):
+        super().__init__(board)
+        self.width = FromMM(0.6)
+        self.drill = FromMM(0.3)
+        self.layerset = LSET([F_Cu, B_Cu])
+
+    def SetPosition(self, point):
+        self.start = VECTOR2I(point.x, point.y)
+        self.end = self.start
+
+    def GetPosition(self):
+        return self.start
+
+    def SetDrill(self, drill):
+        self.drill = drill
+
+    def GetDrillValue(self):
+        return self.drill
+
+    def SetLayerSet(self, layerset):
+        self.layerset = layerset
+
+    def GetLayerSet(self):
+        return LSET.AllCuMask()
+
+    def GetBoundingBox(self):
+        r = self.width // 2
+        return BOX2I.FromCorners(
+            self.start.x - r, self.start.y - r, self.start.x + r, self.start.y + r
+        )
+
+
+class PAD(BOARD_ITEM):
+    def __init__(self, footprint, position, size, layers=None):
+        super().__init__(footprint.board)
+        self.position = position
+        self.size = size
+        self.layerset = LSET(layers if layers is not None else COPPER_LAYERS)
+
+    def GetPosition(self):
+        return self.position
+
+    def GetLayerSet(self):
+        return self.layerset
+
+    def GetBoundingBox(self):
+        return BOX2I.FromCorners(
+            self.position.x - self.size.x // 2,
+            self.position.y - self.size.y // 2,
+            self.position.x + self.size.x // 2,
+            self.position.y + self.size.y // 2,
+        )
+
+
+class FOOTPRINT(BOARD_ITEM):
+    def __init__(self, board=None):
+        super().__init__(board)
+        self.pads = []
+
+    def Add(self, pad):
+        self.pads.append(pad)
+
+    def Pads(self):
+        return list(self.pads)
+
+    def GetBoundingBox(self):
+        boxes = [p.GetBoundingBox() for p in self.pads]
+        return BOX2I.FromCorners(
+            min(b.GetLeft() for b in boxes),
+            min(b.GetTop() for b in boxes),
+            max(b.GetRight() for b in boxes),
+            max(b.GetBottom() for b in boxes),
+        )
+
+
+class ZONE(BOARD_ITEM):
+    def __init__(self, board=None):
+        super().__init__(board)
+        self.outline = SHAPE_POLY_SET()
+        self.filled = {}
+        self.layerset = LSET([F_Cu])
+        self.name = ""
+        self.rule_area = False
+        self.no_vias = False
+        self.fill_count = 0
+
+    def SetZoneName(self, name):
+        self.name = name
+
+    def GetZoneName(self):
+        return self.name
+
+    def SetLayerSet(self, layerset):
+        self.layerset = layerset
+        self.layer = layerset.Seq()[0]
+
+    def GetLayerSet(self):
+        return self.layerset
+
+    def Outline(self):
+        return self.outline
+
+    def SetOutline(self, poly_set):
+        self.outline = poly_set
+
+    def SetFilledPolysList(self, layer, poly_set):
+        self.filled[layer] = poly_set
+
+    def GetFilledPolysList(self, layer):
+        return self.filled.get(layer, SHAPE_POLY_SET())
+
+    def GetNumCorners(self):
+        return self.outline.TotalVertices()
+
+    def GetCornerPosition(self, index):
+        return self.outline.CVertex(index)
+
+    def GetBoundingBox(self):
+        return self.outline.BBox()
+
+    def HitTestFilledArea(self, layer, point, accuracy=0):
+        if layer not in self.filled:
+            return False
+        return self.filled[layer].Contains(point)
+
+    def IsOnCopperLayer(self):
+        return True
+
+    def GetDoNotAllowCopperPour(self):
+        return False
+
+    def GetIsRuleArea(self):
+        return self.rule_area
+
+    def GetDoNotAllowVias(self):
+        return self.no_vias
+
+
+class PCB_GROUP(BOARD_ITEM):
+    def __init__(self, board=None):
+        super().__init__(board)
+        self.name = ""
+        self.items = {}
+
+    def SetName(self, name):
+        self.name = name
+
+    def GetName(self):
+        return self.name
+
+    def AddItem(self, item):
+        if item.group is not None and item.group is not self:
+            item.group.RemoveItem(item)
+        item.group = self
+        self.items[id(item)] = item
+        return True
+
+    def RemoveItem(self, item):
+        if self.items.pop(id(item), None) is not None:
+            item.group = None
+        return True
+
+    def GetItems(self):
+        return list(self.items.values())
+
+
+class BOARD:
+    loaders = {}
+
+    def __init__(self):
+        # Items are kept by id (in insertion order) so removal is cheap on big boards
+        self.tracks = {}
+        self.footprints = {}
+        self.zones = {}
+        self.groups = {}
+        self.settings = BOARD_DESIGN_SETTINGS()
+        self.netclasses = {"Default": NETCLASS()}
+        self.nets_by_code = {}
+        self.nets_by_name = {}
+        self.filename = ""
+        self.saved = 0
+        self.properties = {}
+        self.connectivity_builds = 0
+        self.FindOrAddNet("")
+
+    def FindOrAddNet(self, name):
+        net = self.nets_by_name.get(name)
+        if net is None:
+            net = NETINFO_ITEM(self, name, len(self.nets_by_code))
+            self.nets_by_name[name] = net
+            self.nets_by_code[net.code] = net
+        return net
+
+    def FindNet(self, name):
+        return self.nets_by_name.get(name)
+
+    def GetNetsByName(self):
+        return dict(self.nets_by_name)
+
+    def GetNetcodeFromNetname(self, name):
+        net = self.nets_by_name.get(name)
+        return net.code if net is not None else -1
+
+    def GetNetCount(self):
+        return len(self.nets_by_code)
+
+    def GetLayerName(self, layer):
+        return LAYER_NAMES[layer]
+
+    def GetLayerID(self, name):
+        for layer, layer_name in LAYER_NAMES.items():
+            if layer_name == name:
+                return layer
+        return UNDEFINED_LAYER
+
+    def GetDesignSettings(self):
+        return self.settings
+
+    def GetTracks(self):
+        return list(self.tracks.values())
+
+    def GetFootprints(self):
+        return list(self.footprints.values())
+
+    def Zones(self):
+        return list(self.zones.values())
+
+    def GetAreaCount(self):
+        return len(self.zones)
+
+    def GetArea(self, index):
+        return list(self.zones.values())[index]
+
+    def Groups(self):
+        return list(self.groups.values())
+
+    def GetFileName(self):
+        return self.filename
+
+    def GetProperties(self):
+        return dict(self.properties)
+
+    def SetProperties(self, properties):
+        self.properties = dict(properties)
+
+    def BuildConnectivity(self):
+        self.connectivity_builds += 1
+
+    def Add(self, item):
+        item.board = self
+        if isinstance(item, PCB_TRACK):
+            self.tracks[id(item)] = item
+        elif isinstance(item, FOOTPRINT):
+            self.footprints[id(item)] = item
+        elif isinstance(item, ZONE):
+            self.zones[id(item)] = item
+        elif isinstance(item, PCB_GROUP):
+            self.groups[id(item)] = item
+
+    def Remove(self, item):
+        for items in (self.tracks, self.footprints, self.zones, self.groups):
+            items.pop(id(item), None)
+        if item.group is not None:
+            item.group.RemoveItem(item)
+
+    def Save(self, filename):
+        return SaveBoard(filename, self)
+
+
+class ZONE_FILLER:
+    def __init__(self, board, commit=None):
+        self.board = board
+
+    def Fill(self, zones, check=False):
+        for zone in zones:
+            zone.fill_count += 1
+        return True
+
+
+def install(board=None):
+    """Register this module as 'pcbnew' (and select the board returned by GetBoard)."""
+
+    global _board
+    _board = board
+    sys.modules["pcbnew"] = sys.modules[__name__]
+    return sys.modules[__name__]
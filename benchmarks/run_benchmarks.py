@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Benchmark runner: scaling curves of a full fill on synthetic boards, no KiCad needed
+#
+# Run from the repository root:
+#   python benchmarks/run_benchmarks.py [--quick] [--json results.json]
+#   python benchmarks/run_benchmarks.py --compare results.json
+#
+# Boards are built with the pcbnew stand-in (see pcbnew_stub and synthetic). One
+# dimension at a time is scaled (zone size, outline vertices, tracks, pads, other zones)
+# while the others keep their base value. Tracks, pads, vias and zones are counts on a
+# 50 mm zone: they grow with the zone area so that scaling the size keeps the obstacle
+# density.
+#
+# For every board the runner times the board snapshot, the placement, the via insertion
+# and both clear paths, and reports the candidates processed per second. With --compare,
+# placement throughput is checked against a previous --json run and the exit status is 1
+# if any case got slower than --tolerance.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, ".."))
+sys.path.insert(0, BENCHMARKS)
+
+import pcbnew_stub
+
+pcbnew_stub.install()
+
+from synthetic import MM, make_board
+from viastitching_board import (
+    GetViaGroup,
+    InsertVias,
+    MatchingVias,
+    RemoveGroupVias,
+    ViaCommit,
+)
+from viastitching_engine import FillSettings, FillStats, PlacementEngine
+from viastitching_snapshot import SnapshotArea, SnapshotObstacles
+
+BASE = {"size": 50, "vertices": 4, "tracks": 300, "pads": 300, "vias": 100, "zones": 1}
+AXES = [
+    ("size", [25, 50, 100, 200]),
+    ("vertices", [4, 500, 2000, 8000]),
+    ("tracks", [100, 300, 1000, 3000]),
+    ("pads", [100, 300, 1000, 3000]),
+    ("zones", [1, 30, 100, 300]),
+]
+QUICK_AXES = [(axis, values[:3]) for axis, values in AXES]
+
+SETTINGS = FillSettings(
+    via_size=6 * MM // 10,
+    drill_size=3 * MM // 10,
+    step_x=MM,
+    step_y=MM,
+    edge_clearance=MM // 2,
+    track_clearance=MM // 5,
+)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    return value, time.perf_counter() - start
+
+
+def run_case(parameters, repeat):
+    """Fill a synthetic board, keeping the best time of every stage over repeat runs.
+
+    Returns:
+        dict: Case results
+    """
+
+    density = (parameters["size"] / BASE["size"]) ** 2
+    counts = {
+        name: int(parameters[name] * density)
+        for name in ("tracks", "pads", "vias", "zones")
+    }
+
+    best = {}
+    for i in range(repeat):
+        board, zone = make_board(parameters["size"], parameters["vertices"], **counts)
+        group = GetViaGroup(board)
+        times = {}
+
+        def stage(name, function, *args):
+            value, times[name] = timed(function, *args)
+            return value
+
+        obstacles = stage("snapshot", SnapshotObstacles, board, [zone], group)
+        area = SnapshotArea(zone, SETTINGS.edge_clearance)
+
+        stats = FillStats()
+        engine = PlacementEngine(area, obstacles, SETTINGS, stats)
+        positions = stage("place", engine.Place)
+
+        def insert():
+            commit = ViaCommit(board, group)
+            netcode = zone.GetNetCode()
+            layers = zone.GetLayerSet()
+            InsertVias(board, group, positions, SETTINGS, netcode, layers, commit)
+            commit.Push()
+
+        stage("insert", insert)
+        matching = stage(
+            "match",
+            MatchingVias,
+            board,
+            [zone],
+            "GND",
+            SETTINGS.via_size,
+            SETTINGS.drill_size,
+        )
+        removed = stage("clear", RemoveGroupVias, board, group)
+        assert len(matching) == removed == len(positions)
+
+        for name, seconds in times.items():
+            best[name] = min(best.get(name, seconds), seconds)
+
+    result = dict(parameters)
+    result["candidates"] = stats.candidates
+    result["stitched"] = len(positions)
+    result["times"] = best
+    result["candidates_per_second"] = stats.candidates / max(best["place"], 1e-9)
+    return result
+
+
+def print_axis(axis, results):
+    print()
+    others = ["%s=%s" % (name, value) for name, value in BASE.items() if name != axis]
+    print("Scaling %s (%s)" % (axis, ", ".join(others)))
+    print(
+        "%10s %10s %8s %12s %10s %12s %10s %10s %10s"
+        % (
+            axis,
+            "candidates",
+            "vias",
+            "snapshot[ms]",
+            "place[ms]",
+            "cand/s",
+            "insert[ms]",
+            "match[ms]",
+            "clear[ms]",
+        )
+    )
+    for result in results:
+        times = result["times"]
+        print(
+            "%10s %10d %8d %12.1f %10.1f %12.0f %10.1f %10.1f %10.1f"
+            % (
+                result[axis],
+                result["candidates"],
+                result["stitched"],
+                times["snapshot"] * 1e3,
+                times["place"] * 1e3,
+                result["candidates_per_second"],
+                times["insert"] * 1e3,
+                times["match"] * 1e3,
+                times["clear"] * 1e3,
+            )
+        )
+
+
+def case_key(result):
+    # Results saved before an axis was added ran with its base value
+    return tuple(result.get(name, BASE[name]) for name in sorted(BASE))
+
+
+def compare(results, baseline_file, tolerance):
+    """Compare placement throughput with a previous run.
+
+    Returns:
+        int: Number of regressions
+    """
+
+    with open(baseline_file) as baseline:
+        previous = {case_key(result): result for result in json.load(baseline)}
+
+    print()
+    print("Compared with %s (tolerance %d%%)" % (baseline_file, tolerance * 100))
+    regressions = 0
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        ratio = result["candidates_per_second"] / old["candidates_per_second"]
+        slower = ratio < 1 - tolerance
+        regressions += slower
+        print(
+            "%-48s %12.0f -> %12.0f cand/s %7.2fx%s"
+            % (
+                ", ".join("%s=%s" % (name, result[name]) for name in sorted(BASE)),
+                old["candidates_per_second"],
+                result["candidates_per_second"],
+                ratio,
+                "  REGRESSION" if slower else "",
+            )
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Via stitching scaling benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="skip the largest boards")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per case, the best is kept"
+    )
+    parser.add_argument("--json", help="save results to this file")
+    parser.add_argument("--compare", help="compare with results saved by --json")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="slowdown reported as a regression by --compare (default: 0.3)",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    for axis, values in QUICK_AXES if args.quick else AXES:
+        axis_results = []
+        for value in values:
+            parameters = dict(BASE)
+            parameters[axis] = value
+            axis_results.append(run_case(parameters, max(1, args.repeat)))
+        print_axis(axis, axis_results)
+        results += axis_results
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
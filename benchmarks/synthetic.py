@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Synthetic boards for the benchmarks, built on the pcbnew stand-in (see pcbnew_stub)
+#
+# A board holds a single GND zone to be stitched (selected, on F.Cu and B.Cu) plus
+# obstacles spread uniformly over it: signal tracks and arcs, a footprint full of pads,
+# plain vias, signal zones and keepouts. Every dimension scales independently so the cost
+# of each one can be measured on its own.
+
+import random
+
+from math import cos, pi, sin
+
+import pcbnew_stub as pcbnew
+
+MM = pcbnew.IU_PER_MM
+
+
+def square(cx, cy, half):
+    return [
+        (cx - half, cy - half),
+        (cx + half, cy - half),
+        (cx + half, cy + half),
+        (cx - half, cy + half),
+    ]
+
+
+def wobbly_outline(cx, cy, radius, vertices):
+    """Return a closed outline with many short edges, like an imported board outline."""
+
+    if vertices <= 4:
+        return square(cx, cy, radius)
+
+    return [
+        (
+            int(cx + radius * (1 + 0.05 * sin(16 * a)) * cos(a)),
+            int(cy + radius * (1 + 0.05 * sin(16 * a)) * sin(a)),
+        )
+        for a in (2 * pi * i / vertices for i in range(vertices))
+    ]
+
+
+def make_board(size=50, vertices=4, tracks=200, pads=200, vias=50, zones=1, seed=1):
+    """Build a synthetic board.
+
+    Parameters:
+        size (float): Side of the stitched zone in mm
+        vertices (int): Number of outline vertices (4 gives a square zone)
+        tracks (int): Number of signal tracks (plus one arc every ten tracks)
+        pads (int): Number of pads
+        vias (int): Number of plain vias
+        zones (int): Number of signal zones (plus a keepout every ten zones)
+        seed (int): Random seed, the same arguments always give the same board
+
+    Returns:
+        tuple: (pcbnew.BOARD, pcbnew.ZONE) the board and the zone to be stitched
+    """
+
+    rnd = random.Random(seed)
+    board = pcbnew.BOARD()
+    gnd = board.FindOrAddNet("GND")
+    sig = board.FindOrAddNet("SIG")
+
+    extent = int(size * MM)
+    half = extent // 2
+    # Filled polygons are slightly smaller than the outline, with a hole in the middle
+    outline = wobbly_outline(half, half, half, vertices)
+    filled = wobbly_outline(half, half, half - MM // 5, vertices)
+    hole = square(half, half, extent // 10)
+
+    zone = pcbnew.ZONE(board)
+    zone.SetZoneName("GND")
+    zone.SetLayerSet(pcbnew.LSET([pcbnew.F_Cu, pcbnew.B_Cu]))
+    zone.SetNetCode(gnd.GetNetCode())
+    zone.SetOutline(pcbnew.SHAPE_POLY_SET().AddPolygon(outline))
+    for layer in (pcbnew.F_Cu, pcbnew.B_Cu):
+        zone.SetFilledPolysList(layer, pcbnew.SHAPE_POLY_SET().AddPolygon(filled, [hole]))
+    zone.selected = True
+    board.Add(zone)
+
+    def position():
+        return pcbnew.VECTOR2I(rnd.randrange(0, extent), rnd.randrange(0, extent))
+
+    # The first signal zone sits on a corner, the others anywhere
+    for i in range(zones):
+        if i == 0:
+            corner = square(extent // 8, extent // 8, extent // 16)
+        else:
+            center = position()
+            corner = wobbly_outline(center.x, center.y, rnd.randrange(MM, 5 * MM), 24)
+        other = pcbnew.ZONE(board)
+        other.SetZoneName("SIG")
+        other.SetLayerSet(pcbnew.LSET([pcbnew.F_Cu]))
+        other.SetNetCode(sig.GetNetCode())
+        other.SetOutline(pcbnew.SHAPE_POLY_SET().AddPolygon(corner))
+        other.SetFilledPolysList(pcbnew.F_Cu, pcbnew.SHAPE_POLY_SET().AddPolygon(corner))
+        board.Add(other)
+
+        if i % 10 == 9:
+            center = position()
+            keepout = pcbnew.ZONE(board)
+            keepout.rule_area = True
+            keepout.no_vias = True
+            keepout.SetOutline(
+                pcbnew.SHAPE_POLY_SET().AddPolygon(square(center.x, center.y, 2 * MM))
+            )
+            board.Add(keepout)
+
+    for i in range(tracks):
+        start = position()
+        track = pcbnew.PCB_TRACK(board)
+        track.SetStart(start)
+        track.SetEnd(
+            pcbnew.VECTOR2I(
+                start.x + rnd.randrange(-5 * MM, 5 * MM),
+                start.y + rnd.randrange(-5 * MM, 5 * MM),
+            )
+        )
+        track.SetNetCode(sig.GetNetCode())
+        board.Add(track)
+
+        if i % 10 == 0:
+            center = position()
+            arc = pcbnew.PCB_ARC(board)
+            arc.SetStart(pcbnew.VECTOR2I(center.x - 2 * MM, center.y))
+            arc.SetMid(pcbnew.VECTOR2I(center.x, center.y - 2 * MM))
+            arc.SetEnd(pcbnew.VECTOR2I(center.x + 2 * MM, center.y))
+            arc.SetNetCode(sig.GetNetCode())
+            board.Add(arc)
+
+    footprint = pcbnew.FOOTPRINT(board)
+    for i in range(pads):
+        footprint.Add(pcbnew.PAD(footprint, position(), pcbnew.VECTOR2I(MM, 3 * MM // 5)))
+    if pads:
+        board.Add(footprint)
+
+    for i in range(vias):
+        via = pcbnew.PCB_VIA(board)
+        via.SetPosition(position())
+        via.SetNetCode(sig.GetNetCode())
+        board.Add(via)
+
+    return board, zone
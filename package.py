@@ -3,9 +3,16 @@ from zipfile import ZipFile
 
 plugin_files = [
     "__init__.py",
+    "viastitching_board.py",
+    "viastitching_cli.py",
     "viastitching_dialog.py",
+    "viastitching_engine.py",
+    "viastitching_geometry.py",
     "viastitching_gui.py",
+    "viastitching_patterns.py",
+    "viastitching_plan.py",
     "viastitching_plugin.py",
+    "viastitching_snapshot.py",
     "viastitching.png"
 ]
 
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Tests: placement and re-stitching on synthetic boards
+#
+# Run from the repository root:
+#   python -m unittest discover tests
+#
+# Boards are built with the pcbnew stand-in of the benchmarks (see pcbnew_stub and
+# synthetic). Placement must give the vias of the original plugin loop, which tried
+# every lattice point against every item of the board; re-stitching must leave a filled
+# area alone and only revisit the tiles around an edit.
+
+import os
+import sys
+import unittest
+
+from math import hypot
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, ".."))
+sys.path.insert(0, os.path.join(TESTS, "..", "benchmarks"))
+
+import pcbnew_stub as pcbnew
+
+pcbnew.install()
+
+from synthetic import MM, make_board
+from viastitching_board import (
+    AreaGroup,
+    AreaVias,
+    GetViaGroup,
+    GroupVias,
+    LoadFillState,
+    SaveFillState,
+    UpdateVias,
+    ViaCommit,
+    ViaPositions,
+)
+from viastitching_engine import (
+    STITCH,
+    FillSettings,
+    PlaceAreas,
+    PlacementEngine,
+    RestitchAreas,
+)
+from viastitching_geometry import pnt2line
+from viastitching_snapshot import SnapshotArea, SnapshotObstacles
+
+
+def boxes_touch(bbox, x, y, radius):
+    """Same test of BOX2I.Intersects between an item and the box of a via."""
+
+    return (
+        bbox.GetLeft() <= x + radius
+        and bbox.GetRight() >= x - radius
+        and bbox.GetTop() <= y + radius
+        and bbox.GetBottom() >= y - radius
+    )
+
+
+def track_distance(track, x, y):
+    """Distance from (x, y) to the centerline of a track or an arc."""
+
+    start, end = track.GetStart(), track.GetEnd()
+    if type(track) is pcbnew.PCB_ARC:
+        # The arc is the part of its circle on the side of the chord holding the middle
+        center, radius = track.GetCenter(), track.GetRadius()
+        mid = track.GetMid()
+        length = hypot(x - center.x, y - center.y)
+        if length > 0:
+            qx = center.x + (x - center.x) * radius / length
+            qy = center.y + (y - center.y) * radius / length
+
+            def side(px, py):
+                return (end.x - start.x) * (py - start.y) - (end.y - start.y) * (
+                    px - start.x
+                )
+
+            if side(qx, qy) * side(mid.x, mid.y) >= 0:
+                return abs(length - radius)
+        return min(hypot(x - p.x, y - p.y) for p in (start, end))
+    if start.x == end.x and start.y == end.y:
+        return hypot(x - start.x, y - start.y)
+    distance, nearest = pnt2line(pcbnew.VECTOR2I(x, y), start, end)
+    return distance
+
+
+def edge_clear(zone, point, clearance):
+    """CheckClearance of the original plugin."""
+
+    corners = [zone.GetCornerPosition(i) for i in range(zone.GetNumCorners())]
+    for corner in corners:
+        if hypot(corner.x - point.x, corner.y - point.y) < clearance:
+            return False
+    for i in range(len(corners)):
+        distance, nearest = pnt2line(point, corners[i - 1], corners[i])
+        if distance <= clearance:
+            return False
+    return True
+
+
+def baseline_positions(board, zone, settings):
+    """Via positions of the original plugin loop, every item checked at every point."""
+
+    bbox = zone.GetBoundingBox()
+    layers = list(zone.GetLayerSet().Seq())
+    radius = settings.via_size / 2
+    positions = []
+    offset_row = False
+    y = bbox.GetTop() + settings.offset_y
+    while y <= bbox.GetBottom():
+        x = bbox.GetLeft() + settings.offset_x
+        if settings.pattern == "Star":
+            x += int(settings.step_x / 2) if offset_row else 0
+            offset_row = not offset_row
+        while x <= bbox.GetRight():
+            point = pcbnew.VECTOR2I(x, y)
+            if all(zone.HitTestFilledArea(layer, point, 0) for layer in layers):
+                if not overlaps(board, zone, x, y, radius, settings) and (
+                    settings.edge_clearance == 0
+                    or edge_clear(zone, point, settings.edge_clearance)
+                ):
+                    positions.append((x, y))
+            x += settings.step_x
+        y += settings.step_y
+    return positions
+
+
+def overlaps(board, zone, x, y, radius, settings):
+    """CheckOverlap of the original plugin."""
+
+    for item in board.GetTracks():
+        if type(item) is pcbnew.PCB_VIA:
+            if boxes_touch(item.GetBoundingBox(), x, y, radius):
+                return True
+        elif (
+            track_distance(item, x, y) - item.GetWidth() / 2 - radius
+            < settings.track_clearance
+        ):
+            return True
+    for footprint in board.GetFootprints():
+        for pad in footprint.Pads():
+            if boxes_touch(pad.GetBoundingBox(), x, y, radius):
+                return True
+    for other in board.Zones():
+        # Zones on the net of the area are not obstacles
+        if other is zone or other.GetNetname() == zone.GetNetname():
+            continue
+        if other.HitTestFilledArea(zone.GetLayer(), pcbnew.VECTOR2I(x, y), 0):
+            return True
+    return False
+
+
+def stitch(board, zone, settings):
+    """Re-stitch zone as the Fill button does and return the engine outcome."""
+
+    group = GetViaGroup(board)
+    vias = AreaVias(group, zone)
+    obstacles = SnapshotObstacles(board, [zone], group)
+    update = RestitchAreas(
+        [SnapshotArea(zone)],
+        obstacles,
+        settings,
+        [LoadFillState(board, zone)],
+        [ViaPositions(vias)],
+    )[0]
+    commit = ViaCommit(board, group)
+    UpdateVias(
+        board,
+        AreaGroup(board, group, zone),
+        update,
+        settings,
+        zone.GetNetCode(),
+        zone.GetLayerSet(),
+        vias,
+        commit,
+    )
+    commit.Push()
+    SaveFillState(board, zone, update.state)
+    return update
+
+
+def stitched_positions(board):
+    return sorted(
+        (via.GetPosition().x, via.GetPosition().y)
+        for via in GroupVias(GetViaGroup(board))
+    )
+
+
+def fresh_positions(board, zone, settings):
+    """Positions of a placement from scratch, stitching vias aside."""
+
+    obstacles = [
+        obstacle
+        for obstacle in SnapshotObstacles(board, [zone], GetViaGroup(board))
+        if obstacle.kind != STITCH
+    ]
+    return sorted(PlaceAreas([SnapshotArea(zone)], obstacles, settings)[0])
+
+
+class BaselinePlacementTest(unittest.TestCase):
+    def check(self, pattern, edge_clearance, offset=0):
+        board, zone = make_board(size=25, tracks=60, pads=60, vias=20, seed=2)
+        settings = FillSettings(
+            via_size=6 * MM // 10,
+            drill_size=3 * MM // 10,
+            step_x=MM,
+            step_y=MM,
+            offset_x=offset,
+            offset_y=offset,
+            edge_clearance=edge_clearance,
+            track_clearance=MM // 5,
+            pattern=pattern,
+        )
+        engine = PlacementEngine(
+            SnapshotArea(zone), SnapshotObstacles(board, [zone]), settings
+        )
+        positions = engine.Place()
+        self.assertTrue(positions)
+        self.assertEqual(
+            sorted(positions), sorted(baseline_positions(board, zone, settings))
+        )
+
+    def test_grid(self):
+        self.check("Grid", 0)
+
+    def test_grid_edge_clearance(self):
+        self.check("Grid", MM, offset=MM // 3)
+
+    def test_star(self):
+        self.check("Star", MM // 2)
+
+
+class RestitchTest(unittest.TestCase):
+    def setUp(self):
+        self.board, self.zone = make_board(
+            size=50, tracks=150, pads=100, vias=30, seed=5
+        )
+        self.settings = FillSettings(
+            via_size=6 * MM // 10,
+            drill_size=3 * MM // 10,
+            step_x=4 * MM // 5,
+            step_y=4 * MM // 5,
+            edge_clearance=MM // 2,
+            track_clearance=MM // 5,
+            net="GND",
+        )
+        stitch(self.board, self.zone, self.settings)
+
+    def test_fill(self):
+        self.assertTrue(stitched_positions(self.board))
+        self.assertEqual(
+            stitched_positions(self.board),
+            fresh_positions(self.board, self.zone, self.settings),
+        )
+
+    def test_restitch_is_noop(self):
+        before = stitched_positions(self.board)
+        update = stitch(self.board, self.zone, self.settings)
+        self.assertEqual(update.add, [])
+        self.assertEqual(update.remove, [])
+        self.assertEqual(len(update.dirty), 0)
+        self.assertEqual(stitched_positions(self.board), before)
+
+    def test_moved_track(self):
+        settings = self.settings
+        left, top, right, bottom = SnapshotArea(self.zone).bbox
+        track = next(
+            item
+            for item in self.board.GetTracks()
+            if type(item) is pcbnew.PCB_TRACK
+            and all(
+                left + 5 * MM < point.x < right - 5 * MM
+                and top + 5 * MM < point.y < bottom - 5 * MM
+                for point in (item.GetStart(), item.GetEnd())
+            )
+        )
+        old = track.GetBoundingBox()
+        end = track.GetEnd()
+        track.SetEnd(pcbnew.VECTOR2I(end.x + 3 * MM, end.y + 2 * MM))
+        new = track.GetBoundingBox()
+
+        # Tiles within reach of the track, before or after the move
+        engine = PlacementEngine(SnapshotArea(self.zone), [], settings)
+        margin = settings.via_size / 2 + settings.track_clearance
+        i0, j0 = map(
+            int,
+            engine.TileOf(
+                min(old.GetLeft(), new.GetLeft()) - margin,
+                min(old.GetTop(), new.GetTop()) - margin,
+            ).split(","),
+        )
+        i1, j1 = map(
+            int,
+            engine.TileOf(
+                max(old.GetRight(), new.GetRight()) + margin,
+                max(old.GetBottom(), new.GetBottom()) + margin,
+            ).split(","),
+        )
+        affected = set(
+            "%d,%d" % (i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)
+        )
+
+        before = set(stitched_positions(self.board))
+        update = stitch(self.board, self.zone, settings)
+        self.assertTrue(update.dirty)
+        self.assertLessEqual(set(update.dirty), affected)
+        self.assertLess(len(update.dirty), len(update.state["tiles"]))
+        after = set(stitched_positions(self.board))
+        for x, y in before ^ after:
+            self.assertIn(engine.TileOf(x, y), update.dirty)
+        self.assertEqual(
+            sorted(after), fresh_positions(self.board, self.zone, settings)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Tests: point to segment distances against the original pnt2line
+#
+# Run from the repository root:
+#   python -m unittest discover tests
+#
+# The placement engine measures the edge clearance with segment_distance and SegmentSet
+# instead of pnt2line: on random outlines, repeated corners (zero length edges) and
+# collinear corners included, they must agree with it.
+
+import os
+import random
+import sys
+import unittest
+
+from math import hypot
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from viastitching_geometry import SegmentSet, aVector, pnt2line, segment_distance
+
+MM = 1000000
+# Distances are compared in internal units (nm), pnt2line goes through more roundings
+TOLERANCE = 1e-3
+
+
+def reference_distance(point, start, end):
+    """Distance from point to segment as measured by pnt2line.
+
+    pnt2line divides by the segment length: a zero length edge is measured from its
+    corner instead.
+    """
+
+    if start == end:
+        return hypot(point[0] - start[0], point[1] - start[1])
+    distance, nearest = pnt2line(
+        aVector(list(point)), aVector(list(start)), aVector(list(end))
+    )
+    return distance
+
+
+def random_outline(rng, vertices):
+    """Random closed outline with some repeated and some collinear corners."""
+
+    corners = [
+        (rng.randint(0, 50 * MM), rng.randint(0, 50 * MM)) for _ in range(vertices)
+    ]
+    outline = []
+    for i, corner in enumerate(corners):
+        outline.append(corner)
+        roll = rng.random()
+        if roll < 0.2:
+            # Zero length edge
+            outline.append(corner)
+        elif roll < 0.4:
+            # Collinear corner halfway to the next one
+            x, y = corners[(i + 1) % len(corners)]
+            outline.append(((corner[0] + x) // 2, (corner[1] + y) // 2))
+    return outline
+
+
+def probe_points(rng, outline, count):
+    """Random points around outline, its corners and points on its edge lines."""
+
+    points = [
+        (rng.randint(-5 * MM, 55 * MM), rng.randint(-5 * MM, 55 * MM))
+        for _ in range(count)
+    ]
+    points += outline
+    for i in range(len(outline)):
+        (x1, y1), (x2, y2) = outline[i - 1], outline[i]
+        # Collinear with the edge, inside and beyond both ends
+        for t in (-0.5, 0.25, 1.5):
+            points.append((x1 + t * (x2 - x1), y1 + t * (y2 - y1)))
+    return points
+
+
+class SegmentDistanceTest(unittest.TestCase):
+    def test_matches_pnt2line(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            outline = random_outline(rng, rng.randint(3, 12))
+            for point in probe_points(rng, outline, 50):
+                for i in range(len(outline)):
+                    start, end = outline[i - 1], outline[i]
+                    self.assertAlmostEqual(
+                        segment_distance(*point, *start, *end),
+                        reference_distance(point, start, end),
+                        delta=TOLERANCE,
+                    )
+
+    def test_zero_length_segment(self):
+        self.assertEqual(segment_distance(3, 4, 0, 0, 0, 0), 5)
+
+
+class SegmentSetTest(unittest.TestCase):
+    def test_min_distances(self):
+        rng = random.Random(2)
+        for _ in range(20):
+            outline = random_outline(rng, rng.randint(3, 30))
+            points = probe_points(rng, outline, 200)
+            expected = [
+                min(
+                    reference_distance(point, outline[i - 1], outline[i])
+                    for i in range(len(outline))
+                )
+                for point in points
+            ]
+            segments = SegmentSet.Closed(outline)
+            for distance, reference in zip(segments.MinDistances(points), expected):
+                self.assertAlmostEqual(distance, reference, delta=TOLERANCE)
+
+            # Bounded query: exact within the limit, inf or farther beyond it
+            limit = 2 * MM
+            for distance, reference in zip(
+                segments.MinDistances(points, limit=limit), expected
+            ):
+                if reference <= limit:
+                    self.assertAlmostEqual(distance, reference, delta=TOLERANCE)
+                else:
+                    self.assertGreater(distance, limit)
+
+    def test_clear(self):
+        # Same outcome of the original CheckClearance: a point is clear if it is farther
+        # than clearance from every edge (and so from every corner)
+        rng = random.Random(3)
+        clearance = MM // 2
+        for _ in range(20):
+            outline = random_outline(rng, rng.randint(3, 30))
+            points = probe_points(rng, outline, 200)
+            clear = SegmentSet.Closed(outline).Clear(points, clearance)
+            for point, ok in zip(points, clear):
+                reference = min(
+                    reference_distance(point, outline[i - 1], outline[i])
+                    for i in range(len(outline))
+                )
+                if abs(reference - clearance) > TOLERANCE:
+                    self.assertEqual(ok, reference > clearance)
+
+
+if __name__ == "__main__":
+    unittest.main()
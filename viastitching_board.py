@@ -0,0 +1,589 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Board side operations shared by the dialog and the command line (no wx dependency)
+# (c) Michele Santucci 2019
+#
+
+import json
+
+import pcbnew
+
+try:
+    from .viastitching_geometry import PolygonHitTester, SpatialIndex, grid_cell_size
+    from .viastitching_plan import PlanEntry
+    from .viastitching_snapshot import box_tuple, poly_set_contours
+except ImportError:
+    # Loaded outside the plugin package (command line, benchmarks)
+    from viastitching_geometry import PolygonHitTester, SpatialIndex, grid_cell_size
+    from viastitching_plan import PlanEntry
+    from viastitching_snapshot import box_tuple, poly_set_contours
+
+__viagroupname__ = "VIA_STITCHING_GROUP"
+__areagroupname__ = "VIA_STITCHING_AREA"
+__statekey__ = "VIA_STITCHING_FILL"
+
+
+def GetViaGroup(board):
+    """Return the group holding the stitching vias, creating it if missing.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+
+    Returns:
+        pcbnew.PCB_GROUP: Via stitching group
+    """
+
+    # Search through groups
+    for group in board.Groups():
+        if group.GetName() == __viagroupname__:
+            return group
+
+    group = pcbnew.PCB_GROUP(None)
+    group.SetName(__viagroupname__)
+    board.Add(group)
+    return group
+
+
+def CreateVia(board, position, settings, netcode, layer_set):
+    """Create (but don't insert) a via.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        position (tuple): Via position as (x, y)
+        settings (FillSettings): Fill parameters (via and drill size)
+        netcode (int): Via net code
+        layer_set (pcbnew.LSET): Via layers
+
+    Returns:
+        pcbnew.PCB_VIA: New via
+    """
+
+    via = pcbnew.PCB_VIA(board)
+    via.SetPosition(pcbnew.VECTOR2I(int(position[0]), int(position[1])))
+    via.SetLayerSet(layer_set)
+    via.SetNetCode(netcode)
+    via.SetDrill(settings.drill_size)
+    via.SetWidth(settings.via_size)
+    # via.SetTimeStamp(__timecode__)
+    return via
+
+
+class ViaCommit:
+    """Stage board changes and apply them in one go.
+
+    pcbnew.BOARD_COMMIT needs the editor frame, which an action plugin can't reach, so
+    changes are staged here and pushed together: items are added to (or removed from) the
+    board and the stitching group in a single pass and connectivity is rebuilt once.
+    When this happens inside ActionPlugin.Run pcbnew records the whole change as a single
+    undo step.
+    """
+
+    def __init__(self, board, group=None):
+        """Initialize an empty commit.
+
+        Parameters:
+            board (pcbnew.BOARD): Board
+            group (pcbnew.PCB_GROUP): Group added items are put in (if any)
+        """
+
+        self.board = board
+        self.group = group
+        self.added = []
+        self.removed = []
+
+    def Add(self, item, group=None):
+        """Stage item for insertion.
+
+        Parameters:
+            group (pcbnew.PCB_GROUP): Group the item is put in, the commit group if None
+        """
+
+        self.added.append((item, group))
+
+    def Remove(self, item):
+        """Stage item for removal."""
+
+        self.removed.append(item)
+
+    def Empty(self):
+        """Return True if nothing is staged."""
+
+        return not self.added and not self.removed
+
+    def Boxes(self):
+        """Return the bounding boxes of the staged items (see box_tuple).
+
+        Read them before Push, removed items are no longer on the board afterwards.
+        """
+
+        items = [item for item, group in self.added] + self.removed
+        return [box_tuple(item.GetBoundingBox()) for item in items]
+
+    def Push(self):
+        """Apply staged changes.
+
+        Returns:
+            tuple: Number of (added, removed) items
+        """
+
+        for item in self.removed:
+            parent = item.GetParentGroup()
+            if parent is not None:
+                parent.RemoveItem(item)
+            self.board.Remove(item)
+
+        for item, group in self.added:
+            self.board.Add(item)
+            if group is None:
+                group = self.group
+            if group is not None:
+                group.AddItem(item)
+
+        if not self.Empty() and hasattr(self.board, "BuildConnectivity"):
+            self.board.BuildConnectivity()
+
+        counts = (len(self.added), len(self.removed))
+        self.added = []
+        self.removed = []
+        return counts
+
+
+def InsertVias(board, group, positions, settings, netcode, layer_set, commit=None):
+    """Insert vias in the given positions and add them to the stitching group.
+
+    Parameters:
+        commit (ViaCommit): Stage vias in this commit, if None vias are inserted right away
+
+    Returns:
+        int: Number of inserted vias
+    """
+
+    own_commit = commit is None
+    if own_commit:
+        commit = ViaCommit(board, group)
+
+    viacount = 0
+    for position in positions:
+        commit.Add(CreateVia(board, position, settings, netcode, layer_set), group)
+        viacount += 1
+
+    if own_commit:
+        commit.Push()
+
+    return viacount
+
+
+def GroupItems(group):
+    """Return the members of a group, cast to their own type."""
+
+    items = []
+    for item in group.GetItems():
+        # Group members may come back as plain BOARD_ITEM proxies
+        if hasattr(item, "Cast"):
+            item = item.Cast()
+        items.append(item)
+    return items
+
+
+def AreaGroupName(area):
+    """Return the name of the group holding the vias placed by the fill of area."""
+
+    return "%s_%s" % (__areagroupname__, AreaKey(area))
+
+
+def AreaGroups(group):
+    """Return the area groups nested in the stitching group (see AreaGroup)."""
+
+    return [item for item in GroupItems(group) if type(item) is pcbnew.PCB_GROUP]
+
+
+def FindAreaGroup(group, area):
+    """Return the group holding the vias placed by the fill of area, None if missing."""
+
+    name = AreaGroupName(area)
+    for item in AreaGroups(group):
+        if item.GetName() == name:
+            return item
+    return None
+
+
+def AreaGroup(board, group, area):
+    """Return the group holding the vias placed by the fill of area, creating it if
+    missing.
+
+    Every filled area has its own group nested in the stitching group: the vias in it
+    are the ones a re-stitch of the area may replace.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        group (pcbnew.PCB_GROUP): Via stitching group
+        area (pcbnew.ZONE): Area
+
+    Returns:
+        pcbnew.PCB_GROUP: Area group
+    """
+
+    area_group = FindAreaGroup(group, area)
+    if area_group is None:
+        area_group = pcbnew.PCB_GROUP(None)
+        area_group.SetName(AreaGroupName(area))
+        board.Add(area_group)
+        group.AddItem(area_group)
+    return area_group
+
+
+def GroupVias(group):
+    """Return the vias belonging to the stitching group, area groups included.
+
+    Group members are read directly, so the cost doesn't depend on how many tracks the
+    board has.
+    """
+
+    vias = []
+    for item in GroupItems(group):
+        if type(item) is pcbnew.PCB_VIA:
+            vias.append(item)
+        elif type(item) is pcbnew.PCB_GROUP:
+            vias += GroupVias(item)
+    return vias
+
+
+def MatchingVias(board, areas, netname, via_size, drill_size):
+    """Return the vias matching net, size and drill placed inside one of the areas.
+
+    Vias are filtered by their attributes first, then the remaining ones are tested
+    against the filled area of every zone in a single batch.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        areas (list): Areas (pcbnew.ZONE)
+        netname (str): Via net
+        via_size (int): Via size
+        drill_size (int): Via drill size
+
+    Returns:
+        list: Matching vias (pcbnew.PCB_VIA)
+    """
+
+    vias = [
+        item
+        for item in board.GetTracks()
+        if type(item) is pcbnew.PCB_VIA
+        and item.GetWidth() == via_size
+        and item.GetDrillValue() == drill_size
+        and item.GetNetname() == netname
+    ]
+    if not vias:
+        return vias
+
+    positions = []
+    for via in vias:
+        position = via.GetPosition()
+        positions.append((position.x, position.y))
+
+    inside = [False] * len(vias)
+    for area in areas:
+        layer = area.GetLayer()
+        tester = PolygonHitTester(poly_set_contours(area.GetFilledPolysList(layer)))
+        hits = tester.Contains(positions)
+        inside = [a or b for a, b in zip(inside, hits)]
+
+    return [via for via, hit in zip(vias, inside) if hit]
+
+
+def NetVias(group, netname):
+    """Return the stitching vias on a net.
+
+    Returns:
+        dict: Lists of vias (pcbnew.PCB_VIA) by (x, y) position
+    """
+
+    vias = {}
+    for via in GroupVias(group):
+        if via.GetNetname() == netname:
+            position = via.GetPosition()
+            vias.setdefault((position.x, position.y), []).append(via)
+    return vias
+
+
+def AreaVias(group, area):
+    """Return the stitching vias placed by the fill of area (see AreaGroup).
+
+    Returns:
+        dict: Lists of vias (pcbnew.PCB_VIA) by (x, y) position
+    """
+
+    vias = {}
+    area_group = FindAreaGroup(group, area)
+    if area_group is None:
+        return vias
+    for via in GroupVias(area_group):
+        position = via.GetPosition()
+        vias.setdefault((position.x, position.y), []).append(via)
+    return vias
+
+
+def ViaPositions(vias):
+    """Return the positions of vias by position (see NetVias), one per via."""
+
+    return [position for position, stack in vias.items() for via in stack]
+
+
+def UpdateVias(board, group, update, settings, netcode, layer_set, vias, commit=None):
+    """Apply a re-stitch: remove outdated vias and insert the new ones.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        group (pcbnew.PCB_GROUP): Group new vias are put in (see AreaGroup)
+        update (FillUpdate): Positions to add and remove
+        settings (FillSettings): Fill parameters
+        netcode (int): Via net code
+        layer_set (pcbnew.LSET): Via layers
+        vias (dict): Vias of the area by position (see AreaVias), removed vias are
+            dropped
+        commit (ViaCommit): Stage changes in this commit, if None they are applied right away
+
+    Returns:
+        tuple: Number of (inserted, removed) vias
+    """
+
+    own_commit = commit is None
+    if own_commit:
+        commit = ViaCommit(board, group)
+
+    removed = 0
+    for position in update.remove:
+        stack = vias.get(position)
+        if stack:
+            commit.Remove(stack.pop())
+            removed += 1
+
+    inserted = InsertVias(board, group, update.add, settings, netcode, layer_set, commit)
+
+    if own_commit:
+        commit.Push()
+
+    return inserted, removed
+
+
+def AreaKey(area):
+    """Return a string telling area apart from the other zones of the board."""
+
+    uuid = getattr(area, "m_Uuid", None)
+    if uuid is not None:
+        return uuid.AsString()
+    return "%s_%d" % (area.GetZoneName(), area.GetLayer())
+
+
+def FillStateKey(area):
+    """Return the board property holding the fill state of area."""
+
+    return "%s_%s" % (__statekey__, AreaKey(area))
+
+
+def LoadFillState(board, area):
+    """Read the state stored by the previous fill of area.
+
+    Returns:
+        dict: Fill state or None if missing (see FillUpdate)
+    """
+
+    if not hasattr(board, "GetProperties"):
+        return None
+
+    properties = board.GetProperties()
+    key = FillStateKey(area)
+    if key not in properties:
+        return None
+
+    try:
+        return json.loads(properties[key])
+    except ValueError:
+        return None
+
+
+def SaveFillState(board, area, state):
+    """Store the fill state of area in the board properties.
+
+    The state only holds a digest and a via count per tile, a few bytes every few
+    hundred vias: the vias themselves are found in the area group (see AreaGroup).
+    """
+
+    if not hasattr(board, "SetProperties"):
+        return
+
+    properties = board.GetProperties()
+    properties[FillStateKey(area)] = json.dumps(state, separators=(",", ":"))
+    board.SetProperties(properties)
+
+
+def RemoveGroupVias(board, group, commit=None):
+    """Remove every via belonging to the stitching group.
+
+    Parameters:
+        commit (ViaCommit): Stage removals in this commit, if None vias are removed right away
+
+    Returns:
+        int: Number of removed vias
+    """
+
+    own_commit = commit is None
+    if own_commit:
+        commit = ViaCommit(board)
+
+    vias = GroupVias(group)
+    for via in vias:
+        commit.Remove(via)
+
+    if own_commit:
+        commit.Push()
+        RemoveAreaGroups(board, group)
+
+    return len(vias)
+
+
+def RemoveAreaGroups(board, group):
+    """Remove the area groups left empty (see AreaGroup).
+
+    Returns:
+        int: Number of removed groups
+    """
+
+    removed = 0
+    for area_group in AreaGroups(group):
+        if not area_group.GetItems():
+            group.RemoveItem(area_group)
+            board.Remove(area_group)
+            removed += 1
+    return removed
+
+
+def ZonePlan(board, zone, netname, positions, settings):
+    """Return the placement plan entry of the vias computed for a zone.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        zone (pcbnew.ZONE): Stitched zone, vias go on its layers
+        netname (str): Via net
+        positions (list): Via positions as (x, y) tuples
+        settings (FillSettings): Fill parameters (via and drill size)
+
+    Returns:
+        PlanEntry: Plan entry
+    """
+
+    return PlanEntry(
+        netname,
+        [board.GetLayerName(layer) for layer in zone.GetLayerSet().Seq()],
+        settings.via_size,
+        settings.drill_size,
+        positions,
+    )
+
+
+def ApplyPlan(board, group, entries, commit=None):
+    """Insert the vias of a placement plan (see viastitching_plan) in the stitching group.
+
+    Positions already holding a stitching via on the same net are skipped, so applying a
+    plan twice inserts nothing the second time. Nets and layers are looked up by name
+    before anything is staged.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        group (pcbnew.PCB_GROUP): Via stitching group
+        entries (list): PlanEntry records
+        commit (ViaCommit): Stage vias in this commit, if None vias are inserted right away
+
+    Returns:
+        int: Number of inserted vias
+
+    Raises:
+        ValueError: If a net or a layer of the plan is not on the board
+    """
+
+    targets = []
+    for entry in entries:
+        netcode = board.GetNetcodeFromNetname(entry.netname)
+        if netcode < 0:
+            raise ValueError("net '%s' not found" % entry.netname)
+        layer_set = pcbnew.LSET()
+        for name in entry.layers:
+            layer = board.GetLayerID(name)
+            if layer < 0:
+                raise ValueError("layer '%s' not found" % name)
+            layer_set.AddLayer(layer)
+        targets.append((entry, netcode, layer_set))
+
+    own_commit = commit is None
+    if own_commit:
+        commit = ViaCommit(board, group)
+
+    inserted = 0
+    net_vias = {}
+    for entry, netcode, layer_set in targets:
+        if entry.netname not in net_vias:
+            net_vias[entry.netname] = NetVias(group, entry.netname)
+        vias = net_vias[entry.netname]
+        positions = []
+        for position in entry.positions:
+            if position not in vias:
+                # Mark it taken, in case entries overlap
+                vias[position] = []
+                positions.append(position)
+        # The entry carries via and drill size, like FillSettings
+        inserted += InsertVias(board, group, positions, entry, netcode, layer_set, commit)
+
+    if own_commit:
+        commit.Push()
+
+    return inserted
+
+
+def RefillZones(board, areas, boxes):
+    """Refill areas and the copper zones touching boxes, instead of every zone.
+
+    Zones are refilled around added vias and over removed ones, boxes are the bounding
+    boxes of those vias (see ViaCommit.Boxes): zones elsewhere on the board are left alone.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        areas (list): Areas always refilled (pcbnew.ZONE)
+        boxes (list): Bounding boxes of the added and removed vias
+
+    Returns:
+        int: Number of refilled zones
+    """
+
+    # pcbnew hands out a new wrapper for every lookup, zones are told apart by key
+    targets = set(FillStateKey(area) for area in areas)
+    others = []
+    for i in range(0, board.GetAreaCount()):
+        zone = board.GetArea(i)
+        if (
+            FillStateKey(zone) not in targets
+            and zone.IsOnCopperLayer()
+            and not zone.GetIsRuleArea()
+        ):
+            others.append((zone, box_tuple(zone.GetBoundingBox())))
+
+    zones = list(areas)
+    if boxes and others:
+        # Zones are few and vias many: zones are indexed, vias looked up
+        left = min(bbox[0] for zone, bbox in others)
+        top = min(bbox[1] for zone, bbox in others)
+        right = max(bbox[2] for zone, bbox in others)
+        bottom = max(bbox[3] for zone, bbox in others)
+        index = SpatialIndex(grid_cell_size(right - left, bottom - top, len(others)))
+        for n, (zone, bbox) in enumerate(others):
+            index.Insert(n, *bbox)
+        touched = set()
+        for box in boxes:
+            touched.update(index.Query(*box))
+            if len(touched) == len(others):
+                break
+        zones += [others[n][0] for n in sorted(touched)]
+
+    if zones:
+        pcbnew.ZONE_FILLER(board).Fill(zones)
+    return len(zones)
@@ -0,0 +1,484 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Headless command line interface: stitch zones of many boards without opening KiCad
+# (c) Michele Santucci 2019
+#
+# Run it with the Python interpreter shipped with KiCad (it needs the pcbnew module):
+#
+#   python viastitching_cli.py config.json board1.kicad_pcb board2.kicad_pcb ...
+#
+# With --plan the boards are left untouched: the vias of every configured zone are saved
+# to a placement plan next to the board (board.vsplan), to be applied later from the
+# dialog (see viastitching_plan).
+#
+# The configuration file is a JSON document, lengths are in mm (or mils if "units" is
+# "mils"), every setting left out falls back to "defaults" and then to the same defaults
+# used by the dialog. With "refill" the stitched zones and the zones touching the added
+# or removed vias are refilled, so the saved board is ready for DRC. A zone with
+# "optimize_offset" gets the offset placing the most vias instead of offset_x/offset_y
+# (see viastitching_engine.OffsetBatches):
+#
+#   {
+#       "units": "mm",
+#       "clear": true,
+#       "refill": true,
+#       "defaults": {"via_size": 0.6, "drill_size": 0.3, "pattern": "Star"},
+#       "zones": [
+#           {"name": "GND_TOP", "spacing_x": 1.5, "spacing_y": 1.5},
+#           {"name": "GND_MID", "optimize_offset": true},
+#           {"name": "GND_BOTTOM", "net": "GND", "edge_clearance": 0.5}
+#       ]
+#   }
+#
+
+import argparse
+import json
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pcbnew
+
+try:
+    from .viastitching_board import (
+        AreaGroup,
+        AreaVias,
+        GetViaGroup,
+        GroupVias,
+        LoadFillState,
+        RefillZones,
+        RemoveGroupVias,
+        SaveFillState,
+        UpdateVias,
+        ViaCommit,
+        ViaPositions,
+        ZonePlan,
+    )
+    from .viastitching_engine import (
+        FillSettings,
+        OffsetBatches,
+        PlaceAreas,
+        ReplaceVias,
+        RestitchAreas,
+    )
+    from .viastitching_patterns import PATTERNS
+    from .viastitching_plan import WritePlan
+    from .viastitching_snapshot import (
+        NetClearance,
+        SnapshotArea,
+        SnapshotObstacles,
+        box_tuple,
+    )
+except ImportError:
+    # Loaded outside the plugin package (command line, benchmarks)
+    from viastitching_board import (
+        AreaGroup,
+        AreaVias,
+        GetViaGroup,
+        GroupVias,
+        LoadFillState,
+        RefillZones,
+        RemoveGroupVias,
+        SaveFillState,
+        UpdateVias,
+        ViaCommit,
+        ViaPositions,
+        ZonePlan,
+    )
+    from viastitching_engine import (
+        FillSettings,
+        OffsetBatches,
+        PlaceAreas,
+        ReplaceVias,
+        RestitchAreas,
+    )
+    from viastitching_patterns import PATTERNS
+    from viastitching_plan import WritePlan
+    from viastitching_snapshot import (
+        NetClearance,
+        SnapshotArea,
+        SnapshotObstacles,
+        box_tuple,
+    )
+
+SETTINGS_KEYS = [
+    "via_size",
+    "drill_size",
+    "spacing_x",
+    "spacing_y",
+    "offset_x",
+    "offset_y",
+    "edge_clearance",
+    "track_clearance",
+    "pattern",
+    "net",
+    "optimize_offset",
+]
+
+
+def LoadConfig(filename):
+    """Load and validate a configuration file.
+
+    Returns:
+        dict: Configuration
+
+    Raises:
+        ValueError: If the configuration is not valid
+    """
+
+    with open(filename) as config_file:
+        config = json.load(config_file)
+
+    if config.get("units", "mm") not in ("mm", "mils"):
+        raise ValueError("units must be 'mm' or 'mils'")
+
+    zones = config.get("zones")
+    if not zones:
+        raise ValueError("no zones to stitch")
+
+    for zone in zones:
+        if "name" not in zone:
+            raise ValueError("every zone needs a name")
+        for key in zone:
+            if key != "name" and key not in SETTINGS_KEYS:
+                raise ValueError("unknown setting '%s'" % key)
+
+    for values in [config.get("defaults", {})] + zones:
+        if values.get("pattern", "Grid") not in PATTERNS:
+            raise ValueError("unknown pattern '%s'" % values["pattern"])
+
+    return config
+
+
+def FindZones(board, name):
+    """Return the copper zones named name."""
+
+    zones = []
+    for i in range(0, board.GetAreaCount()):
+        zone = board.GetArea(i)
+        if zone.GetZoneName() == name and zone.IsOnCopperLayer():
+            zones.append(zone)
+    return zones
+
+
+def ZoneValues(config, zone_config):
+    """Merge zone settings with the configuration defaults."""
+
+    values = dict(config.get("defaults", {}))
+    values.update(zone_config)
+    return values
+
+
+def ZoneSettings(board, config, values, zones):
+    """Turn zone settings into FillSettings, missing values fall back to board defaults.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        config (dict): Configuration
+        values (dict): Zone settings (see ZoneValues)
+        zones (list): Zones stitched with these settings, the clearance of their via
+            nets applies when no track clearance is given
+
+    Returns:
+        FillSettings: Fill parameters in board internal units
+    """
+
+    if config.get("units", "mm") == "mils":
+        FromUserUnit = pcbnew.FromMils
+    else:
+        FromUserUnit = pcbnew.FromMM
+
+    def length(key, default):
+        if key in values:
+            return FromUserUnit(float(values[key]))
+        return default
+
+    design = board.GetDesignSettings()
+    via_size = length("via_size", design.GetCurrentViaSize())
+
+    # Same defaults used by the dialog
+    return FillSettings(
+        via_size=via_size,
+        drill_size=length("drill_size", design.GetCurrentViaDrill()),
+        step_x=length("spacing_x", via_size * 2),
+        step_y=length("spacing_y", via_size * 2),
+        offset_x=length("offset_x", 0),
+        offset_y=length("offset_y", 0),
+        edge_clearance=length("edge_clearance", 0),
+        track_clearance=length("track_clearance", None),
+        pattern=values.get("pattern", "Grid"),
+        net=values.get("net", ""),
+        net_clearance=max(
+            [NetClearance(board, values.get("net", zone.GetNetname())) for zone in zones]
+            + [0]
+        ),
+    )
+
+
+def OptimizeOffset(areas, obstacles, settings, executor=None, owned=None):
+    """Return settings with the offset placing the most vias in areas (see OffsetBatches).
+
+    Raises:
+        ValueError: If the pattern isn't a lattice
+    """
+
+    for progress, best, count in OffsetBatches(
+        areas, obstacles, settings, executor=executor, owned=owned
+    ):
+        pass
+    return best
+
+
+def OffsetReport(config, name, settings):
+    """Return the report line of an optimized offset, in the configuration units."""
+
+    if config.get("units", "mm") == "mils":
+        ToUserUnit = pcbnew.ToMils
+    else:
+        ToUserUnit = pcbnew.ToMM
+    return "zone '%s': offset %g, %g" % (
+        name,
+        ToUserUnit(settings.offset_x),
+        ToUserUnit(settings.offset_y),
+    )
+
+
+def ConfiguredZones(board, config, report):
+    """Find the configured zones on a board, missing ones are reported.
+
+    Returns:
+        list: (name, zones, values) tuples, values are the zone settings (see ZoneValues)
+    """
+
+    jobs = []
+    for zone_config in config["zones"]:
+        zones = FindZones(board, zone_config["name"])
+        if not zones:
+            report.append("zone '%s' not found" % zone_config["name"])
+            continue
+        jobs.append((zone_config["name"], zones, ZoneValues(config, zone_config)))
+    return jobs
+
+
+def StitchBoard(filename, config, output, executor=None):
+    """Stitch the configured zones of a board and save it.
+
+    Parameters:
+        filename (str): Board file to be stitched
+        config (dict): Configuration (see LoadConfig)
+        output (str): File the stitched board is saved to
+        executor (concurrent.futures.Executor): If given zones are processed concurrently
+
+    Returns:
+        list: Report lines
+    """
+
+    board = pcbnew.LoadBoard(filename)
+    group = GetViaGroup(board)
+    report = []
+    refill = config.get("refill", False)
+    boxes = []
+
+    if config.get("clear", False):
+        if refill:
+            boxes += [box_tuple(via.GetBoundingBox()) for via in GroupVias(group)]
+        report.append("removed %d vias" % RemoveGroupVias(board, group))
+
+    jobs = ConfiguredZones(board, config, report)
+    if not jobs:
+        return report
+
+    # Obstacles are collected once and shared by all the zones
+    obstacles = SnapshotObstacles(
+        board, [zone for name, zones, values in jobs for zone in zones], group
+    )
+
+    # Zones stitched before are re-stitched (see viastitching_engine.Restitch)
+    commit = ViaCommit(board, group)
+    for name, zones, values in jobs:
+        settings = ZoneSettings(board, config, values, zones)
+        areas = [SnapshotArea(zone, settings.edge_clearance) for zone in zones]
+        netnames = [values.get("net", zone.GetNetname()) for zone in zones]
+        states = [LoadFillState(board, zone) for zone in zones]
+        zone_vias = [AreaVias(group, zone) for zone in zones]
+        owned = [ViaPositions(vias) for vias in zone_vias]
+        if values.get("optimize_offset", False):
+            settings = OptimizeOffset(areas, obstacles, settings, executor, owned)
+            report.append(OffsetReport(config, name, settings))
+        updates = RestitchAreas(areas, obstacles, settings, states, owned, executor)
+        for zone, netname, update, vias in zip(zones, netnames, updates, zone_vias):
+            netcode = board.GetNetcodeFromNetname(netname)
+            if netcode < 0:
+                report.append("net '%s' not found" % netname)
+                continue
+            inserted, removed = UpdateVias(
+                board,
+                AreaGroup(board, group, zone),
+                update,
+                settings,
+                netcode,
+                zone.GetLayerSet(),
+                vias,
+                commit,
+            )
+            SaveFillState(board, zone, update.state)
+            # The zones of the next jobs keep clear of the vias of this one
+            obstacles = ReplaceVias(
+                obstacles, netname, update.remove, update.add, settings.via_size
+            )
+            report.append(
+                "zone '%s': inserted %d vias, removed %d vias" % (name, inserted, removed)
+            )
+
+    if refill:
+        boxes += commit.Boxes()
+    commit.Push()
+    if boxes:
+        areas = [zone for name, zones, values in jobs for zone in zones]
+        report.append("refilled %d zones" % RefillZones(board, areas, boxes))
+    pcbnew.SaveBoard(output, board)
+    return report
+
+
+def PlanBoard(filename, config, output, executor=None):
+    """Compute the vias of the configured zones of a board and save them as a plan.
+
+    The board is not modified, the plan holds a fresh fill of every zone (see
+    viastitching_board.ApplyPlan).
+
+    Parameters:
+        filename (str): Board file
+        config (dict): Configuration (see LoadConfig)
+        output (str): File the plan is saved to
+        executor (concurrent.futures.Executor): If given zones are processed concurrently
+
+    Returns:
+        list: Report lines
+    """
+
+    board = pcbnew.LoadBoard(filename)
+    group = GetViaGroup(board)
+    report = []
+    jobs = ConfiguredZones(board, config, report)
+
+    obstacles = SnapshotObstacles(
+        board, [zone for name, zones, values in jobs for zone in zones], group
+    )
+
+    # Like a re-stitch, the vias of the previous fill of a zone are not in the way of its
+    # plan while any other stitching via is
+    entries = []
+    for name, zones, values in jobs:
+        settings = ZoneSettings(board, config, values, zones)
+        areas = [SnapshotArea(zone, settings.edge_clearance) for zone in zones]
+        owned = [ViaPositions(AreaVias(group, zone)) for zone in zones]
+        if values.get("optimize_offset", False):
+            settings = OptimizeOffset(areas, obstacles, settings, executor, owned)
+            report.append(OffsetReport(config, name, settings))
+        positions = PlaceAreas(areas, obstacles, settings, executor, owned)
+        planned = 0
+        for zone, zone_owned, zone_positions in zip(zones, owned, positions):
+            netname = values.get("net", zone.GetNetname())
+            if board.GetNetcodeFromNetname(netname) < 0:
+                report.append("net '%s' not found" % netname)
+                continue
+            entries.append(ZonePlan(board, zone, netname, zone_positions, settings))
+            planned += len(zone_positions)
+            # The zones of the next jobs keep clear of the planned vias
+            obstacles = ReplaceVias(
+                obstacles, netname, zone_owned, zone_positions, settings.via_size
+            )
+        report.append("zone '%s': planned %d vias" % (name, planned))
+
+    WritePlan(output, entries)
+    return report
+
+
+class Immediate:
+    """Run a call right away and expose its outcome like a concurrent.futures.Future."""
+
+    def __init__(self, function, *args):
+        self.error = None
+        self.value = None
+        try:
+            self.value = function(*args)
+        except Exception as error:
+            self.error = error
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stitch zones of KiCad boards with vias.")
+    parser.add_argument("config", help="JSON configuration file")
+    parser.add_argument("boards", nargs="+", help="board files (.kicad_pcb)")
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="save stitched boards here instead of overwriting them",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="number of boards processed in parallel (default: number of cores)",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="save a placement plan per board (.vsplan) instead of stitching it",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        config = LoadConfig(args.config)
+    except (OSError, ValueError) as error:
+        parser.error("%s: %s" % (args.config, error))
+
+    outputs = []
+    for filename in args.boards:
+        if args.output_dir:
+            outputs.append(os.path.join(args.output_dir, os.path.basename(filename)))
+        else:
+            outputs.append(filename)
+    if args.plan:
+        outputs = [os.path.splitext(output)[0] + ".vsplan" for output in outputs]
+        process = PlanBoard
+    else:
+        process = StitchBoard
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        if len(args.boards) == 1:
+            # A single board: spread its zones (or the tiles of a single zone) across the
+            # pool instead
+            futures = [Immediate(process, args.boards[0], config, outputs[0], executor)]
+        else:
+            futures = [
+                executor.submit(process, filename, config, output)
+                for filename, output in zip(args.boards, outputs)
+            ]
+        for filename, future in zip(args.boards, futures):
+            try:
+                report = future.result()
+            except Exception as error:
+                failed += 1
+                print("%s: failed: %s" % (filename, error), file=sys.stderr)
+                continue
+            for line in report:
+                print("%s: %s" % (filename, line))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,15 +7,58 @@
 import wx
 import pcbnew
 import gettext
+import json
 import math
+import os
+import threading
+import time
+import tracemalloc
+
+from contextlib import nullcontext
 
 from .viastitching_gui import viastitching_gui
-from math import sqrt
+from .viastitching_board import (
+    ApplyPlan,
+    AreaGroup,
+    AreaVias,
+    GetViaGroup,
+    GroupVias,
+    LoadFillState,
+    MatchingVias,
+    RefillZones,
+    RemoveAreaGroups,
+    SaveFillState,
+    UpdateVias,
+    ViaCommit,
+    ViaPositions,
+)
+from .viastitching_engine import (
+    FillSettings,
+    FillStats,
+    OffsetBatches,
+    PlacementEngine,
+    ReplaceVias,
+)
+from .viastitching_plan import ReadPlan
+from .viastitching_snapshot import (
+    NetClearance,
+    SnapshotArea,
+    SnapshotBatches,
+    SnapshotInset,
+    SnapshotObstacles,
+)
 
 _ = gettext.gettext
 __version__ = "0.3.0"
 __timecode__ = 1972
-__viagroupname__ = "VIA_STITCHING_GROUP"
+# Milliseconds of quiet after the last edit before the preview is recomputed
+__previewdelay__ = 300
+# Seconds of board reading per preview tick, and milliseconds between the ticks: the
+# dialog handles its events in between
+__collectslice__ = 0.05
+__collectdelay__ = 10
+# Resolution of the fill progress dialog
+__progressrange__ = 1000
 
 
 class ViaStitchingDialog(viastitching_gui):
@@ -29,21 +72,14 @@ class ViaStitchingDialog(viastitching_gui):
         self.Bind(wx.EVT_CLOSE, self.onCloseWindow)
         self.m_btnCancel.Bind(wx.EVT_BUTTON, self.onCloseWindow)
         self.m_btnOk.Bind(wx.EVT_BUTTON, self.onProcessAction)
+        self.m_btnApplyPlan.Bind(wx.EVT_BUTTON, self.onApplyPlan)
+        self.m_btnOptimize.Bind(wx.EVT_BUTTON, self.onOptimizeOffset)
         self.m_rClear.Bind(wx.EVT_RADIOBUTTON, self.onRadioButtonCheck)
         self.m_rFill.Bind(wx.EVT_RADIOBUTTON, self.onRadioButtonCheck)
         self.m_chkRemoveAll.Disable()
         self.board = pcbnew.GetBoard()
-        self.pcb_group = None
-
-        # Search through groups
-        for group in self.board.Groups():
-            if group.GetName() == __viagroupname__:
-                self.pcb_group = group
-
-        if self.pcb_group is None:
-            self.pcb_group = pcbnew.PCB_GROUP(None)
-            self.pcb_group.SetName(__viagroupname__)
-            self.board.Add(self.pcb_group)
+        self.pcb_group = GetViaGroup(self.board)
+        self.ready = False
 
         # Use the same unit set int PCBNEW
         self.ToUserUnit = None
@@ -66,7 +102,7 @@ class ViaStitchingDialog(viastitching_gui):
             self.m_lblUnit4.SetLabel(_("mm"))
         else:
             wx.MessageBox(_("Not a valid frame"))
-            self.Destroy()
+            return
 
         # Get current via dimensions
         settings = board.GetDesignSettings()
@@ -86,98 +122,155 @@ class ViaStitchingDialog(viastitching_gui):
         self.m_txtOffsetX.SetValue("%.6f" % 0)
         self.m_txtOffsetY.SetValue("%.6f" % 0)
 
-        # Set default clearances
+        # Set default clearances, tracks are kept at their netclass clearance unless a
+        # value is typed in
         self.m_txtEdgeClearance.SetValue("0")
-        self.m_txtTrackClearance.SetValue(
-            "%.6f" % self.ToUserUnit(settings.GetBiggestClearanceValue())
-        )
+        self.m_txtTrackClearance.SetValue("")
+        self.m_txtTrackClearance.SetHint(_("Netclass"))
 
         self.area = None
+        self.areas = []
         self.net = None
         self.overlappings = None
+        self.nets_populated = False
 
         # Check for selected area
         if not self.GetAreaConfig():
             wx.MessageBox(_("Please select a valid area"))
-            self.Destroy()
         else:
-            # Get overlapping items
-            self.GetOverlappingItems()
-            # Populate nets checkbox
-            self.PopulateNets()
+            # Reading the board takes a while on big boards: the dialog shows up first,
+            # obstacles are collected by the first preview (or Ok) and the net list is
+            # filled the first time it's used
+            self.m_cbNet.Append(self.net)
+            self.m_cbNet.SetSelection(0)
+            self.m_cbNet.Bind(wx.EVT_COMBOBOX_DROPDOWN, self.onNetListUsed)
+            self.m_cbNet.Bind(wx.EVT_KEY_DOWN, self.onNetListUsed)
+            self.InitPreview()
+            self.ready = True
 
     def GetOverlappingItems(self):
         """Collect overlapping items.
         Every item found inside bounding box is a candidate to be inspected for overlapping.
+        Items are read once into a geometry snapshot (see viastitching_snapshot), the
+        placement engine never goes back to pcbnew.
         """
 
-        area_bbox = self.area.GetBoundingBox()
+        start = time.perf_counter()
+        self.overlappings = SnapshotObstacles(self.board, self.areas, self.pcb_group)
+        self.overlappings_time = time.perf_counter() - start
 
-        if hasattr(self.board, "GetModules"):
-            modules = self.board.GetModules()
-        else:
-            modules = self.board.GetFootprints()
+    def GetObstacles(self):
+        """Return the obstacles around the selected areas, collected on first use."""
 
-        tracks = self.board.GetTracks()
+        if self.overlappings is None:
+            self.GetOverlappingItems()
+        return self.overlappings
 
-        self.overlappings = []
+    def GetNetName(self):
+        """Return the net typed or selected in the net widget."""
 
-        for item in tracks:
-            if type(item) in [
-                pcbnew.PCB_ARC,
-                pcbnew.PCB_TRACK,
-                pcbnew.PCB_VIA,
-            ] and item.GetBoundingBox().Intersects(area_bbox):
-                self.overlappings.append(item)
+        return self.m_cbNet.GetValue().strip()
 
-        for item in modules:
-            if item.GetBoundingBox().Intersects(area_bbox):
-                for pad in item.Pads():
-                    self.overlappings.append(pad)
+    def GetTargetAreas(self):
+        """Return the areas to be processed: the selected ones or, if requested, every
+        stitchable area on the selected net.
+        """
+
+        if not self.m_chkAllZones.IsChecked():
+            return self.areas
 
-        # TODO: change algorithm to 'If one of the candidate area's edges overlaps with target area declare candidate as overlapping'
+        netname = self.GetNetName()
+        areas = []
         for i in range(0, self.board.GetAreaCount()):
-            item = self.board.GetArea(i)
-            if item.GetBoundingBox().Intersects(area_bbox):
-                if item.GetNetname() != self.net:
-                    self.overlappings.append(item)
+            area = self.board.GetArea(i)
+            if IsStitchable(area) and area.GetNetname() == netname:
+                areas.append(area)
+        return areas
+
+    def GetAreaNets(self, areas):
+        """Return the net the vias of every area go on.
+
+        Vias go on the net of their own area, like on the command line. The net widget
+        picks another net only if all the areas are on the same one.
+
+        Returns:
+            list: Net name of every area, None if the areas are on several nets and the
+                net widget doesn't name one of them
+        """
+
+        netname = self.GetNetName()
+        nets = [area.GetNetname() for area in areas]
+        if len(set(nets)) <= 1:
+            return [netname] * len(areas)
+        if netname not in nets:
+            return None
+        return nets
+
+    def GetAreaSettings(self, areas, settings):
+        """Return the fill parameters of every area, on the net its vias go on.
+
+        Parameters:
+            settings (FillSettings): Fill parameters read from the dialog controls
+
+        Returns:
+            list: FillSettings of every area, None if the areas are on several nets (see
+                GetAreaNets)
+        """
+
+        nets = self.GetAreaNets(areas)
+        if nets is None:
+            return None
+        by_net = {settings.net: settings}
+        for netname in nets:
+            if netname not in by_net:
+                by_net[netname] = settings.Replace(
+                    net=netname, net_clearance=NetClearance(self.board, netname)
+                )
+        return [by_net[netname] for netname in nets]
 
     def GetAreaConfig(self):
-        """Check selected area (if any) and verify if it is a valid container for vias.
+        """Check selected areas (if any) and verify if they are valid containers for vias.
+        Selected areas not matching the insertion criteria are ignored.
 
         Returns:
-            bool: Returns True if an area/zone is selected and matches the insertion criteria, False otherwise.
+            bool: Returns True if at least an area/zone is selected and matches the insertion criteria, False otherwise.
         """
 
         for i in range(0, self.board.GetAreaCount()):
             area = self.board.GetArea(i)
-            if area.IsSelected():
-                if not area.IsOnCopperLayer():
-                    return False
-                elif area.GetDoNotAllowCopperPour():
-                    return False
-                self.area = area
-                self.net = area.GetNetname()
-                return True
+            if area.IsSelected() and IsStitchable(area):
+                self.areas.append(area)
 
-        return False
+        if not self.areas:
+            return False
+
+        self.area = self.areas[0]
+        self.net = self.area.GetNetname()
+        return True
 
     def PopulateNets(self):
-        """Populate nets widget."""
+        """Populate nets widget.
+        Names are set all at once (appending them one by one to a sorted list is slow on
+        boards with thousands of nets) and offered as completions while typing.
+        """
 
         nets = self.board.GetNetsByName()
+        netnames = []
 
         # Tricky loop, the iterator should return two values, unluckly I'm not able to use the
         # first value of the couple so I'm recycling it as netname.
         for netname, net in nets.items():
             netname = net.GetNetname()
             if (netname != None) and (netname != ""):
-                self.m_cbNet.Append(netname)
+                netnames.append(netname)
+        netnames.sort()
 
-        # Select the net used by area (if any)
-        if self.net != None:
-            index = self.m_cbNet.FindString(self.net)
-            self.m_cbNet.Select(index)
+        # Keep the net typed or selected so far
+        value = self.m_cbNet.GetValue()
+        self.m_cbNet.Set(netnames)
+        self.m_cbNet.ChangeValue(value)
+        self.m_cbNet.AutoComplete(netnames)
+        self.nets_populated = True
 
     def ClearArea(self):
         """Clear selected area."""
@@ -185,182 +278,681 @@ class ViaStitchingDialog(viastitching_gui):
         remove_all = self.m_chkRemoveAll.IsChecked()
         drillsize = self.FromUserUnit(float(self.m_txtViaDrillSize.GetValue()))
         viasize = self.FromUserUnit(float(self.m_txtViaSize.GetValue()))
-        netname = self.m_cbNet.GetStringSelection()
-        # commit = pcbnew.COMMIT()
-        viacount = 0
-
-        for item in self.board.GetTracks():
-            if type(item) is pcbnew.PCB_VIA:
-                # If the user selected the Undo action only signed/grouped vias are removed,
-                # otherwise are removed vias matching values set in the dialog.
-
-                # if undo and (item.GetTimeStamp() == __timecode__):
-                if (not remove_all) and (self.pcb_group is not None):
-                    group = item.GetParentGroup()
-                    if group is not None and group.GetName() == __viagroupname__:
-                        self.board.Remove(item)
-                        viacount += 1
-                        # commit.Remove(item)
-                elif (
-                    remove_all
-                    and self.area.HitTestFilledArea(
-                        self.area.GetLayer(), item.GetPosition(), 0
-                    )
-                    and (item.GetDrillValue() == drillsize)
-                    and (item.GetWidth() == viasize)
-                    and (item.GetNetname() == netname)
-                ):
-                    self.board.Remove(item)
-                    viacount += 1
-                    # commit.Remove(item)
+        areas = self.GetTargetAreas()
+        commit = ViaCommit(self.board)
+
+        # If the user selected the Undo action only grouped vias are removed, otherwise
+        # are removed vias matching values set in the dialog (on the net of their area).
+        if remove_all:
+            nets = self.GetAreaNets(areas)
+            if nets is None:
+                wx.MessageBox(
+                    _("The selected areas are on different nets, none of them is %s")
+                    % self.GetNetName()
+                )
+                return
+            vias = []
+            for netname in sorted(set(nets)):
+                net_areas = [area for area, net in zip(areas, nets) if net == netname]
+                vias += MatchingVias(self.board, net_areas, netname, viasize, drillsize)
+        else:
+            vias = GroupVias(self.pcb_group)
+
+        for via in vias:
+            commit.Remove(via)
+        boxes = commit.Boxes() if self.m_chkRefill.IsChecked() else None
+        viacount = commit.Push()[1]
+        RemoveAreaGroups(self.board, self.pcb_group)
 
         if viacount > 0:
-            wx.MessageBox(_("Removed %d vias!") % viacount)
-            # commit.Push()
+            message = _("Removed %d vias!") % viacount
+            if boxes is not None:
+                message += "\n" + self.Refill(areas, boxes)
+            wx.MessageBox(message)
             pcbnew.Refresh()
 
-    def CheckClearance(self, p1, area, clearance):
-        """Check if position specified by p1 comply with given clearance in area.
+    def GetFillSettings(self):
+        """Read fill parameters from the dialog controls.
 
-        Parameters:
-            p1 (wxPoint): Position to test
-            area (pcbnew.ZONE_CONTAINER): Area
-            clearance (int): Clearance value
+        The new vias go on the net of the net widget, see GetAreaSettings for the net of
+        each area.
 
         Returns:
-            bool: True if p1 position comply with clearance value False otherwise.
+            FillSettings: Fill parameters in board internal units
+        """
+
+        track_clearance = self.m_txtTrackClearance.GetValue().strip()
+        netname = self.GetNetName()
+        return FillSettings(
+            via_size=self.FromUserUnit(float(self.m_txtViaSize.GetValue())),
+            drill_size=self.FromUserUnit(float(self.m_txtViaDrillSize.GetValue())),
+            step_x=self.FromUserUnit(float(self.m_txtSpacingX.GetValue())),
+            step_y=self.FromUserUnit(float(self.m_txtSpacingY.GetValue())),
+            offset_x=self.FromUserUnit(float(self.m_txtOffsetX.GetValue())),
+            offset_y=self.FromUserUnit(float(self.m_txtOffsetY.GetValue())),
+            edge_clearance=self.FromUserUnit(float(self.m_txtEdgeClearance.GetValue())),
+            track_clearance=(
+                self.FromUserUnit(float(track_clearance)) if track_clearance else None
+            ),
+            pattern=self.m_cbPattern.GetStringSelection(),
+            net=netname,
+            net_clearance=NetClearance(self.board, netname),
+        )
 
+    def ComputeUpdates(self, areas, obstacles, settings, owned, stats=None):
+        """Re-stitch areas showing progress (see PlacementEngine.RestitchBatches).
+        Work is split in batches of lattice rows, the progress dialog runs the event loop
+        between them so KiCad stays responsive. Nothing is changed on the board here.
+
+        Parameters:
+            settings (list): Fill parameters of every area (see GetAreaSettings)
+            owned (list): Positions of the vias placed by the previous fill of every area
+            stats (FillStats): Record timings and rejections here, if given
+
+        Returns:
+            list: FillUpdate of every area or None if the user cancelled
         """
 
-        corners = area.GetNumCorners()
-        # Calculate minimum distance from corners
-        # TODO: remove?
-        for i in range(0, corners):
-            p2 = area.GetCornerPosition(i)
-            distance = sqrt((p2.x - p1.x) ** 2 + (p2.y - p1.y) ** 2)
+        progress = wx.ProgressDialog(
+            _("Via Stitching"),
+            _("Placing vias..."),
+            maximum=__progressrange__,
+            parent=self,
+            style=wx.PD_APP_MODAL
+            | wx.PD_CAN_ABORT
+            | wx.PD_ELAPSED_TIME
+            | wx.PD_REMAINING_TIME,
+        )
 
-            if distance < clearance:
-                return False
+        updates = []
+        try:
+            for index, area in enumerate(areas):
+                message = _("Placing vias in area %d of %d...") % (index + 1, len(areas))
+                area_settings = settings[index]
+                with Stage(stats, "snapshot"):
+                    snapshot = SnapshotArea(area, area_settings.edge_clearance)
+                    state = LoadFillState(self.board, area)
+                engine = PlacementEngine(
+                    snapshot, obstacles, area_settings, stats, owned[index]
+                )
+                for fraction, update in engine.RestitchBatches(state):
+                    value = int(__progressrange__ * (index + fraction) / len(areas))
+                    if not progress.Update(value, message)[0]:
+                        return None
+                updates.append(update)
+                # The next areas keep clear of the vias of this one
+                obstacles = ReplaceVias(
+                    obstacles,
+                    engine.net,
+                    update.remove,
+                    update.add,
+                    area_settings.via_size,
+                )
+        finally:
+            progress.Destroy()
+
+        return updates
 
-        # Calculate minimum distance from edges
-        for i in range(0, corners):
-            if i == corners - 1:
-                corner1 = area.GetCornerPosition(corners - 1)
-                corner2 = area.GetCornerPosition(0)
+    def FillupArea(self):
+        """Fills selected areas with vias.
+        Areas filled before are re-stitched: only the parts changed since the previous fill
+        are recomputed and only the vias that differ are added or removed.
+        """
+
+        settings = self.GetFillSettings()
+        netname = self.GetNetName()
+        areas = self.GetTargetAreas()
+        commit = ViaCommit(self.board, self.pcb_group)
+
+        if not areas:
+            wx.MessageBox(_("No areas found on net %s") % netname)
+            return
+
+        # Vias go on the net of their area, unless the net widget changes it for all
+        area_settings = self.GetAreaSettings(areas, settings)
+        if area_settings is None:
+            wx.MessageBox(
+                _("The selected areas are on different nets, none of them is %s")
+                % netname
+            )
+            return
+        netcodes = {}
+        for area_setting in area_settings:
+            netcode = self.board.GetNetcodeFromNetname(area_setting.net)
+            if netcode < 0:
+                wx.MessageBox(_("Net %s not found") % area_setting.net)
+                return
+            netcodes[area_setting.net] = netcode
+
+        # Instrumentation is optional: tracing memory slows the fill down noticeably
+        stats = FillStats() if self.m_chkStats.IsChecked() else None
+        tracing = stats is not None and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+
+        try:
+            # Obstacles are collected once and shared by all the areas
+            if areas is self.areas:
+                obstacles = self.GetObstacles()
+                if stats is not None:
+                    stats.AddTime("obstacles", self.overlappings_time)
             else:
-                corner1 = area.GetCornerPosition(i)
-                corner2 = area.GetCornerPosition(i + 1)
+                with Stage(stats, "obstacles"):
+                    obstacles = SnapshotObstacles(self.board, areas, self.pcb_group)
+
+            area_vias = [AreaVias(self.pcb_group, area) for area in areas]
+            owned = [ViaPositions(vias) for vias in area_vias]
+            updates = self.ComputeUpdates(areas, obstacles, area_settings, owned, stats)
+            if updates is None:
+                wx.MessageBox(_("Fill cancelled, the board was not changed."))
+                return
+
+            # Vias are created only for accepted positions and changes are applied all
+            # together
+            viacount = 0
+            removed = 0
+            with Stage(stats, "insertion"):
+                for area, area_setting, update, vias in zip(
+                    areas, area_settings, updates, area_vias
+                ):
+                    counts = UpdateVias(
+                        self.board,
+                        AreaGroup(self.board, self.pcb_group, area),
+                        update,
+                        area_setting,
+                        netcodes[area_setting.net],
+                        area.GetLayerSet(),
+                        vias,
+                        commit,
+                    )
+                    viacount += counts[0]
+                    removed += counts[1]
+                    SaveFillState(self.board, area, update.state)
+                boxes = commit.Boxes() if self.m_chkRefill.IsChecked() else None
+                commit.Push()
+
+            refilled = None
+            if boxes is not None and (viacount > 0 or removed > 0):
+                with Stage(stats, "refill"):
+                    refilled = self.Refill(areas, boxes)
+
+            if tracing:
+                stats.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            if tracing:
+                tracemalloc.stop()
+
+        if removed > 0:
+            message = _("Inserted %d vias and removed %d outdated vias in %d areas!") % (
+                viacount,
+                removed,
+                len(areas),
+            )
+        elif viacount > 0:
+            message = _("Inserted %d vias in %d areas!") % (viacount, len(areas))
+        else:
+            message = _("Stitching is up to date, no vias were inserted...")
+        if refilled is not None:
+            message += "\n" + refilled
+
+        if viacount > 0 or removed > 0:
+            pcbnew.Refresh()
+
+        if stats is not None:
+            message += "\n\n" + self.ReportStats(stats)
+        wx.MessageBox(message)
 
-            distance, _ = pnt2line(p1, corner1, corner2)
+    def ApplyPlanFile(self):
+        """Insert the vias of a placement plan chosen by the user (see viastitching_plan).
+
+        Returns:
+            bool: True if the plan was applied
+        """
 
-            if distance <= clearance:
+        filename = self.board.GetFileName()
+        with wx.FileDialog(
+            self,
+            _("Apply placement plan"),
+            defaultDir=os.path.dirname(filename) if filename else "",
+            wildcard=_("Via placement plans (*.vsplan)|*.vsplan"),
+            style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST,
+        ) as file_dialog:
+            if file_dialog.ShowModal() != wx.ID_OK:
                 return False
+            path = file_dialog.GetPath()
+
+        self.StopPreview()
+        # Everything is checked before the board is touched
+        try:
+            entries = ReadPlan(path)
+            commit = ViaCommit(self.board, self.pcb_group)
+            viacount = ApplyPlan(self.board, self.pcb_group, entries, commit)
+        except (OSError, ValueError) as error:
+            wx.MessageBox(_("Cannot apply %s: %s") % (os.path.basename(path), error))
+            return False
+        boxes = commit.Boxes() if self.m_chkRefill.IsChecked() else None
+        commit.Push()
 
+        if viacount > 0:
+            message = _("Inserted %d vias from the plan!") % viacount
+            if boxes is not None:
+                message += "\n" + self.Refill([], boxes)
+            pcbnew.Refresh()
+            wx.MessageBox(message)
+        else:
+            wx.MessageBox(_("The plan is already applied, no vias were inserted..."))
         return True
 
-    def CheckOverlap(self, via):
-        """Check if via overlaps or interfere with other items on the board.
+    def OptimizeOffset(self):
+        """Search the offset placing the most vias in the target areas and set it.
+
+        Grid and Star patterns are both tried, the pattern is changed too if the other
+        one places more vias (see OffsetBatches). Nothing is changed on the board.
+        """
+
+        try:
+            settings = self.GetFillSettings()
+        except ValueError:
+            settings = None
+        if settings is None or settings.step_x <= 0 or settings.step_y <= 0:
+            wx.MessageBox(_("Please enter valid fill settings first"))
+            return
+
+        self.StopPreview()
+        zones, areas, obstacles, owned = self.GetPreviewSources()
+        if not areas:
+            wx.MessageBox(_("No areas found on net %s") % self.GetNetName())
+            self.preview_timer.StartOnce(__previewdelay__)
+            return
+        area_settings = self.GetAreaSettings(zones, settings)
+        if area_settings is None:
+            wx.MessageBox(
+                _("The selected areas are on different nets, none of them is %s")
+                % self.GetNetName()
+            )
+            self.preview_timer.StartOnce(__previewdelay__)
+            return
+        if len(set(area_setting.net for area_setting in area_settings)) > 1:
+            # Trials share the settings: each area fills on its own net, against the
+            # largest clearance among them
+            settings = settings.Replace(
+                net="",
+                net_clearance=max(
+                    area_setting.net_clearance for area_setting in area_settings
+                ),
+            )
+        for zone, area in zip(zones, areas):
+            SnapshotInset(zone, area, settings.edge_clearance)
+        if settings.pattern in ("Grid", "Star"):
+            patterns = ["Grid", "Star"]
+        else:
+            patterns = [settings.pattern]
+
+        progress = wx.ProgressDialog(
+            _("Via Stitching"),
+            _("Trying offsets..."),
+            maximum=__progressrange__,
+            parent=self,
+            style=wx.PD_APP_MODAL
+            | wx.PD_CAN_ABORT
+            | wx.PD_ELAPSED_TIME
+            | wx.PD_REMAINING_TIME,
+        )
+        best = None
+        try:
+            trials = OffsetBatches(areas, obstacles, settings, patterns, owned=owned)
+            for fraction, best, count in trials:
+                if not progress.Update(int(__progressrange__ * fraction))[0]:
+                    best = None
+                    break
+        except ValueError:
+            wx.MessageBox(_("Only the offsets of lattice patterns can be optimized"))
+        finally:
+            progress.Destroy()
+
+        if best is not None:
+            # Setting the offsets restarts the preview
+            self.m_txtOffsetX.SetValue("%.6f" % self.ToUserUnit(best.offset_x))
+            self.m_txtOffsetY.SetValue("%.6f" % self.ToUserUnit(best.offset_y))
+            self.m_cbPattern.SetStringSelection(best.pattern)
+            wx.MessageBox(
+                _("%s pattern with offset %.6f, %.6f places %d vias")
+                % (
+                    best.pattern,
+                    self.ToUserUnit(best.offset_x),
+                    self.ToUserUnit(best.offset_y),
+                    count,
+                )
+            )
+        self.preview_timer.StartOnce(__previewdelay__)
+
+    def Refill(self, areas, boxes):
+        """Refill areas and the zones touching the changed vias (see RefillZones).
+
+        Returns:
+            str: Outcome to be shown to the user
+        """
+
+        with wx.BusyCursor():
+            count = RefillZones(self.board, areas, boxes)
+        return _("Refilled %d zones.") % count
+
+    def ReportStats(self, stats):
+        """Save fill statistics as a JSON report next to the board file.
+
+        Returns:
+            str: Statistics summary
+        """
+
+        summary = stats.Summary()
+        filename = self.board.GetFileName()
+        if filename:
+            report = os.path.splitext(filename)[0] + "-viastitching.json"
+            try:
+                with open(report, "w") as report_file:
+                    json.dump(stats.Report(), report_file, indent=2)
+                summary += "\n" + _("Report saved to %s") % report
+            except OSError as error:
+                summary += "\n" + _("Report not saved: %s") % error
+        return summary
+
+    def InitPreview(self):
+        """Set up the live preview.
+        Every change to the fill parameters (re)starts a timer, when it expires placement
+        is computed by a background thread working on the geometry snapshot. A newer run
+        makes older ones stop at their next batch of lattice rows and their outcome is
+        dropped. The snapshot itself is taken a slice at a time by the timer, in the GUI
+        thread (see CollectObstacles). The board is never touched.
+        """
+
+        self.preview = None
+        self.preview_generation = 0
+        self.preview_sources = {}
+        self.collecting = None
+        self.collecting_progress = 0
+        self.collecting_time = 0
+        self.preview_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.onPreviewTimer, self.preview_timer)
+        self.m_pnlPreview.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.m_pnlPreview.Bind(wx.EVT_PAINT, self.onPreviewPaint)
+
+        for control in (
+            self.m_txtViaSize,
+            self.m_txtViaDrillSize,
+            self.m_txtSpacingX,
+            self.m_txtSpacingY,
+            self.m_txtOffsetX,
+            self.m_txtOffsetY,
+            self.m_txtEdgeClearance,
+            self.m_txtTrackClearance,
+        ):
+            control.Bind(wx.EVT_TEXT, self.onSettingsChange)
+        self.m_cbNet.Bind(wx.EVT_TEXT, self.onSettingsChange)
+        self.m_cbPattern.Bind(wx.EVT_COMBOBOX, self.onSettingsChange)
+        self.m_chkAllZones.Bind(wx.EVT_CHECKBOX, self.onSettingsChange)
+
+        self.preview_timer.StartOnce(__previewdelay__)
+
+    def StopPreview(self):
+        """Cancel the pending and running previews."""
+
+        self.preview_timer.Stop()
+        self.preview_generation += 1
+
+    def CollectObstacles(self, key, areas, budget=None):
+        """Read the obstacles around areas a batch at a time (see SnapshotBatches).
 
         Parameters:
-            via (pcbnew.VIA): Via to be checked
+            key (tuple): Preview sources the obstacles are read for
+            areas (list): Target areas (pcbnew.ZONE)
+            budget (float): Seconds of reading allowed, no limit if None
 
         Returns:
-            bool: True if via overlaps with an item, False otherwise.
+            list: Obstacle records, None if the budget ran out first: the next call with
+            the same key goes on from there
         """
 
-        for item in self.overlappings:
-            if type(item) is pcbnew.PAD:
-                if item.GetBoundingBox().Intersects(via.GetBoundingBox()):
-                    return True
-            elif type(item) is pcbnew.PCB_ARC or type(item) is pcbnew.PCB_TRACK:
-                clearance = self.FromUserUnit(
-                    float(self.m_txtTrackClearance.GetValue())
-                )
-                track_shape = item.GetEffectiveShape()
-                via_shape = via.GetEffectiveShape()
-                if track_shape.Collide(via_shape, clearance):
-                    return True
-            elif type(item) is pcbnew.PCB_VIA:
-                # Overlapping with vias work best if checking is performed by intersection
-                if item.GetBoundingBox().Intersects(via.GetBoundingBox()):
-                    return True
-            elif type(item) is pcbnew.ZONE:
-                if item.HitTestFilledArea(self.area.GetLayer(), via.GetPosition(), 0):
-                    return True
-
-        return False
+        if self.collecting is None or self.collecting[0] != key:
+            batches = SnapshotBatches(self.board, areas, self.pcb_group)
+            self.collecting = (key, batches, [])
+            self.collecting_progress = 0
+            self.collecting_time = 0
+        key, batches, obstacles = self.collecting
+
+        start = time.perf_counter()
+        try:
+            for progress, batch in batches:
+                obstacles.extend(batch)
+                self.collecting_progress = progress
+                if budget is not None and time.perf_counter() - start > budget:
+                    return None
+        finally:
+            self.collecting_time += time.perf_counter() - start
+
+        self.collecting = None
+        if areas is self.areas:
+            # Kept for the fill too (see GetObstacles)
+            self.overlappings = obstacles
+            self.overlappings_time = self.collecting_time
+        return obstacles
+
+    def GetPreviewSources(self, budget=None):
+        """Return the target areas, their snapshots, the snapshot of the obstacles
+        around them and the positions of the stitching vias each area owns.
+        Snapshots are taken here, in the GUI thread, and cached: the preview thread never
+        calls pcbnew. Everything is empty if there are no target areas.
 
-    def FillupArea(self):
-        """Fills selected area with vias."""
-
-        via_size = self.FromUserUnit(float(self.m_txtViaSize.GetValue()))
-        drill_size = self.FromUserUnit(float(self.m_txtViaDrillSize.GetValue()))
-        step_x = self.FromUserUnit(float(self.m_txtSpacingX.GetValue()))
-        step_y = self.FromUserUnit(float(self.m_txtSpacingY.GetValue()))
-        offset_x = self.FromUserUnit(float(self.m_txtOffsetX.GetValue()))
-        offset_y = self.FromUserUnit(float(self.m_txtOffsetY.GetValue()))
-        clearance = self.FromUserUnit(float(self.m_txtEdgeClearance.GetValue()))
-        bbox = self.area.GetBoundingBox()
-        top = bbox.GetTop()
-        bottom = bbox.GetBottom()
-        right = bbox.GetRight()
-        left = bbox.GetLeft()
-        netname = self.m_cbNet.GetStringSelection()
-        netcode = self.board.GetNetcodeFromNetname(netname)
-        pattern = self.m_cbPattern.GetStringSelection()
-        offset_row = False
-        layer_set = self.area.GetLayerSet()
-        layers = list(layer_set.Seq())
-        # commit = pcbnew.COMMIT()
-
-        # Cycle through area bounding box checking and inserting vias
-        viacount = 0
-        y = top + offset_y
-        while y <= bottom:
-            x = left + offset_x
-            if pattern == "Star":
-                # Offset every second row to create star pattern
-                x += int(step_x / 2) if offset_row else 0
-                offset_row = not offset_row
-
-            while x <= right:
-                p = pcbnew.VECTOR2I(x, y)
-                if all(self.area.HitTestFilledArea(layer, p, 0) for layer in layers):
-                    via = pcbnew.PCB_VIA(self.board)
-                    via.SetPosition(p)
-                    via.SetLayerSet(layer_set)
-                    via.SetNetCode(netcode)
-                    via.SetDrill(drill_size)
-                    via.SetWidth(via_size)
-                    # via.SetTimeStamp(__timecode__)
-                    if not self.CheckOverlap(via):
-                        # Check clearance only if clearance value differs from 0 (disabled)
-                        if (clearance == 0) or self.CheckClearance(
-                            p, self.area, clearance
-                        ):
-                            self.board.Add(via)
-                            # commit.Add(via)
-                            self.pcb_group.AddItem(via)
-                            viacount += 1
-                x += step_x
-            y += step_y
+        Parameters:
+            budget (float): Seconds of board reading allowed (see CollectObstacles)
 
-        if viacount > 0:
-            wx.MessageBox(_("Inserted %d vias!") % viacount)
-            # commit.Push()
-            pcbnew.Refresh()
-        else:
-            wx.MessageBox(_("No vias were inserted..."))
+        Returns:
+            tuple: Sources, None if the board is still being read
+        """
+
+        netname = self.GetNetName()
+        key = (self.m_chkAllZones.IsChecked(), netname)
+        sources = self.preview_sources.get(key)
+        if sources is None:
+            areas = self.GetTargetAreas()
+            if not areas:
+                return [], [], [], []
+            if areas is self.areas and self.overlappings is not None:
+                obstacles = self.overlappings
+            else:
+                obstacles = self.CollectObstacles(key, areas, budget)
+                if obstacles is None:
+                    return None
+            sources = (
+                areas,
+                [SnapshotArea(area) for area in areas],
+                obstacles,
+                [ViaPositions(AreaVias(self.pcb_group, area)) for area in areas],
+            )
+            self.preview_sources[key] = sources
+        return sources
+
+    def RunPreview(self, generation, areas, obstacles, settings, owned):
+        """Compute the preview (runs in a background thread).
+
+        Parameters:
+            settings (list): Fill parameters of every area (see GetAreaSettings)
+        """
+
+        positions = []
+        for area, area_settings, area_owned in zip(areas, settings, owned):
+            engine = PlacementEngine(area, obstacles, area_settings, owned=area_owned)
+            placed = []
+            for progress, batch in engine.PlaceBatches():
+                if generation != self.preview_generation:
+                    return
+                placed.extend(batch)
+            positions.extend(placed)
+            obstacles = ReplaceVias(
+                obstacles, engine.net, area_owned, placed, area_settings.via_size
+            )
+
+        if generation == self.preview_generation:
+            wx.CallAfter(self.ShowPreview, generation, areas, positions, settings[0])
+
+    def ShowPreview(self, generation, areas, positions, settings):
+        """Show the outcome of a preview run, unless a newer one was started."""
+
+        if generation != self.preview_generation:
+            return
+
+        self.preview = (areas, positions, settings)
+        self.m_lblPreview.SetLabel(_("Preview: %d vias") % len(positions))
+        self.Layout()
+        self.m_pnlPreview.Refresh()
+
+    def onSettingsChange(self, event):
+        """Manage fill parameters change events: restart the preview timer."""
+
+        self.StopPreview()
+        self.m_lblPreview.SetLabel(_("Preview: updating..."))
+        self.Layout()
+        self.preview_timer.StartOnce(__previewdelay__)
+        event.Skip()
+
+    def onPreviewTimer(self, event):
+        """Start a preview run with the current fill parameters."""
+
+        try:
+            settings = self.GetFillSettings()
+        except ValueError:
+            settings = None
+        if settings is None or settings.step_x <= 0 or settings.step_y <= 0:
+            self.m_lblPreview.SetLabel(_("Preview: invalid value"))
+            self.Layout()
+            return
+
+        sources = self.GetPreviewSources(__collectslice__)
+        if sources is None:
+            # The board is read a slice at a time: the dialog keeps answering and an edit
+            # only postpones the next slice
+            self.m_lblPreview.SetLabel(
+                _("Preview: reading the board (%d%%)")
+                % int(100 * self.collecting_progress)
+            )
+            self.Layout()
+            self.preview_timer.StartOnce(__collectdelay__)
+            return
+        zones, areas, obstacles, owned = sources
+        if not areas:
+            self.preview = None
+            self.m_lblPreview.SetLabel(_("Preview: no areas"))
+            self.Layout()
+            self.m_pnlPreview.Refresh()
+            return
+        area_settings = self.GetAreaSettings(zones, settings)
+        if area_settings is None:
+            self.preview = None
+            self.m_lblPreview.SetLabel(_("Preview: areas on different nets"))
+            self.Layout()
+            self.m_pnlPreview.Refresh()
+            return
+        # Outlines shrunk by the edge clearance are cached in the snapshots too
+        for zone, area in zip(zones, areas):
+            SnapshotInset(zone, area, settings.edge_clearance)
+        self.preview_generation += 1
+        worker = threading.Thread(
+            target=self.RunPreview,
+            args=(self.preview_generation, areas, obstacles, area_settings, owned),
+        )
+        worker.daemon = True
+        worker.start()
+
+    def onPreviewPaint(self, event):
+        """Draw the filled areas, where the edge clearance allows vias and the predicted
+        vias.
+        """
+
+        dc = wx.AutoBufferedPaintDC(self.m_pnlPreview)
+        dc.SetBackground(wx.Brush(self.m_pnlPreview.GetBackgroundColour()))
+        dc.Clear()
+        if self.preview is None:
+            return
+
+        areas, positions, settings = self.preview
+        if not areas:
+            return
+
+        width, height = self.m_pnlPreview.GetClientSize()
+        margin = 4
+        left = min(area.bbox[0] for area in areas)
+        top = min(area.bbox[1] for area in areas)
+        right = max(area.bbox[2] for area in areas)
+        bottom = max(area.bbox[3] for area in areas)
+        scale = min(
+            (width - 2 * margin) / max(1, right - left),
+            (height - 2 * margin) / max(1, bottom - top),
+        )
+
+        def to_panel(x, y):
+            return (int(margin + (x - left) * scale), int(margin + (y - top) * scale))
+
+        gc = wx.GraphicsContext.Create(dc)
+
+        def to_path(contours):
+            path = gc.CreatePath()
+            for contour in contours:
+                if contour:
+                    path.MoveToPoint(*to_panel(*contour[0]))
+                    for point in contour[1:]:
+                        path.AddLineToPoint(*to_panel(*point))
+                    path.CloseSubpath()
+            return path
+
+        gc.SetPen(wx.TRANSPARENT_PEN)
+        gc.SetBrush(wx.Brush(wx.Colour(200, 60, 60, 96)))
+        for area in areas:
+            copper = area.copper
+            if copper is None:
+                copper = area.filled.get(area.layer, [])
+            gc.FillPath(to_path(copper), wx.ODDEVEN_RULE)
+
+        # Edge clearance: vias are allowed inside the dashed outline
+        gc.SetPen(wx.Pen(wx.Colour(200, 60, 60), 1, wx.PENSTYLE_SHORT_DASH))
+        for area in areas:
+            gc.StrokePath(to_path(area.insets.get(settings.edge_clearance, [])))
+        del gc
+
+        # Many vias end up on the same pixel when the preview is zoomed out
+        size = max(1, int(settings.via_size * scale))
+        half = size // 2
+        pixels = set(to_panel(x, y) for x, y in positions)
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        dc.SetBrush(wx.Brush(wx.Colour(40, 40, 40)))
+        dc.DrawRectangleList([(x - half, y - half, size, size) for x, y in pixels])
+
+    def onNetListUsed(self, event):
+        """Fill the net list the first time it's opened or typed in."""
+
+        if not self.nets_populated:
+            self.PopulateNets()
+        event.Skip()
 
     def onProcessAction(self, event):
         """Manage main button (Ok) click event."""
 
+        self.StopPreview()
         if self.m_rFill.GetValue():
             self.FillupArea()
         else:
             self.ClearArea()
 
-        self.Destroy()
+        self.EndModal(wx.ID_OK)
+
+    def onApplyPlan(self, event):
+        """Manage Apply plan button click event."""
+
+        if self.ApplyPlanFile():
+            self.EndModal(wx.ID_OK)
+
+    def onOptimizeOffset(self, event):
+        """Manage Optimize offset button click event."""
+
+        self.OptimizeOffset()
 
     def onRadioButtonCheck(self, event):
         """Manage radio button state change event."""
@@ -373,84 +965,40 @@ class ViaStitchingDialog(viastitching_gui):
     def onCloseWindow(self, event):
         """Manage Close button click event."""
 
-        self.Destroy()
+        if self.ready:
+            self.StopPreview()
+        self.EndModal(wx.ID_CANCEL)
+
+
+def Stage(stats, stage):
+    """Return a context timing stage in stats, if given (see FillStats.Time)."""
+
+    if stats is None:
+        return nullcontext()
+    return stats.Time(stage)
+
+
+def IsStitchable(area):
+    """Check if area is a valid container for vias.
+
+    Parameters:
+        area (pcbnew.ZONE): Area
+
+    Returns:
+        bool: True if the area is a copper pour, False otherwise.
+    """
+
+    return area.IsOnCopperLayer() and not area.GetDoNotAllowCopperPour()
 
 
 def InitViaStitchingDialog(board):
     """Initialize dialog."""
 
     dlg = ViaStitchingDialog(board)
-    dlg.Show(True)
-    return dlg
-
 
-class aVector:
-    def __init__(self, point: pcbnew.wxPoint | list):
-        if isinstance(point, pcbnew.wxPoint):
-            self.x = float(point.x)
-            self.y = float(point.y)
-        elif isinstance(point, list):
-            self.x = point[0]
-            self.y = point[1]
-
-    def __sub__(self, other: pcbnew.wxPoint):
-        return aVector([self.x - float(other.x), self.y - float(other.y)])
-
-    def __mul__(self, other):
-        return aVector([self.x * float(other), self.y * float(other)])
-
-    def __add__(self, other):
-        return aVector([self.x + float(other.x), self.y + float(other.y)])
-
-    def __truediv__(self, other):
-        return aVector([self.x / other, self.y / other])
-
-    @staticmethod
-    def norm(vector):
-        return sqrt(pow(vector.x, 2) + pow(vector.y, 2))
-
-    @staticmethod
-    def dot(vector1, vector2):
-        return vector1.x * vector2.x + vector1.y * vector2.y
-
-
-# Given a line with coordinates 'start' and 'end' and the
-# coordinates of a point 'point' the proc returns the shortest
-# distance from pnt to the line and the coordinates of the
-# nearest point on the line.
-#
-# 1  Convert the line segment to a vector ('line_vec').
-# 2  Create a vector connecting start to pnt ('pnt_vec').
-# 3  Find the length of the line vector ('line_len').
-# 4  Convert line_vec to a unit vector ('line_unitvec').
-# 5  Scale pnt_vec by line_len ('pnt_vec_scaled').
-# 6  Get the dot product of line_unitvec and pnt_vec_scaled ('t').
-# 7  Ensure t is in the range 0 to 1.
-# 8  Use t to get the nearest location on the line to the end
-#    of vector pnt_vec_scaled ('nearest').
-# 9  Calculate the distance from nearest to pnt_vec_scaled.
-# 10 Translate nearest back to the start/end line.
-# Malcolm Kesson 16 Dec 2012
-def pnt2line(point: pcbnew.wxPoint, start: pcbnew.wxPoint, end: pcbnew.wxPoint):
-    pnt = vector([point.x, point.y])
-    strt = vector([start.x, start.y])
-    nd = vector([end.x, end.y])
-    line_vec = nd - strt
-    pnt_vec = pnt - strt
-    line_len = norm(line_vec)
-    line_unitvec = line_vec / line_len
-    pnt_vec_scaled = pnt_vec / line_len
-    t = dot(line_unitvec, pnt_vec_scaled)
-    if t < 0.0:
-        t = 0.0
-    elif t > 1.0:
-        t = 1.0
-    nearest = line_vec * t
-    dist = norm(pnt_vec - nearest)
-    nearest = nearest + strt
-    return dist, nearest
-
-
-norm = aVector.norm
-vector = aVector
-dot = aVector.dot
+    # The dialog is modal so that every board change happens inside ActionPlugin.Run:
+    # pcbnew records them as a single undo step
+    if dlg.ready:
+        dlg.ShowModal()
+    dlg.Destroy()
+    return dlg
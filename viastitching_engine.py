@@ -0,0 +1,1650 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# This is the via placement engine, it works on a geometry snapshot of the board
+# (see viastitching_snapshot) so it doesn't depend on pcbnew nor wx
+# (c) Michele Santucci 2019
+#
+
+import hashlib
+import os
+import pickle
+import time
+
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+from math import ceil, hypot
+from multiprocessing import shared_memory
+
+from contextlib import contextmanager, nullcontext
+
+try:
+    from .viastitching_geometry import (
+        MASK_BOUNDARY,
+        MASK_FREE,
+        OccupancyMask,
+        PolygonHitTester,
+        SegmentSet,
+        SpatialIndex,
+        arc_distance,
+        grid_cell_size,
+        rect_segment_distance,
+        segment_distance,
+    )
+    from .viastitching_patterns import GetPattern
+except ImportError:
+    # Loaded outside the plugin package (command line, benchmarks)
+    from viastitching_geometry import (
+        MASK_BOUNDARY,
+        MASK_FREE,
+        OccupancyMask,
+        PolygonHitTester,
+        SegmentSet,
+        SpatialIndex,
+        arc_distance,
+        grid_cell_size,
+        rect_segment_distance,
+        segment_distance,
+    )
+    from viastitching_patterns import GetPattern
+
+PAD = "pad"
+TRACK = "track"
+ARC = "arc"
+VIA = "via"
+STITCH = "stitch"
+ZONE = "zone"
+KEEPOUT = "keepout"
+
+# OccupancyMask values of the region obstacles
+REGION_VALUES = {ZONE: 1, KEEPOUT: 2}
+REGION_KINDS = {value: kind for kind, value in REGION_VALUES.items()}
+
+# Side of the re-stitching tiles, in lattice steps
+TILE_STEPS = 16
+
+# Lattice rows processed at once by PlacementEngine.PlaceBatches
+BATCH_ROWS = 16
+
+# Side of the blocks first tested as a whole by PlacementEngine.SortBlocks, in lattice
+# steps, number of points below which a block is no longer split and least number of
+# points per obstacle around for a block to be worth splitting
+BLOCK_STEPS = 16
+BLOCK_POINTS = 4
+BLOCK_DENSITY = 16
+
+# Tasks per worker process of PlacementEngine.ParallelBatches, more than one balances
+# tiles costing differently
+TASKS_PER_WORKER = 4
+
+# Offsets tried by OffsetBatches along each lattice pitch
+PHASE_STEPS = 4
+
+
+class AreaSnapshot:
+    """Geometry of the area to be filled."""
+
+    __slots__ = (
+        "netname",
+        "layer",
+        "layers",
+        "bbox",
+        "corners",
+        "filled",
+        "insets",
+        "copper",
+        "outline",
+    )
+
+    def __init__(
+        self,
+        netname,
+        layer,
+        layers,
+        bbox,
+        corners,
+        filled,
+        insets=None,
+        copper=None,
+        outline=None,
+    ):
+        """Initialize the record.
+
+        Parameters:
+            netname (str): Net of the area
+            layer (int): Main layer of the area
+            layers (list): Copper layers of the area
+            bbox (tuple): Bounding box as (left, top, right, bottom)
+            corners (list): Outline corners as (x, y) tuples, in the area corner order
+            filled (dict): Filled polygons contours (see poly_set_contours) by layer
+            insets (dict): Outline contours shrunk by the edge clearance, by clearance
+            copper (list): Contours of the filled polygons intersected across all layers,
+                None if not available (filled is tested layer by layer then)
+            outline (list): Outline contours, one per outline and per hole, None if not
+                available (corners are used then)
+        """
+
+        self.netname = netname
+        self.layer = layer
+        self.layers = layers
+        self.bbox = bbox
+        self.corners = corners
+        self.filled = filled
+        self.insets = insets if insets is not None else {}
+        self.copper = copper
+        self.outline = outline
+
+
+class Obstacle:
+    """A board item that may collide with a new via.
+
+    The shape depends on kind:
+        PAD, VIA: None (the bounding box is used)
+        STITCH: (x, y, half size)
+        TRACK: (x1, y1, x2, y2, half width)
+        ARC: arc tuple (see arc_from_points) plus half width
+        ZONE: filled polygons contours by layer
+        KEEPOUT: outline contours of a rule area forbidding vias (on any layer)
+
+    STITCH obstacles are vias of the stitching group: the ones placed by the previous fill
+    of an area are left out when filling it again (a re-stitch replaces them, see
+    viastitching_board.AreaVias), any other one is in the way like a plain via.
+
+    Tracks and arcs carry the clearance of their net, resolved from the board rules when
+    obstacles are collected (see FillSettings.track_clearance).
+    """
+
+    __slots__ = ("kind", "bbox", "shape", "netname", "clearance")
+
+    def __init__(self, kind, bbox, shape=None, netname="", clearance=0):
+        self.kind = kind
+        self.bbox = bbox
+        self.shape = shape
+        self.netname = netname
+        self.clearance = clearance
+
+
+class FillSettings:
+    """Fill parameters, all lengths in board internal units.
+
+    The clearance from tracks and arcs is track_clearance if given. If it's None, it's
+    the larger of the clearance of the track net and net_clearance, the clearance of the
+    net of the new vias: the same pair rule the DRC applies with netclasses.
+    """
+
+    __slots__ = (
+        "via_size",
+        "drill_size",
+        "step_x",
+        "step_y",
+        "offset_x",
+        "offset_y",
+        "edge_clearance",
+        "track_clearance",
+        "pattern",
+        "net",
+        "net_clearance",
+    )
+
+    def __init__(
+        self,
+        via_size,
+        drill_size,
+        step_x,
+        step_y,
+        offset_x=0,
+        offset_y=0,
+        edge_clearance=0,
+        track_clearance=0,
+        pattern="Grid",
+        net="",
+        net_clearance=0,
+    ):
+        self.via_size = via_size
+        self.drill_size = drill_size
+        self.step_x = step_x
+        self.step_y = step_y
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.edge_clearance = edge_clearance
+        self.track_clearance = track_clearance
+        self.pattern = pattern
+        # Net of the new vias, the area net if empty
+        self.net = net
+        self.net_clearance = net_clearance
+
+    def Replace(self, **changes):
+        """Return a copy of the settings with some values changed."""
+
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return FillSettings(**values)
+
+
+class FillStats:
+    """Optional instrumentation of a fill: wall time per stage, rejected candidates by
+    reason and by obstacle kind, peak memory (filled in by the caller, if traced).
+    """
+
+    __slots__ = ("times", "candidates", "accepted", "rejected", "overlaps", "peak_memory")
+
+    def __init__(self):
+        self.times = {}
+        self.candidates = 0
+        self.accepted = 0
+        self.rejected = {}
+        self.overlaps = {}
+        self.peak_memory = None
+
+    @contextmanager
+    def Time(self, stage):
+        """Add the time spent in the with block to stage."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.AddTime(stage, time.perf_counter() - start)
+
+    def AddTime(self, stage, seconds):
+        """Add seconds to the time spent in stage."""
+
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    def Reject(self, reason, count=1):
+        """Count candidates rejected for reason."""
+
+        if count:
+            self.rejected[reason] = self.rejected.get(reason, 0) + count
+
+    def Overlap(self, kind):
+        """Count a candidate rejected because it overlaps an obstacle of kind."""
+
+        self.overlaps[kind] = self.overlaps.get(kind, 0) + 1
+        self.Reject("overlap")
+
+    def Report(self):
+        """Return the statistics as a JSON serializable dict."""
+
+        return {
+            "times": dict(self.times),
+            "candidates": self.candidates,
+            "accepted": self.accepted,
+            "rejected": dict(self.rejected),
+            "overlaps": dict(self.overlaps),
+            "peak_memory": self.peak_memory,
+        }
+
+    def Summary(self):
+        """Return the statistics as human readable text."""
+
+        lines = ["Candidates: %d, accepted: %d" % (self.candidates, self.accepted)]
+        for reason, count in sorted(self.rejected.items()):
+            lines.append("Rejected (%s): %d" % (reason, count))
+        for kind, count in sorted(self.overlaps.items()):
+            lines.append("  %s: %d" % (kind, count))
+        for stage, seconds in sorted(self.times.items(), key=lambda item: -item[1]):
+            lines.append("Time (%s): %.3f s" % (stage, seconds))
+        if self.peak_memory is not None:
+            lines.append("Peak memory: %.1f MiB" % (self.peak_memory / 1048576))
+        return "\n".join(lines)
+
+
+class FillUpdate:
+    """Outcome of a re-stitch (see PlacementEngine.Restitch)."""
+
+    __slots__ = ("add", "remove", "dirty", "state")
+
+    def __init__(self, add, remove, dirty, state):
+        """Initialize the record.
+
+        Parameters:
+            add (list): Positions of the vias to be inserted
+            remove (list): Positions of the vias to be removed
+            dirty (set): Recomputed tiles, None if the whole area was recomputed
+            state (dict): Fill state to be stored for the next re-stitch
+        """
+
+        self.add = add
+        self.remove = remove
+        self.dirty = dirty
+        self.state = state
+
+
+class PlacementEngine:
+    """Compute via positions for an area given the obstacles around it."""
+
+    def __init__(self, area, obstacles, settings, stats=None, owned=()):
+        """Prepare the lookup structures.
+
+        Parameters:
+            area (AreaSnapshot): Area to be filled
+            obstacles (list): List of Obstacle records
+            settings (FillSettings): Fill parameters
+            stats (FillStats): Record timings and rejections here, if given
+            owned (list): Positions of the stitching vias placed by the previous fill of
+                the area (see viastitching_board.AreaVias)
+        """
+
+        self.area = area
+        self.obstacles = obstacles
+        self.settings = settings
+        self.stats = stats
+        self.net = settings.net or area.netname
+        self.owned = list(owned)
+
+        # Zones and keepouts are looked up in a raster first (see Mask), they are indexed
+        # apart for the exact test on its boundary pixels. The stitching vias owned by the
+        # area are going to be replaced: they are left out (one per owned position).
+        with self.Stage("index"):
+            left, top, right, bottom = area.bbox
+            self.index = SpatialIndex(
+                grid_cell_size(right - left, bottom - top, len(obstacles))
+            )
+            self.regions = []
+            self.exempt = set()
+            pending = Counter(self.owned)
+            for obstacle in obstacles:
+                if obstacle.kind == KEEPOUT or (
+                    obstacle.kind == ZONE and obstacle.netname != area.netname
+                ):
+                    self.regions.append(obstacle)
+                elif obstacle.kind == STITCH:
+                    position = obstacle.shape[:2]
+                    if pending[position] > 0:
+                        pending[position] -= 1
+                        self.exempt.add(id(obstacle))
+                    else:
+                        self.index.Insert(obstacle, *obstacle.bbox)
+                elif obstacle.kind != ZONE:
+                    self.index.Insert(obstacle, *obstacle.bbox)
+            self.region_index = SpatialIndex(
+                grid_cell_size(right - left, bottom - top, len(self.regions))
+            )
+            for obstacle in self.regions:
+                self.region_index.Insert(obstacle, *obstacle.bbox)
+
+            # Clearance from tracks and arcs: a single value, or one per track net (see
+            # FillSettings) never below the one of the via net
+            if settings.track_clearance is None:
+                self.clearance = settings.net_clearance
+                self.net_clearances = True
+                self.max_clearance = max(
+                    [self.clearance]
+                    + [
+                        obstacle.clearance
+                        for obstacle in obstacles
+                        if obstacle.kind == TRACK or obstacle.kind == ARC
+                    ]
+                )
+            else:
+                self.clearance = settings.track_clearance
+                self.net_clearances = False
+                self.max_clearance = self.clearance
+
+        self.fill_testers = {}
+        self.zone_testers = {}
+        self.edges = None
+        self.inset_tester = None
+        self.inset_edges = None
+        self.block_counts = None
+        self.mask = None
+        self.keepout_edges = {}
+        self.lattice_classes = {}
+        self.pattern = GetPattern(settings.pattern)(self)
+
+    def Rebind(self, settings):
+        """Switch to other offsets or another lattice pattern.
+
+        The lookup structures built so far are kept: they depend on the area, the
+        obstacles, via size, spacing and clearances only, which settings must not change.
+        """
+
+        self.settings = settings
+        self.pattern = GetPattern(settings.pattern)(self)
+
+    def Clearance(self, item):
+        """Return the clearance between a new via and a track or an arc."""
+
+        if self.net_clearances and item.clearance > self.clearance:
+            return item.clearance
+        return self.clearance
+
+    def Stage(self, stage):
+        """Return a context timing stage if instrumentation is enabled."""
+
+        if self.stats is None:
+            return nullcontext()
+        return self.stats.Time(stage)
+
+    def CandidateBatches(self, rows=BATCH_ROWS, tiles=None):
+        """Generate the candidate positions inside the filled area (see Pattern.Batches)."""
+
+        return self.pattern.Batches(rows, tiles)
+
+    def Lattice(self):
+        """Return the lattice origin and pitch (see on_lattice), None if not a lattice."""
+
+        return self.pattern.Lattice()
+
+    def FillTester(self, layer):
+        """Return the (cached) hit tester of the area filling on layer."""
+
+        tester = self.fill_testers.get(layer)
+        if tester is None:
+            tester = PolygonHitTester(self.area.filled.get(layer, []))
+            self.fill_testers[layer] = tester
+        return tester
+
+    def CopperTesters(self):
+        """Return the hit testers a candidate must be inside of, all of them.
+
+        A single tester of the filling merged across layers if the snapshot has it (see
+        AreaSnapshot.copper), one per layer otherwise.
+        """
+
+        if self.area.copper is None:
+            return [self.FillTester(layer) for layer in self.area.layers]
+        tester = self.fill_testers.get(None)
+        if tester is None:
+            tester = PolygonHitTester(self.area.copper)
+            self.fill_testers[None] = tester
+        return [tester]
+
+    def ZoneTester(self, item):
+        """Return the (cached) hit tester of a zone obstacle on the area layer."""
+
+        tester = self.zone_testers.get(id(item))
+        if tester is None:
+            tester = PolygonHitTester(item.shape.get(self.area.layer, []))
+            self.zone_testers[id(item)] = tester
+        return tester
+
+    def InZone(self, points):
+        """Keep the points lying inside the filled area on every layer."""
+
+        for tester in self.CopperTesters():
+            points = [
+                point for point, inside in zip(points, tester.Contains(points)) if inside
+            ]
+        return points
+
+    def Mask(self):
+        """Return the (cached) raster of the zones and keepouts around the area.
+
+        Pixels are half a via wide, keepouts are grown by the via radius (a via must not
+        touch them) while zones block the via center only. Rasterizing takes about a step
+        per edge and per pixel row, testing a candidate exactly a step per candidate: small
+        regions holding few candidates are only marked as boundary.
+        """
+
+        if self.mask is None:
+            with self.Stage("mask"):
+                settings = self.settings
+                radius = settings.via_size / 2
+                mask = OccupancyMask(self.area.bbox, radius)
+                for item in self.regions:
+                    if item.kind == ZONE:
+                        contours = item.shape.get(self.area.layer, [])
+                        margin = 0
+                    else:
+                        contours = item.shape
+                        margin = radius
+                    left, top, right, bottom = item.bbox
+                    candidates = (right - left) * (bottom - top) / (settings.step_x * settings.step_y)
+                    steps = sum(len(contour) for contour in contours)
+                    steps += 2 * (bottom - top + 2 * margin) / mask.pixel
+                    if candidates > steps:
+                        mask.AddRegion(
+                            contours,
+                            REGION_VALUES[item.kind],
+                            margin,
+                            self.RegionTester(item),
+                        )
+                    else:
+                        mask.AddBox(left, top, right, bottom, margin)
+                self.mask = mask
+        return self.mask
+
+    def RegionTester(self, item):
+        """Return the (cached) hit tester of a zone or keepout obstacle."""
+
+        if item.kind == ZONE:
+            return self.ZoneTester(item)
+
+        tester = self.zone_testers.get(id(item))
+        if tester is None:
+            tester = PolygonHitTester(item.shape)
+            self.zone_testers[id(item)] = tester
+        return tester
+
+    def KeepoutHit(self, item, x, y):
+        """Check if a via placed in (x, y) touches a keepout."""
+
+        if self.RegionTester(item).Contains([(x, y)])[0]:
+            return True
+
+        edges = self.keepout_edges.get(id(item))
+        if edges is None:
+            edges = SegmentSet(
+                (contour[k - 1], contour[k])
+                for contour in item.shape
+                for k in range(len(contour))
+            )
+            self.keepout_edges[id(item)] = edges
+        radius = self.settings.via_size / 2
+        return edges.MinDistances([(x, y)], limit=radius)[0] < radius
+
+    def CheckClearance(self, points):
+        """Check if positions comply with the edge clearance.
+
+        If the snapshot holds the outline shrunk by the edge clearance this is a batched
+        point in polygon test, otherwise distances from the outline edges are measured.
+
+        Parameters:
+            points (list): Positions to test as (x, y) tuples
+
+        Returns:
+            list: One bool per point, True if the position comply with clearance value False otherwise.
+        """
+
+        edges, margin, tester = self.ClearanceEdges()
+        if tester is not None:
+            return tester.Contains(points)
+        return edges.Clear(points, margin)
+
+    def ClearanceEdges(self):
+        """Return the (cached) edges the edge clearance is checked against.
+
+        Returns:
+            tuple: (SegmentSet, margin, tester) the edges of the outline shrunk by the
+                clearance, 0 and its hit tester if the snapshot holds it, otherwise the
+                outline edges, the clearance and None
+        """
+
+        inset = self.area.insets.get(self.settings.edge_clearance)
+        if inset is not None:
+            if self.inset_tester is None:
+                self.inset_tester = PolygonHitTester(inset)
+                self.inset_edges = SegmentSet(
+                    (contour[k - 1], contour[k])
+                    for contour in inset
+                    for k in range(len(contour))
+                )
+            return self.inset_edges, 0, self.inset_tester
+
+        if self.edges is None:
+            # Distance from corners is implied by the distance from edges (corners are
+            # edges endpoints) so a single pass over the edges is enough
+            self.edges = SegmentSet.Closed(self.area.corners)
+        return self.edges, self.settings.edge_clearance, None
+
+    def BlockSize(self):
+        """Return the size of the blocks of SortBlocks as (width, height)."""
+
+        return (self.settings.step_x * BLOCK_STEPS, self.settings.step_y * BLOCK_STEPS)
+
+    def BlockCounts(self):
+        """Return the (cached) number of obstacles in every block of SortBlocks.
+
+        Obstacles are counted in the block of their bounding box center: it's only a
+        hint of how crowded a block is.
+
+        Returns:
+            dict: Number of obstacles by block (column, row)
+        """
+
+        if self.block_counts is None:
+            width, height = self.BlockSize()
+            counts = {}
+            for item in self.obstacles:
+                if item.kind in (ZONE, KEEPOUT) or id(item) in self.exempt:
+                    continue
+                left, top, right, bottom = item.bbox
+                key = ((left + right) // 2 // width, (top + bottom) // 2 // height)
+                counts[key] = counts.get(key, 0) + 1
+            self.block_counts = counts
+        return self.block_counts
+
+    def SortBlocks(self, points):
+        """Sort candidates out a block at a time, coarse to fine.
+
+        Blocks of BLOCK_STEPS lattice steps collect the obstacles and outline edges which
+        may get in the way of a via inside them. A block with none has all its points
+        accepted at once, a block with no edge lying out of the outline shrunk by the
+        edge clearance has them all rejected. Other blocks are split in four, each
+        quarter keeping what's left around it, until they hold a few points or get
+        crowded: those points are left to the point by point checks. Open copper is
+        accepted in bulk, so the cost follows obstacles and edges rather than the area.
+
+        Zones and keepouts don't fail a block: they are big, so they would fail most of
+        them, while their raster (see Mask) is cheap to look up. Accepted points with one
+        of them around still have to be checked against it (see RegionOverlapping).
+
+        Parameters:
+            points (list): Positions to test as (x, y) tuples
+
+        Returns:
+            tuple: (accepted, regional, rejected, pending) lists of indices into points,
+                regional ones are accepted but for zones and keepouts, rejected ones fail
+                the edge clearance
+        """
+
+        settings = self.settings
+        radius = settings.via_size / 2
+        margin = radius + self.max_clearance
+        edges = tester = None
+        edge_margin = 0
+        if settings.edge_clearance != 0:
+            edges, edge_margin, tester = self.ClearanceEdges()
+
+        def near_items(items, left, top, right, bottom):
+            # Same tests of Overlapping, against the closest point of the block
+            kept = []
+            for item in items:
+                l, t, r, b = item.bbox
+                if (
+                    l > right + margin
+                    or r < left - margin
+                    or t > bottom + margin
+                    or b < top - margin
+                ):
+                    continue
+                kind = item.kind
+                if kind == TRACK:
+                    x1, y1, x2, y2, half_width = item.shape
+                    distance = rect_segment_distance(
+                        left, top, right, bottom, x1, y1, x2, y2
+                    )
+                    if distance >= half_width + radius + self.Clearance(item):
+                        continue
+                elif kind != ARC and (
+                    l > right + radius
+                    or r < left - radius
+                    or t > bottom + radius
+                    or b < top - radius
+                ):
+                    continue
+                kept.append(item)
+            return kept
+
+        def near_edges(segments, left, top, right, bottom):
+            return [
+                segment
+                for segment in segments
+                if rect_segment_distance(left, top, right, bottom, *segment)
+                <= edge_margin
+            ]
+
+        def near_regions(items, left, top, right, bottom):
+            return [
+                item
+                for item in items
+                if item.bbox[0] <= right + radius
+                and item.bbox[2] >= left - radius
+                and item.bbox[1] <= bottom + radius
+                and item.bbox[3] >= top - radius
+            ]
+
+        def bounds(block):
+            xs = [points[n][0] for n in block]
+            ys = [points[n][1] for n in block]
+            return min(xs), min(ys), max(xs), max(ys)
+
+        width, height = self.BlockSize()
+        counts = self.BlockCounts()
+        blocks = {}
+        for n, (x, y) in enumerate(points):
+            blocks.setdefault((x // width, y // height), []).append(n)
+
+        accepted = []
+        regional = []
+        rejected = []
+        pending = []
+        stack = []
+        for key, block in blocks.items():
+            if counts.get(key, 0) * BLOCK_DENSITY > len(block):
+                # Crowded, not worth any test
+                pending.extend(block)
+                continue
+            left, top, right, bottom = bounds(block)
+            items = self.index.Query(
+                left - margin, top - margin, right + margin, bottom + margin
+            )
+            segments = []
+            if edges is not None:
+                segments = edges.index.Query(
+                    left - edge_margin,
+                    top - edge_margin,
+                    right + edge_margin,
+                    bottom + edge_margin,
+                )
+            regions = []
+            if self.regions:
+                regions = self.region_index.Query(
+                    left - radius, top - radius, right + radius, bottom + radius
+                )
+            stack.append((block, left, top, right, bottom, items, segments, regions))
+
+        if stack:
+            xs = [x for x, y in points]
+            ys = [y for x, y in points]
+        while stack:
+            block, left, top, right, bottom, items, segments, regions = stack.pop()
+            items = near_items(items, left, top, right, bottom)
+            segments = near_edges(segments, left, top, right, bottom)
+            if not segments:
+                # No edge across the block: it's all in or all out of the shrunk outline
+                if tester is not None and not tester.Contains([points[block[0]]])[0]:
+                    rejected.extend(block)
+                    continue
+                if not items:
+                    if near_regions(regions, left, top, right, bottom):
+                        regional.extend(block)
+                    else:
+                        accepted.extend(block)
+                    continue
+            if (
+                len(block) <= BLOCK_POINTS
+                or (len(items) + len(segments)) * BLOCK_DENSITY > len(block)
+            ):
+                pending.extend(block)
+                continue
+
+            cx = (left + right) // 2
+            cy = (top + bottom) // 2
+            upper = [n for n in block if ys[n] <= cy]
+            lower = [n for n in block if ys[n] > cy]
+            for half, t, b in ((upper, top, cy), (lower, cy + 1, bottom)):
+                for quarter, l, r in (
+                    ([n for n in half if xs[n] <= cx], left, cx),
+                    ([n for n in half if xs[n] > cx], cx + 1, right),
+                ):
+                    if quarter:
+                        stack.append((quarter, l, t, r, b, items, segments, regions))
+
+        return accepted, regional, rejected, pending
+
+    def CheckOverlap(self, x, y):
+        """Check if a via placed in (x, y) overlaps or interfere with other items.
+
+        Returns:
+            bool: True if via overlaps with an item, False otherwise.
+        """
+
+        return self.Overlapping(x, y) is not None
+
+    def Overlapping(self, x, y):
+        """Find the kind of item a via placed in (x, y) overlaps or interfere with.
+
+        Returns:
+            str: Kind of the first overlapping item found, None if there's none.
+        """
+
+        radius = self.settings.via_size / 2
+        clearance = self.clearance
+        net_clearances = self.net_clearances
+        margin = self.max_clearance
+        left = x - radius
+        top = y - radius
+        right = x + radius
+        bottom = y + radius
+
+        # Tracks are checked against clearance so the query area is inflated accordingly
+        nearby = self.index.Query(
+            left - margin, top - margin, right + margin, bottom + margin
+        )
+
+        for item in nearby:
+            kind = item.kind
+            if kind == STITCH:
+                # Stitching vias come from the board or from the fill of a previous area
+                # (see ReplaceVias): their position and size are checked, not their box
+                sx, sy, half = item.shape
+                if abs(x - sx) <= radius + half and abs(y - sy) <= radius + half:
+                    return kind
+            elif kind == PAD or kind == VIA:
+                # Overlapping with pads and vias work best if checking is performed by
+                # bounding box intersection
+                bbox = item.bbox
+                if (
+                    bbox[0] <= right
+                    and bbox[2] >= left
+                    and bbox[1] <= bottom
+                    and bbox[3] >= top
+                ):
+                    return kind
+            elif kind == TRACK:
+                x1, y1, x2, y2, half_width = item.shape
+                distance = segment_distance(x, y, x1, y1, x2, y2)
+                limit = clearance
+                if net_clearances and item.clearance > limit:
+                    limit = item.clearance
+                if distance - half_width - radius < limit:
+                    return kind
+            elif kind == ARC:
+                distance = arc_distance(x, y, item.shape[:-1])
+                limit = clearance
+                if net_clearances and item.clearance > limit:
+                    limit = item.clearance
+                if distance - item.shape[-1] - radius < limit:
+                    return kind
+
+        if not self.regions:
+            return None
+        return self.RegionOverlapping(x, y)
+
+    def RegionOverlapping(self, x, y):
+        """Find the kind of zone or keepout a via placed in (x, y) interferes with.
+
+        Returns:
+            str: Kind of the first overlapping region found, None if there's none.
+        """
+
+        radius = self.settings.via_size / 2
+        value = self.Mask().Lookup(x, y)
+        if value == MASK_FREE:
+            return None
+        if value != MASK_BOUNDARY:
+            return REGION_KINDS[value]
+
+        # Pixel crossed by an edge: exact test
+        for item in self.region_index.Query(x - radius, y - radius, x + radius, y + radius):
+            if item.kind == ZONE:
+                if self.ZoneTester(item).Contains([(x, y)])[0]:
+                    return item.kind
+            elif self.KeepoutHit(item, x, y):
+                return item.kind
+
+        return None
+
+    def PlaceBatches(self, tiles=None, rows=BATCH_ROWS):
+        """Compute via positions a few lattice rows at a time.
+        Callers can stop iterating at any batch boundary (e.g. to cancel a preview) or use
+        progress to report it.
+
+        Parameters:
+            tiles (set): Only compute positions inside these tiles (see TileOf), all if None
+            rows (int): Lattice rows per batch
+
+        Returns:
+            generator: (progress, positions) tuples, positions accepted in the batch
+        """
+
+        stats = self.stats
+        batches = self.CandidateBatches(rows, tiles)
+        spacing = self.pattern.spacing
+        placed = SpatialIndex(spacing) if spacing else None
+        while True:
+            with self.Stage("candidates"):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            progress, candidates, count = batch
+            if stats is not None:
+                stats.candidates += count
+                stats.Reject("outside zone", count - len(candidates))
+
+            if tiles is not None:
+                count = len(candidates)
+                candidates = [point for point in candidates if self.TileOf(*point) in tiles]
+                if stats is not None:
+                    stats.Reject("unchanged tile", count - len(candidates))
+
+            accepted = self.Accept(candidates)
+
+            if placed is not None:
+                with self.Stage("spacing"):
+                    count = len(accepted)
+                    accepted = self.Spaced(accepted, placed)
+                if stats is not None:
+                    stats.Reject("spacing", count - len(accepted))
+
+            if stats is not None:
+                stats.accepted += len(accepted)
+
+            yield progress, accepted
+
+    def Accept(self, candidates):
+        """Keep the candidates complying with edge clearance and not overlapping anything.
+
+        Every candidate is tested on its own (spacing is left to the caller).
+
+        Parameters:
+            candidates (list): Positions to test as (x, y) tuples
+
+        Returns:
+            list: Accepted positions, in the order of candidates
+        """
+
+        stats = self.stats
+        with self.Stage("blocks"):
+            keep, regional, rejected, pending = self.SortBlocks(candidates)
+        if stats is not None:
+            stats.Reject("edge clearance", len(rejected))
+
+        # Check clearance only if clearance value differs from 0 (disabled)
+        if self.settings.edge_clearance != 0:
+            with self.Stage("clearance"):
+                count = len(pending)
+                clear = self.CheckClearance([candidates[n] for n in pending])
+                pending = [n for n, ok in zip(pending, clear) if ok]
+            if stats is not None:
+                stats.Reject("edge clearance", count - len(pending))
+
+        with self.Stage("overlap"):
+            for n in regional:
+                kind = self.RegionOverlapping(*candidates[n])
+                if kind is None:
+                    keep.append(n)
+                elif stats is not None:
+                    stats.Overlap(kind)
+            for n in pending:
+                kind = self.Overlapping(*candidates[n])
+                if kind is None:
+                    keep.append(n)
+                elif stats is not None:
+                    stats.Overlap(kind)
+        keep.sort()
+        return [candidates[n] for n in keep]
+
+    def CountPlaced(self):
+        """Count the vias a lattice pattern places, reusing the outcome of earlier counts.
+
+        Lattices of other offsets share positions: the rows of a Star lattice are rows of
+        two Grid lattices. Once a lattice without shifted rows is counted, the positions it
+        accepted are kept by class (positions congruent modulo the pitch) and later counts
+        only test the positions of classes not seen yet (see OffsetBatches).
+
+        Returns:
+            int: Number of vias placed with the current settings
+        """
+
+        left, top, step_x, step_y, offset_x, offset_y, star = self.Lattice()
+        # A lattice starting within a pitch from the corner holds its whole class
+        complete = not star and 0 <= offset_x < step_x and 0 <= offset_y < step_y
+        classes = self.lattice_classes
+        count = 0
+        placed = []
+        for progress, candidates, total in self.CandidateBatches():
+            fresh = []
+            for x, y in candidates:
+                known = classes.get(
+                    (step_x, step_y, (x - left) % step_x, (y - top) % step_y)
+                )
+                if known is None:
+                    fresh.append((x, y))
+                elif (x, y) in known:
+                    count += 1
+            accepted = self.Accept(fresh)
+            count += len(accepted)
+            if complete:
+                placed.extend(accepted)
+        if complete:
+            classes[(step_x, step_y, offset_x, offset_y)] = set(placed)
+        return count
+
+    def Spaced(self, points, placed):
+        """Keep the points far enough from each other and from the ones placed before.
+
+        Parameters:
+            points (list): Positions to test as (x, y) tuples, earlier ones win
+            placed (SpatialIndex): Positions accepted so far, kept points are added
+
+        Returns:
+            list: Kept positions
+        """
+
+        spacing = self.pattern.spacing
+        kept = []
+        for x, y in points:
+            nearby = placed.Query(x - spacing, y - spacing, x + spacing, y + spacing)
+            if any(hypot(x - px, y - py) < spacing for px, py in nearby):
+                continue
+            placed.Insert((x, y), x, y, x, y)
+            kept.append((x, y))
+        return kept
+
+    def ParallelBatches(self, executor, tiles=None):
+        """Same as PlaceBatches, the tiles are spread across the worker processes.
+
+        The snapshot is pickled once into shared memory, each worker loads it once (see
+        PlaceSharedTiles) and places a share of the tiles against the whole of it, so
+        nothing changes at the tile borders. Positions come back sorted in lattice order,
+        the one of a serial run. Patterns placing vias in no fixed order or depending on
+        the vias placed before run serially.
+
+        Parameters:
+            executor (concurrent.futures.ProcessPoolExecutor): Worker processes
+            tiles (set): Only compute positions inside these tiles (see TileOf), all if None
+
+        Returns:
+            generator: (progress, positions) tuples, positions are all in the last one
+        """
+
+        if self.pattern.spacing is not None or self.Lattice() is None:
+            yield from self.PlaceBatches(tiles)
+            return
+
+        left, top, right, bottom = self.area.bbox
+        width, height = self.TileSize()
+        keys = [
+            "%d,%d" % (i, j)
+            for j in range(int((bottom - top) // height) + 1)
+            for i in range(int((right - left) // width) + 1)
+        ]
+        if tiles is not None:
+            keys = [key for key in keys if key in tiles]
+        if not keys:
+            yield 1.0, []
+            return
+
+        # Runs of consecutive tiles, so that each task scans few lattice rows
+        tasks = TASKS_PER_WORKER * ExecutorWorkers(executor)
+        size = ceil(len(keys) / tasks)
+        chunks = [set(keys[k : k + size]) for k in range(0, len(keys), size)]
+
+        with self.Stage("parallel"):
+            block, length = ShareSnapshot(
+                self.area, self.obstacles, self.settings, self.owned
+            )
+            pending = set()
+            try:
+                pending = set(
+                    executor.submit(PlaceSharedTiles, block.name, length, chunk)
+                    for chunk in chunks
+                )
+                positions = []
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        positions.extend(future.result())
+                    if pending:
+                        yield 1 - len(pending) / len(chunks), []
+            finally:
+                for future in pending:
+                    future.cancel()
+                block.close()
+                block.unlink()
+
+        positions.sort(key=lambda point: (point[1], point[0]))
+        if self.stats is not None:
+            self.stats.accepted += len(positions)
+        yield 1.0, positions
+
+    def Place(self, tiles=None, executor=None):
+        """Compute via positions.
+
+        Parameters:
+            tiles (set): Only compute positions inside these tiles (see TileOf), all if None
+            executor (concurrent.futures.ProcessPoolExecutor): If given tiles are
+                processed concurrently (see ParallelBatches)
+
+        Returns:
+            list: Accepted positions as (x, y) tuples
+        """
+
+        if executor is None:
+            batches = self.PlaceBatches(tiles)
+        else:
+            batches = self.ParallelBatches(executor, tiles)
+        positions = []
+        for progress, batch in batches:
+            positions.extend(batch)
+        return positions
+
+    def TileSize(self):
+        """Return the re-stitching tile size as (width, height)."""
+
+        return (self.settings.step_x * TILE_STEPS, self.settings.step_y * TILE_STEPS)
+
+    def TileOf(self, x, y):
+        """Return the key of the tile holding (x, y)."""
+
+        left, top = self.area.bbox[:2]
+        width, height = self.TileSize()
+        return "%d,%d" % ((x - left) // width, (y - top) // height)
+
+    def Parameters(self):
+        """Return a digest of everything that affects the whole area at once."""
+
+        settings = self.settings
+        values = [getattr(settings, name) for name in FillSettings.__slots__]
+        values += [self.net, self.area.bbox, sorted(self.area.layers), TILE_STEPS]
+        return hashlib.blake2b(repr(values).encode(), digest_size=8).hexdigest()
+
+    def TileFingerprints(self):
+        """Compute a digest of the geometry each tile placement depends on.
+
+        A tile collects the edges of the area filling, of the area outline (within edge
+        clearance) and of the zones around, plus the obstacles within via radius and track
+        clearance. Edges tell where the inside of a polygon changes, so together with the
+        state of the tile center they pin down the inside of the whole tile.
+
+        Returns:
+            dict: Fingerprint by tile key (see TileOf)
+        """
+
+        settings = self.settings
+        left, top, right, bottom = self.area.bbox
+        width, height = self.TileSize()
+        columns = int((right - left) // width) + 1
+        rows = int((bottom - top) // height) + 1
+        content = {}
+
+        def add(l, t, r, b, margin, entry):
+            i0 = max(0, int((l - margin - left) // width))
+            i1 = min(columns - 1, int((r + margin - left) // width))
+            j0 = max(0, int((t - margin - top) // height))
+            j1 = min(rows - 1, int((b + margin - top) // height))
+            for j in range(j0, j1 + 1):
+                for i in range(i0, i1 + 1):
+                    content.setdefault((i, j), []).append(entry)
+
+        def add_contours(tag, contours, margin):
+            for contour in contours:
+                for k in range(len(contour)):
+                    x1, y1 = contour[k - 1]
+                    x2, y2 = contour[k]
+                    add(
+                        min(x1, x2),
+                        min(y1, y2),
+                        max(x1, x2),
+                        max(y1, y2),
+                        margin,
+                        (tag, x1, y1, x2, y2),
+                    )
+
+        if self.area.copper is None:
+            for layer in self.area.layers:
+                add_contours(("fill", layer), self.area.filled.get(layer, []), 0)
+        else:
+            add_contours("copper", self.area.copper, 0)
+
+        if settings.edge_clearance != 0:
+            corners = self.area.corners
+            add_contours("edge", [corners], settings.edge_clearance)
+
+        margin = settings.via_size / 2 + self.max_clearance
+        zones = []
+        for item in self.obstacles:
+            if item.kind == ZONE:
+                if item.netname != self.area.netname:
+                    zones.append(item)
+                    add_contours(("zone", item.netname), item.shape.get(self.area.layer, []), 0)
+            elif item.kind == STITCH:
+                if id(item) not in self.exempt:
+                    x, y, half = item.shape
+                    entry = (item.kind, item.shape, item.netname)
+                    add(x - half, y - half, x + half, y + half, margin, entry)
+            else:
+                entry = (item.kind, item.bbox, item.shape, item.netname, item.clearance)
+                add(*item.bbox, margin, entry)
+
+        tiles = [(i, j) for j in range(rows) for i in range(columns)]
+        centers = [
+            (left + i * width + width // 2, top + j * height + height // 2)
+            for i, j in tiles
+        ]
+        inside = [tester.Contains(centers) for tester in self.CopperTesters()]
+        covered = [
+            (item.netname, self.ZoneTester(item).Contains(centers)) for item in zones
+        ]
+
+        fingerprints = {}
+        for n, (i, j) in enumerate(tiles):
+            center = (
+                [flags[n] for flags in inside],
+                sorted(netname for netname, flags in covered if flags[n]),
+            )
+            entries = sorted(repr(entry) for entry in content.get((i, j), []))
+            digest = hashlib.blake2b(digest_size=8)
+            digest.update(repr(center).encode())
+            digest.update("\n".join(entries).encode())
+            fingerprints["%d,%d" % (i, j)] = digest.hexdigest()
+
+        return fingerprints
+
+    def Restitch(self, state=None, executor=None):
+        """Update a previous fill, recomputing only the tiles that changed since then.
+
+        The vias of the previous fill are the ones the engine owns, no other via is ever
+        removed. A tile is recomputed if its fingerprint or its number
+        of vias differ from the stored ones. Everything is recomputed if the fill
+        parameters changed or there is no stored state.
+
+        Parameters:
+            state (dict): Fill state stored by the previous re-stitch (see FillUpdate)
+            executor (concurrent.futures.ProcessPoolExecutor): If given tiles are
+                processed concurrently (see ParallelBatches)
+
+        Returns:
+            FillUpdate: Vias to add and remove and the new fill state
+        """
+
+        for progress, update in self.RestitchBatches(state, executor=executor):
+            pass
+        return update
+
+    def RestitchBatches(self, state=None, rows=BATCH_ROWS, executor=None):
+        """Same as Restitch, placement runs a few lattice rows at a time (see PlaceBatches).
+
+        Returns:
+            generator: (progress, update) tuples, update is None but in the last one
+        """
+
+        params = self.Parameters()
+        with self.Stage("fingerprints"):
+            fingerprints = self.TileFingerprints()
+
+        owned = self.owned
+        counts = {}
+        for x, y in owned:
+            key = self.TileOf(x, y)
+            counts[key] = counts.get(key, 0) + 1
+
+        if state is None or state.get("params") != params or not self.pattern.tiled:
+            dirty = None
+        else:
+            tiles = state.get("tiles", {})
+            dirty = set(
+                key
+                for key, fingerprint in fingerprints.items()
+                if tiles.get(key) != [fingerprint, counts.get(key, 0)]
+            )
+
+        if executor is None:
+            batches = self.PlaceBatches(dirty, rows)
+        else:
+            batches = self.ParallelBatches(executor, dirty)
+        positions = []
+        for progress, batch in batches:
+            positions.extend(batch)
+            if progress < 1:
+                yield progress, None
+
+        # Vias of the recomputed tiles (or out of the tiles) are replaced by the new ones,
+        # those already in place are kept
+        placed = set(positions)
+        kept = set()
+        remove = []
+        for point in owned:
+            key = self.TileOf(*point)
+            if dirty is not None and key in fingerprints and key not in dirty:
+                continue
+            if point in placed and point not in kept:
+                kept.add(point)
+            else:
+                remove.append(point)
+        add = [point for point in positions if point not in kept]
+
+        if dirty is not None:
+            for key in dirty:
+                counts.pop(key, None)
+        else:
+            counts = {}
+        for x, y in positions:
+            key = self.TileOf(x, y)
+            counts[key] = counts.get(key, 0) + 1
+
+        state = {
+            "params": params,
+            "tiles": {
+                key: [fingerprint, counts.get(key, 0)]
+                for key, fingerprint in fingerprints.items()
+            },
+        }
+        yield 1.0, FillUpdate(add, remove, dirty, state)
+
+
+def ExecutorWorkers(executor):
+    """Return the number of workers of executor.
+
+    Executors of concurrent.futures keep it in _max_workers, the processors count is
+    assumed for any other.
+
+    Parameters:
+        executor (concurrent.futures.Executor): Worker pool
+
+    Returns:
+        int: Workers
+    """
+
+    return getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+
+
+def ShareSnapshot(area, obstacles, settings, owned=()):
+    """Pickle the geometry snapshot into a new shared memory block.
+
+    Returns:
+        tuple: (SharedMemory, size of the pickle), the caller unlinks the block
+    """
+
+    data = pickle.dumps((area, obstacles, settings, owned), pickle.HIGHEST_PROTOCOL)
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[: len(data)] = data
+    return block, len(data)
+
+
+# Engine of the last snapshot loaded by this (worker) process, as (block name, engine)
+_shared_engine = [None, None]
+
+
+def SharedEngine(name, size):
+    """Return an engine on the snapshot in the shared memory block (see ShareSnapshot).
+
+    The snapshot is loaded once, later calls with the same block reuse the engine.
+    """
+
+    if _shared_engine[0] != name:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13, the block is tracked by the resource tracker of the pool
+            block = shared_memory.SharedMemory(name=name)
+        try:
+            data = bytes(block.buf[:size])
+        finally:
+            block.close()
+        area, obstacles, settings, owned = pickle.loads(data)
+        _shared_engine[:] = [name, PlacementEngine(area, obstacles, settings, owned=owned)]
+    return _shared_engine[1]
+
+
+def PlaceSharedTiles(name, size, tiles):
+    """Compute via positions inside some tiles of a shared snapshot (see SharedEngine)."""
+
+    return SharedEngine(name, size).Place(tiles)
+
+
+def CountSharedPhase(name, size, settings):
+    """Count the vias placed in a shared snapshot with other offsets (see OffsetBatches)."""
+
+    engine = SharedEngine(name, size)
+    engine.Rebind(settings)
+    return engine.CountPlaced()
+
+
+def OffsetBatches(
+    areas,
+    obstacles,
+    settings,
+    patterns=None,
+    steps=PHASE_STEPS,
+    executor=None,
+    owned=None,
+):
+    """Search the lattice offsets (and patterns) placing the most vias in areas.
+
+    A lattice looks the same every pitch, so offsets are tried on a steps by steps grid
+    spanning one pitch, for every pattern. The given settings are tried first and win
+    ties. Each area gets a single engine reused by all the trials, only the lattice
+    changes between them (see PlacementEngine.Rebind): zones, keepouts and obstacles are
+    indexed once.
+
+    Parameters:
+        areas (list): AreaSnapshot records
+        obstacles (list): Obstacle records collected around all the areas
+        settings (FillSettings): Fill parameters
+        patterns (list): Names of the patterns to try, the one of settings if None
+        steps (int): Offsets tried along each pitch
+        executor (concurrent.futures.ProcessPoolExecutor): If given trials are spread
+            across the worker processes
+        owned (list): Positions of the stitching vias owned by every area, none if None
+
+    Returns:
+        generator: (progress, settings, count) tuples, the best settings found so far and
+            the number of vias they place
+
+    Raises:
+        ValueError: If a pattern isn't a lattice (see Pattern.Lattice)
+    """
+
+    if owned is None:
+        owned = [()] * len(areas)
+    engines = [
+        PlacementEngine(area, obstacles, settings, owned=positions)
+        for area, positions in zip(areas, owned)
+    ]
+    if not engines:
+        yield 1.0, settings, 0
+        return
+
+    trials = [settings]
+    seen = set([(settings.pattern, settings.offset_x, settings.offset_y)])
+    for pattern in patterns or [settings.pattern]:
+        engines[0].Rebind(settings.Replace(pattern=pattern))
+        lattice = engines[0].Lattice()
+        if lattice is None:
+            raise ValueError("pattern %s has no lattice to shift" % pattern)
+        step_x, step_y = lattice[2:4]
+        for j in range(steps):
+            for i in range(steps):
+                key = (pattern, step_x * i // steps, step_y * j // steps)
+                if key not in seen:
+                    seen.add(key)
+                    trials.append(
+                        settings.Replace(pattern=key[0], offset_x=key[1], offset_y=key[2])
+                    )
+
+    best = None
+    best_count = -1
+    if executor is None:
+        for n, trial in enumerate(trials):
+            count = 0
+            for engine in engines:
+                engine.Rebind(trial)
+                count += engine.CountPlaced()
+            if count > best_count:
+                best, best_count = trial, count
+            yield (n + 1) / len(trials), best, best_count
+        return
+
+    # Tasks of the same area are submitted together: a worker keeps the last snapshot
+    # loaded (see SharedEngine)
+    shares = []
+    futures = []
+    try:
+        for area, positions in zip(areas, owned):
+            shares.append(ShareSnapshot(area, obstacles, settings, positions))
+            block, length = shares[-1]
+            futures.append(
+                [
+                    executor.submit(CountSharedPhase, block.name, length, trial)
+                    for trial in trials
+                ]
+            )
+        for n, trial in enumerate(trials):
+            count = sum(area_futures[n].result() for area_futures in futures)
+            if count > best_count:
+                best, best_count = trial, count
+            yield (n + 1) / len(trials), best, best_count
+    finally:
+        for area_futures in futures:
+            for future in area_futures:
+                future.cancel()
+        for block, length in shares:
+            block.close()
+            block.unlink()
+
+
+def PlaceArea(area, obstacles, settings, executor=None, owned=()):
+    """Compute via positions for a single area (see PlacementEngine.Place)."""
+
+    return PlacementEngine(area, obstacles, settings, owned=owned).Place(
+        executor=executor
+    )
+
+
+def RestitchArea(area, obstacles, settings, state=None, owned=(), executor=None):
+    """Update the fill of a single area (see PlacementEngine.Restitch)."""
+
+    return PlacementEngine(area, obstacles, settings, owned=owned).Restitch(
+        state, executor
+    )
+
+
+def ReplaceVias(obstacles, netname, remove, add, via_size):
+    """Return the obstacles as they are after a fill changed the stitching vias.
+
+    Areas filled later must keep clear of the vias placed by the ones filled before, even
+    if the board isn't updated yet.
+
+    Parameters:
+        obstacles (list): Obstacle records, left unchanged
+        netname (str): Net of the new vias
+        remove (list): Positions of the removed stitching vias
+        add (list): Positions of the new stitching vias
+        via_size (int): Size of the new vias
+
+    Returns:
+        list: Obstacle records
+    """
+
+    pending = Counter(remove)
+    replaced = []
+    for obstacle in obstacles:
+        if obstacle.kind == STITCH:
+            position = obstacle.shape[:2]
+            if pending[position] > 0:
+                pending[position] -= 1
+                continue
+        replaced.append(obstacle)
+
+    half = via_size / 2
+    extent = ceil(half)
+    for x, y in add:
+        bbox = (x - extent, y - extent, x + extent, y + extent)
+        replaced.append(Obstacle(STITCH, bbox, (x, y, half), netname))
+    return replaced
+
+
+def AreaWaves(areas, margin):
+    """Split areas in waves that can be filled concurrently.
+
+    An area goes in the wave after the last one holding an area listed before it whose
+    bounding box, grown by margin, overlaps its own: filling the waves one after the
+    other gives the same vias as filling the areas in their order.
+
+    Parameters:
+        areas (list): AreaSnapshot records
+        margin (int): Distance below which the vias of two areas may collide
+
+    Returns:
+        list: Waves, each one a list of indices into areas
+    """
+
+    waves = []
+    levels = []
+    for n, area in enumerate(areas):
+        left, top, right, bottom = area.bbox
+        level = 0
+        for m in range(n):
+            other = areas[m].bbox
+            if (
+                other[0] <= right + margin
+                and other[2] >= left - margin
+                and other[1] <= bottom + margin
+                and other[3] >= top - margin
+            ):
+                level = max(level, levels[m] + 1)
+        levels.append(level)
+        if level == len(waves):
+            waves.append([])
+        waves[level].append(n)
+    return waves
+
+
+def RestitchAreas(areas, obstacles, settings, states, owned, executor=None):
+    """Update the fill of many areas sharing the same obstacles.
+
+    Areas are filled in their order, the vias of the ones before are in the way of the
+    next ones (see ReplaceVias). Only areas far enough apart are processed concurrently
+    (see AreaWaves), the outcome is the same of a serial run.
+
+    Parameters:
+        areas (list): AreaSnapshot records
+        obstacles (list): Obstacle records collected around all the areas
+        settings (FillSettings): Fill parameters
+        states (list): Stored fill state of every area (None if missing)
+        owned (list): Positions of the stitching vias placed by the previous fill of
+            every area (see viastitching_board.AreaVias)
+        executor (concurrent.futures.Executor): If given areas are processed concurrently,
+            a single area is split in tiles (see PlacementEngine.ParallelBatches)
+
+    Returns:
+        list: FillUpdate of every area, in the same order of areas
+    """
+
+    updates = [None] * len(areas)
+    for wave in AreaWaves(areas, settings.via_size):
+        if executor is None or len(wave) == 1:
+            for n in wave:
+                updates[n] = RestitchArea(
+                    areas[n], obstacles, settings, states[n], owned[n], executor
+                )
+        else:
+            count = len(wave)
+            results = executor.map(
+                RestitchArea,
+                [areas[n] for n in wave],
+                [obstacles] * count,
+                [settings] * count,
+                [states[n] for n in wave],
+                [owned[n] for n in wave],
+            )
+            for n, update in zip(wave, results):
+                updates[n] = update
+        for n in wave:
+            netname = settings.net or areas[n].netname
+            obstacles = ReplaceVias(
+                obstacles, netname, updates[n].remove, updates[n].add, settings.via_size
+            )
+    return updates
+
+
+def PlaceAreas(areas, obstacles, settings, executor=None, owned=None):
+    """Compute via positions for many areas sharing the same obstacles.
+
+    Like RestitchAreas, the vias of an area are in the way of the areas after it and
+    the vias it owns are replaced by its new ones.
+
+    Parameters:
+        areas (list): AreaSnapshot records
+        obstacles (list): Obstacle records collected around all the areas
+        settings (FillSettings): Fill parameters
+        executor (concurrent.futures.Executor): If given areas are processed concurrently,
+            a single area is split in tiles (see PlacementEngine.ParallelBatches)
+        owned (list): Positions of the stitching vias owned by every area, none if None
+
+    Returns:
+        list: Accepted positions of every area, in the same order of areas
+    """
+
+    if owned is None:
+        owned = [()] * len(areas)
+    positions = [None] * len(areas)
+    for wave in AreaWaves(areas, settings.via_size):
+        if executor is None or len(wave) == 1:
+            for n in wave:
+                positions[n] = PlaceArea(
+                    areas[n], obstacles, settings, executor, owned[n]
+                )
+        else:
+            count = len(wave)
+            results = executor.map(
+                PlaceArea,
+                [areas[n] for n in wave],
+                [obstacles] * count,
+                [settings] * count,
+                [None] * count,
+                [owned[n] for n in wave],
+            )
+            for n, accepted in zip(wave, results):
+                positions[n] = accepted
+        for n in wave:
+            netname = settings.net or areas[n].netname
+            obstacles = ReplaceVias(
+                obstacles, netname, owned[n], positions[n], settings.via_size
+            )
+    return positions
@@ -0,0 +1,915 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Geometry helpers used by the placement code (no pcbnew/wx dependencies)
+# (c) Michele Santucci 2019
+#
+
+from bisect import bisect_right
+from math import atan2, ceil, cos, hypot, inf, sin, sqrt, tau
+
+
+class SpatialIndex:
+    """Uniform hash grid over axis aligned bounding boxes.
+
+    Every item is stored in all the grid cells its bounding box touches, so a query
+    only has to look at the few cells around the queried rectangle instead of walking
+    the whole item list. Items spanning more than `max_cells` cells are kept aside and
+    checked on every query (big zones would otherwise flood the grid).
+    """
+
+    def __init__(self, cell_size, max_cells=4096):
+        """Initialize an empty index.
+
+        Parameters:
+            cell_size (float): Side of a grid cell (board units)
+            max_cells (int): Max number of cells an item may span before being stored as 'large'
+        """
+
+        self.cell_size = max(1, cell_size)
+        self.max_cells = max_cells
+        self.cells = {}
+        self.large = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def CellRange(self, left, top, right, bottom):
+        """Return the range of grid cells covered by a rectangle.
+
+        Returns:
+            tuple: (first column, first row, last column, last row)
+        """
+
+        size = self.cell_size
+        return (
+            int(left // size),
+            int(top // size),
+            int(right // size),
+            int(bottom // size),
+        )
+
+    def Insert(self, item, left, top, right, bottom):
+        """Insert item using the given bounding box."""
+
+        entry = (item, left, top, right, bottom)
+        col0, row0, col1, row1 = self.CellRange(left, top, right, bottom)
+        self.count += 1
+
+        if (col1 - col0 + 1) * (row1 - row0 + 1) > self.max_cells:
+            self.large.append(entry)
+            return
+
+        cells = self.cells
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                key = (col, row)
+                bucket = cells.get(key)
+                if bucket is None:
+                    cells[key] = [entry]
+                else:
+                    bucket.append(entry)
+
+    def Query(self, left, top, right, bottom):
+        """Collect items whose bounding box overlaps (or touches) the given rectangle.
+
+        Returns:
+            list: Matching items, every item is reported once in insertion order of its cell.
+        """
+
+        found = []
+        seen = set()
+        col0, row0, col1, row1 = self.CellRange(left, top, right, bottom)
+        cells = self.cells
+
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                bucket = cells.get((col, row))
+                if bucket is None:
+                    continue
+                for entry in bucket:
+                    key = id(entry)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if (
+                        entry[1] <= right
+                        and entry[3] >= left
+                        and entry[2] <= bottom
+                        and entry[4] >= top
+                    ):
+                        found.append(entry[0])
+
+        for entry in self.large:
+            if (
+                entry[1] <= right
+                and entry[3] >= left
+                and entry[2] <= bottom
+                and entry[4] >= top
+            ):
+                found.append(entry[0])
+
+        return found
+
+    def Any(self, left, top, right, bottom):
+        """Check if any item bounding box overlaps (or touches) the given rectangle.
+
+        Same as bool(Query(...)) but it stops at the first match.
+        """
+
+        col0, row0, col1, row1 = self.CellRange(left, top, right, bottom)
+        cells = self.cells
+
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                bucket = cells.get((col, row))
+                if bucket is None:
+                    continue
+                for entry in bucket:
+                    if (
+                        entry[1] <= right
+                        and entry[3] >= left
+                        and entry[2] <= bottom
+                        and entry[4] >= top
+                    ):
+                        return True
+
+        for entry in self.large:
+            if (
+                entry[1] <= right
+                and entry[3] >= left
+                and entry[2] <= bottom
+                and entry[4] >= top
+            ):
+                return True
+
+        return False
+
+
+def grid_cell_size(width, height, count, minimum=1):
+    """Pick a hash grid cell size so that on average a cell holds about one item.
+
+    Parameters:
+        width (float): Width of the indexed region
+        height (float): Height of the indexed region
+        count (int): Number of items to be indexed
+        minimum (float): Smallest cell size allowed
+
+    Returns:
+        float: Cell size
+    """
+
+    return max(minimum, sqrt(float(width) * float(height) / max(1, count)))
+
+
+def lattice_rows(left, top, right, bottom, step_x, step_y, offset_x=0, offset_y=0, star=False):
+    """Generate the via lattice covering a rectangle, one row at a time.
+
+    Parameters:
+        left, top, right, bottom (int): Rectangle to cover
+        step_x, step_y (int): Lattice pitch
+        offset_x, offset_y (int): Lattice offset from the top left corner
+        star (bool): Shift every second row by half the horizontal pitch
+
+    Returns:
+        generator: (y, [x0, x1, ...]) tuples, rows from top to bottom
+    """
+
+    for y, x0, count in lattice_spans(
+        left, top, right, bottom, step_x, step_y, offset_x, offset_y, star
+    ):
+        yield y, [x0 + i * step_x for i in range(count)]
+
+
+def lattice_spans(left, top, right, bottom, step_x, step_y, offset_x=0, offset_y=0, star=False):
+    """Same as lattice_rows but rows are described, not listed.
+
+    Returns:
+        generator: (y, x0, count) tuples, row points are x0 + i * step_x for i < count
+    """
+
+    half_step = int(step_x / 2)
+    row = 0
+    y = top + offset_y
+    while y <= bottom:
+        x0 = left + offset_x
+        if star and row % 2:
+            x0 += half_step
+        count = int((right - x0) // step_x) + 1 if x0 <= right else 0
+        yield y, x0, count
+        row += 1
+        y += step_y
+
+
+def span_points(x0, step, count, intervals):
+    """Return the points of a lattice row falling inside intervals.
+
+    Parameters:
+        x0, step, count: Lattice row (see lattice_spans)
+        intervals (list): Sorted, disjoint [start, end) ranges (see PolygonHitTester.Intervals)
+
+    Returns:
+        list: Abscissas of the points inside the intervals
+    """
+
+    xs = []
+    for start, end in intervals:
+        if start == -inf:
+            first = 0
+        else:
+            first = max(0, ceil((start - x0) / step))
+            # Float division may land one step off
+            while first > 0 and x0 + (first - 1) * step >= start:
+                first -= 1
+            while x0 + first * step < start:
+                first += 1
+        x = x0 + first * step
+        i = first
+        while i < count and x < end:
+            xs.append(x)
+            i += 1
+            x += step
+    return xs
+
+
+def intersect_intervals(a, b):
+    """Intersect two sorted lists of disjoint [start, end) ranges."""
+
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def on_lattice(x, y, left, top, step_x, step_y, offset_x=0, offset_y=0, star=False):
+    """Check if (x, y) is one of the points generated by lattice_rows.
+
+    Only the lattice origin and pitch are taken into account, not the far edges.
+    """
+
+    dy = y - top - offset_y
+    if dy < 0 or dy % step_y:
+        return False
+
+    x0 = left + offset_x
+    if star and (dy // step_y) % 2:
+        x0 += int(step_x / 2)
+    dx = x - x0
+    return dx >= 0 and dx % step_x == 0
+
+
+def lattice_points(left, top, right, bottom, step_x, step_y, offset_x=0, offset_y=0, star=False):
+    """Flatten lattice_rows into a list of (x, y) points."""
+
+    return [
+        (x, y)
+        for y, xs in lattice_rows(
+            left, top, right, bottom, step_x, step_y, offset_x, offset_y, star
+        )
+        for x in xs
+    ]
+
+
+def signed_area(contour):
+    """Return twice the signed area of a closed contour.
+
+    The result is positive if the inside lies on the left of the contour edges.
+    """
+
+    return sum(
+        contour[i - 1][0] * contour[i][1] - contour[i][0] * contour[i - 1][1]
+        for i in range(len(contour))
+    )
+
+
+def inset_contour(contour, distance):
+    """Move every edge of a closed contour inwards by distance.
+
+    Corners are rebuilt by intersecting the shifted edges (mitered), which is exact for
+    insets smaller than the features of the contour: narrower parts may fold over and
+    should be filtered by the caller.
+
+    Parameters:
+        contour (list): Corners as (x, y) tuples
+        distance (float): Inset
+
+    Returns:
+        list: Corners of the inset contour as (x, y) float tuples
+    """
+
+    # Drop repeated corners, they have no direction
+    corners = [
+        point for i, point in enumerate(contour) if point != contour[i - 1]
+    ]
+    if len(corners) < 3:
+        return []
+
+    side = 1 if signed_area(corners) > 0 else -1
+    lines = []
+    for i in range(len(corners)):
+        (x1, y1), (x2, y2) = corners[i - 1], corners[i]
+        length = hypot(x2 - x1, y2 - y1)
+        dx, dy = (x2 - x1) / length, (y2 - y1) / length
+        # Inward normal
+        nx, ny = -dy * side, dx * side
+        lines.append((x1 + nx * distance, y1 + ny * distance, dx, dy))
+
+    inset = []
+    for i in range(len(lines)):
+        ax, ay, adx, ady = lines[i - 1]
+        bx, by, bdx, bdy = lines[i]
+        cross = adx * bdy - ady * bdx
+        if abs(cross) < 1e-9:
+            # Collinear edges: the shared corner just moves along the normal
+            inset.append((bx, by))
+            continue
+        t = ((bx - ax) * bdy - (by - ay) * bdx) / cross
+        inset.append((ax + adx * t, ay + ady * t))
+    return inset
+
+
+def inset_contours(contours, distance):
+    """Move the edges of outlines and holes towards the inside of the polygon by distance.
+
+    Outlines shrink and holes grow (see inset_contour). A contour is a hole if it lies
+    inside the others (even-odd rule). Contours turned inside out by the inset (too
+    narrow for it) are dropped.
+
+    Parameters:
+        contours (list): Outlines and holes, each one a list of (x, y) tuples
+        distance (float): Inset
+
+    Returns:
+        list: Inset contours, each one a list of (x, y) float tuples
+    """
+
+    inset = []
+    for n, contour in enumerate(contours):
+        if len(contour) < 3:
+            continue
+        others = PolygonHitTester(contours[:n] + contours[n + 1 :])
+        hole = others.Contains([contour[0]])[0]
+        moved = inset_contour(contour, -distance if hole else distance)
+        if moved and signed_area(moved) * signed_area(contour) > 0:
+            inset.append(moved)
+    return inset
+
+
+def contour_points(contour, pitch, phase=0):
+    """Spread points evenly along a closed contour.
+
+    The pitch is rounded so that a whole number of points fits the perimeter, the first
+    point is phase away from the first corner.
+
+    Parameters:
+        contour (list): Corners as (x, y) tuples
+        pitch (float): Distance between points, measured along the contour
+        phase (float): Shift of the points along the contour
+
+    Returns:
+        list: Points as (x, y) float tuples
+    """
+
+    lengths = [
+        hypot(contour[i][0] - contour[i - 1][0], contour[i][1] - contour[i - 1][1])
+        for i in range(len(contour))
+    ]
+    perimeter = sum(lengths)
+    if perimeter <= 0 or pitch <= 0:
+        return []
+
+    count = max(1, int(round(perimeter / pitch)))
+    pitch = perimeter / count
+    position = phase % pitch
+    points = []
+    walked = 0.0
+    # Edge i goes from corner i - 1 to corner i
+    for i, length in enumerate(lengths):
+        (x1, y1), (x2, y2) = contour[i - 1], contour[i]
+        while position < walked + length and len(points) < count:
+            t = (position - walked) / length
+            points.append((x1 + (x2 - x1) * t, y1 + (y2 - y1) * t))
+            position += pitch
+        walked += length
+    return points
+
+
+def spiral_turns(cx, cy, pitch, spacing, radius):
+    """Generate points along an Archimedean spiral centred on (cx, cy), a turn at a time.
+
+    Parameters:
+        cx, cy (float): Spiral center
+        pitch (float): Distance between points along the spiral
+        spacing (float): Distance between turns
+        radius (float): The spiral ends once it gets farther than radius from the center
+
+    Returns:
+        generator: (turn radius, [(x, y), ...]) tuples, from the center outwards
+    """
+
+    # r = b * angle grows by spacing every turn
+    b = spacing / tau
+    angle = 0.0
+    turn = 1
+    points = []
+    while True:
+        r = b * angle
+        if r > radius:
+            break
+        if angle >= turn * tau:
+            yield r, points
+            points = []
+            turn += 1
+        points.append((cx + r * cos(angle), cy + r * sin(angle)))
+        # Arc length step: ds = sqrt(r^2 + b^2) * d(angle)
+        angle += pitch / hypot(r, b)
+    yield radius, points
+
+
+class PolygonHitTester:
+    """Batched even-odd point in polygon test.
+
+    Contours are plain lists of (x, y) tuples (outlines and holes alike, the even-odd rule
+    sorts them out). Edges are bucketed into horizontal bands so a query only crosses the
+    edges of its own band, and points sharing the same y are resolved with a single pass
+    over the band: that's the common case for a via lattice.
+    """
+
+    def __init__(self, contours):
+        """Prepare the edge buckets.
+
+        Parameters:
+            contours (list): List of closed contours, each one a list of (x, y) tuples
+        """
+
+        edges = []
+        for contour in contours:
+            count = len(contour)
+            for i in range(count):
+                x1, y1 = contour[i - 1]
+                x2, y2 = contour[i]
+                if y1 != y2:
+                    edges.append((x1, y1, x2, y2))
+
+        self.edge_count = len(edges)
+        self.bands = []
+
+        if not edges:
+            self.top = self.bottom = 0
+            self.band_height = 1
+            return
+
+        self.top = min(min(e[1], e[3]) for e in edges)
+        self.bottom = max(max(e[1], e[3]) for e in edges)
+        band_count = max(1, int(sqrt(len(edges))))
+        self.band_height = max(1, (self.bottom - self.top) / band_count)
+        self.bands = [[] for _ in range(band_count)]
+
+        for edge in edges:
+            first = self.BandOf(min(edge[1], edge[3]))
+            last = self.BandOf(max(edge[1], edge[3]))
+            for band in range(first, last + 1):
+                self.bands[band].append(edge)
+
+    def BandOf(self, y):
+        """Return the index of the band holding ordinate y (clamped to the valid range)."""
+
+        band = int((y - self.top) // self.band_height)
+        return min(max(band, 0), len(self.bands) - 1)
+
+    def Crossings(self, y):
+        """Return the sorted abscissas where the horizontal line at y crosses the contours."""
+
+        if not self.bands or y < self.top or y > self.bottom:
+            return []
+
+        xs = []
+        for x1, y1, x2, y2 in self.bands[self.BandOf(y)]:
+            if (y1 > y) != (y2 > y):
+                xs.append(x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+        xs.sort()
+        return xs
+
+    def Intervals(self, y):
+        """Return the ranges of the horizontal line at y lying inside the contours.
+
+        Returns:
+            list: Sorted [start, end) ranges, the same rule of Contains applies to their ends
+        """
+
+        crossings = self.Crossings(y)
+        count = len(crossings)
+        intervals = []
+        for i in range(count):
+            # Points in [crossings[i - 1], crossings[i]) have count - i crossings on their
+            # right side
+            if (count - i) % 2:
+                intervals.append((crossings[i - 1] if i else -inf, crossings[i]))
+        return intervals
+
+    def Contains(self, points):
+        """Test a batch of points.
+
+        Parameters:
+            points (list): List of (x, y) tuples
+
+        Returns:
+            list: One bool per point, True if the point lies inside the contours.
+        """
+
+        result = [False] * len(points)
+        rows = {}
+        for i, (x, y) in enumerate(points):
+            rows.setdefault(y, []).append(i)
+
+        for y, indexes in rows.items():
+            crossings = self.Crossings(y)
+            if not crossings:
+                continue
+            for i in indexes:
+                # Odd number of crossings on the right side: point is inside
+                if (len(crossings) - bisect_right(crossings, points[i][0])) % 2:
+                    result[i] = True
+
+        return result
+
+
+# OccupancyMask pixel values, regions use the values in between
+MASK_FREE = 0
+MASK_BOUNDARY = 255
+
+
+class OccupancyMask:
+    """Raster of the regions (e.g. zone fillings and keepouts) a via can't be placed in.
+
+    Every pixel is either free (no region touches it), fully covered by a region (the
+    region value is stored) or crossed by a region edge (boundary): the first two answer
+    a lookup right away, only boundary pixels need an exact test. Regions may be grown by
+    a margin, a point is then inside if it's inside the region or closer than margin to
+    its edges.
+    """
+
+    def __init__(self, bbox, pixel, max_pixels=1 << 22):
+        """Initialize a free mask.
+
+        Parameters:
+            bbox (tuple): Rasterized rectangle as (left, top, right, bottom)
+            pixel (float): Pixel side, grown if the mask would exceed max_pixels
+            max_pixels (int): Largest number of pixels
+        """
+
+        left, top, right, bottom = bbox
+        width = max(1, right - left)
+        height = max(1, bottom - top)
+        self.pixel = max(1, pixel, sqrt(float(width) * float(height) / max_pixels))
+        self.left = left
+        self.top = top
+        self.columns = int(width // self.pixel) + 1
+        self.rows = int(height // self.pixel) + 1
+        self.cells = bytearray(self.columns * self.rows)
+
+    def AddBox(self, left, top, right, bottom, margin=0):
+        """Mark the pixels of a rectangle (grown by margin) as boundary.
+
+        Cheaper than AddRegion, for regions too small to be worth rasterizing: points
+        falling there get the exact test.
+        """
+
+        pixel = self.pixel
+        columns = self.columns
+        column0 = max(0, int((left - margin - self.left) // pixel))
+        column1 = min(columns - 1, int((right + margin - self.left) // pixel))
+        row0 = max(0, int((top - margin - self.top) // pixel))
+        row1 = min(self.rows - 1, int((bottom + margin - self.top) // pixel))
+        if column0 > column1:
+            return
+        boundary = bytes([MASK_BOUNDARY]) * (column1 - column0 + 1)
+        for row in range(row0, row1 + 1):
+            start = row * columns
+            self.cells[start + column0 : start + column1 + 1] = boundary
+
+    def AddRegion(self, contours, value, margin=0, tester=None):
+        """Rasterize a region.
+
+        Parameters:
+            contours (list): Region contours (even-odd rule, see PolygonHitTester)
+            value (int): Value stored in covered pixels, between MASK_FREE and MASK_BOUNDARY
+            margin (float): Grow the region by margin
+            tester (PolygonHitTester): Hit tester of contours, if already built
+        """
+
+        pixel = self.pixel
+        left = self.left
+        top = self.top
+        columns = self.columns
+        cells = self.cells
+        boundary = bytes([MASK_BOUNDARY])
+
+        # Pixels closer than margin to an edge are boundary
+        for contour in contours:
+            for k in range(len(contour)):
+                x1, y1 = contour[k - 1]
+                x2, y2 = contour[k]
+                row0 = max(0, int((min(y1, y2) - margin - top) // pixel))
+                row1 = min(self.rows - 1, int((max(y1, y2) + margin - top) // pixel))
+                for row in range(row0, row1 + 1):
+                    # Part of the edge within margin of the row band
+                    band_top = top + row * pixel - margin
+                    band_bottom = band_top + pixel + 2 * margin
+                    if y1 == y2:
+                        xa, xb = x1, x2
+                    else:
+                        ta = (band_top - y1) / (y2 - y1)
+                        tb = (band_bottom - y1) / (y2 - y1)
+                        ta, tb = max(0.0, min(ta, tb)), min(1.0, max(ta, tb))
+                        xa = x1 + (x2 - x1) * ta
+                        xb = x1 + (x2 - x1) * tb
+                    column0 = max(0, int((min(xa, xb) - margin - left) // pixel))
+                    column1 = min(columns - 1, int((max(xa, xb) + margin - left) // pixel))
+                    if column0 <= column1:
+                        start = row * columns
+                        cells[start + column0 : start + column1 + 1] = boundary * (
+                            column1 - column0 + 1
+                        )
+
+        # Other pixels are either fully in or fully out: their center tells
+        ys = [y for contour in contours for x, y in contour]
+        if not ys:
+            return
+        if tester is None:
+            tester = PolygonHitTester(contours)
+        free = bytes([MASK_FREE])
+        covered = bytes([value])
+        row0 = max(0, int((min(ys) - top) // pixel))
+        row1 = min(self.rows - 1, int((max(ys) - top) // pixel))
+        for row in range(row0, row1 + 1):
+            y = top + (row + 0.5) * pixel
+            start = row * columns
+            for xa, xb in tester.Intervals(y):
+                xa = max(xa, left - pixel)
+                xb = min(xb, left + (columns + 1) * pixel)
+                column0 = max(0, ceil((xa - left) / pixel - 0.5))
+                column1 = min(columns, ceil((xb - left) / pixel - 0.5))
+                if column0 < column1:
+                    span = cells[start + column0 : start + column1]
+                    cells[start + column0 : start + column1] = span.replace(free, covered)
+
+    def Lookup(self, x, y):
+        """Return the value of the pixel holding (x, y), MASK_BOUNDARY out of the mask."""
+
+        column = int((x - self.left) // self.pixel)
+        row = int((y - self.top) // self.pixel)
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            return self.cells[row * self.columns + column]
+        return MASK_BOUNDARY
+
+
+def segment_distance(px, py, x1, y1, x2, y2):
+    """Return the distance between point (px, py) and segment (x1, y1)-(x2, y2).
+
+    Same result as pnt2line (projection of the point clamped to the segment ends).
+    """
+
+    dx = x2 - x1
+    dy = y2 - y1
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return hypot(px - x1, py - y1)
+    t = ((px - x1) * dx + (py - y1) * dy) / length_sq
+    if t < 0.0:
+        t = 0.0
+    elif t > 1.0:
+        t = 1.0
+    return hypot(px - x1 - t * dx, py - y1 - t * dy)
+
+
+def rect_segment_distance(left, top, right, bottom, x1, y1, x2, y2):
+    """Return the distance between a rectangle and a segment, 0 if they intersect."""
+
+    # Clip the segment against the rectangle (Liang-Barsky)
+    dx = x2 - x1
+    dy = y2 - y1
+    t0 = 0
+    t1 = 1
+    for p, q in ((-dx, x1 - left), (dx, right - x1), (-dy, y1 - top), (dy, bottom - y1)):
+        if p == 0:
+            if q < 0:
+                break
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                break
+    else:
+        return 0
+
+    # Apart: the closest points are a segment end or a rectangle corner
+    ends = [
+        hypot(max(left - x, 0, x - right), max(top - y, 0, y - bottom))
+        for x, y in ((x1, y1), (x2, y2))
+    ]
+    corners = [
+        segment_distance(x, y, x1, y1, x2, y2) for x in (left, right) for y in (top, bottom)
+    ]
+    return min(ends + corners)
+
+
+class SegmentSet:
+    """Batched point to segments distance queries.
+
+    Segments are stored in a SpatialIndex so a bounded query only has to measure the
+    segments lying around each point instead of every edge of the outline.
+    """
+
+    def __init__(self, segments):
+        """Index segments.
+
+        Parameters:
+            segments (list): List of ((x1, y1), (x2, y2)) tuples
+        """
+
+        self.segments = [(x1, y1, x2, y2) for (x1, y1), (x2, y2) in segments]
+
+        if self.segments:
+            xs = [s[0] for s in self.segments] + [s[2] for s in self.segments]
+            ys = [s[1] for s in self.segments] + [s[3] for s in self.segments]
+            cell_size = grid_cell_size(
+                max(xs) - min(xs), max(ys) - min(ys), len(self.segments)
+            )
+        else:
+            cell_size = 1
+
+        self.index = SpatialIndex(cell_size)
+        for segment in self.segments:
+            x1, y1, x2, y2 = segment
+            self.index.Insert(segment, min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+    @staticmethod
+    def Closed(corners):
+        """Build the segment set of a closed polyline given its corners."""
+
+        if len(corners) < 2:
+            return SegmentSet([])
+
+        return SegmentSet((corners[i - 1], corners[i]) for i in range(len(corners)))
+
+    def MinDistances(self, points, limit=None):
+        """Compute the distance from every point to the nearest segment.
+
+        Parameters:
+            points (list): List of (x, y) tuples
+            limit (float): If given only segments closer than limit are measured, points
+                with no segment in range get `inf`
+
+        Returns:
+            list: One distance per point
+        """
+
+        distances = []
+
+        for px, py in points:
+            if limit is None:
+                nearby = self.segments
+            else:
+                nearby = self.index.Query(px - limit, py - limit, px + limit, py + limit)
+            best = inf
+            for x1, y1, x2, y2 in nearby:
+                distance = segment_distance(px, py, x1, y1, x2, y2)
+                if distance < best:
+                    best = distance
+            distances.append(best)
+
+        return distances
+
+    def Clear(self, points, clearance):
+        """Check a batch of points against clearance.
+
+        Returns:
+            list: One bool per point, True if the point is farther than clearance from every segment.
+        """
+
+        return [
+            distance > clearance
+            for distance in self.MinDistances(points, limit=clearance)
+        ]
+
+
+def arc_distance(px, py, arc):
+    """Return the distance between point (px, py) and a circular arc.
+
+    Parameters:
+        arc (tuple): (cx, cy, radius, start_angle, sweep, x1, y1, x2, y2) as built by
+            arc_from_points, the arc runs counterclockwise from start_angle by sweep
+
+    Returns:
+        float: Distance from the point to the arc
+    """
+
+    cx, cy, radius, start, sweep, x1, y1, x2, y2 = arc
+    angle = atan2(py - cy, px - cx)
+    if (angle - start) % tau <= sweep:
+        return abs(hypot(px - cx, py - cy) - radius)
+    return min(hypot(px - x1, py - y1), hypot(px - x2, py - y2))
+
+
+def arc_from_points(start, mid, end, center, radius):
+    """Describe the arc going from start to end through mid (see arc_distance)."""
+
+    a_start = atan2(start[1] - center[1], start[0] - center[0])
+    a_mid = atan2(mid[1] - center[1], mid[0] - center[0])
+    a_end = atan2(end[1] - center[1], end[0] - center[0])
+    sweep = (a_end - a_start) % tau
+
+    if (a_mid - a_start) % tau <= sweep:
+        return (center[0], center[1], radius, a_start, sweep) + tuple(start) + tuple(end)
+
+    # Clockwise arc: walk it counterclockwise from the other end
+    return (
+        (center[0], center[1], radius, a_end, (a_start - a_end) % tau)
+        + tuple(start)
+        + tuple(end)
+    )
+
+
+class aVector:
+    def __init__(self, point):
+        if isinstance(point, list):
+            self.x = point[0]
+            self.y = point[1]
+        else:
+            self.x = float(point.x)
+            self.y = float(point.y)
+
+    def __sub__(self, other):
+        return aVector([self.x - float(other.x), self.y - float(other.y)])
+
+    def __mul__(self, other):
+        return aVector([self.x * float(other), self.y * float(other)])
+
+    def __add__(self, other):
+        return aVector([self.x + float(other.x), self.y + float(other.y)])
+
+    def __truediv__(self, other):
+        return aVector([self.x / other, self.y / other])
+
+    @staticmethod
+    def norm(vector):
+        return sqrt(pow(vector.x, 2) + pow(vector.y, 2))
+
+    @staticmethod
+    def dot(vector1, vector2):
+        return vector1.x * vector2.x + vector1.y * vector2.y
+
+
+# Given a line with coordinates 'start' and 'end' and the
+# coordinates of a point 'point' the proc returns the shortest
+# distance from pnt to the line and the coordinates of the
+# nearest point on the line.
+#
+# 1  Convert the line segment to a vector ('line_vec').
+# 2  Create a vector connecting start to pnt ('pnt_vec').
+# 3  Find the length of the line vector ('line_len').
+# 4  Convert line_vec to a unit vector ('line_unitvec').
+# 5  Scale pnt_vec by line_len ('pnt_vec_scaled').
+# 6  Get the dot product of line_unitvec and pnt_vec_scaled ('t').
+# 7  Ensure t is in the range 0 to 1.
+# 8  Use t to get the nearest location on the line to the end
+#    of vector pnt_vec_scaled ('nearest').
+# 9  Calculate the distance from nearest to pnt_vec_scaled.
+# 10 Translate nearest back to the start/end line.
+# Malcolm Kesson 16 Dec 2012
+def pnt2line(point, start, end):
+    pnt = vector([point.x, point.y])
+    strt = vector([start.x, start.y])
+    nd = vector([end.x, end.y])
+    line_vec = nd - strt
+    pnt_vec = pnt - strt
+    line_len = norm(line_vec)
+    line_unitvec = line_vec / line_len
+    pnt_vec_scaled = pnt_vec / line_len
+    t = dot(line_unitvec, pnt_vec_scaled)
+    if t < 0.0:
+        t = 0.0
+    elif t > 1.0:
+        t = 1.0
+    nearest = line_vec * t
+    dist = norm(pnt_vec - nearest)
+    nearest = nearest + strt
+    return dist, nearest
+
+
+norm = aVector.norm
+vector = aVector
+dot = aVector.dot
@@ -36,15 +36,23 @@ class viastitching_gui ( wx.Dialog ):
 		fgOptionsSizer.Add( self.m_lblNetName, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL|wx.ALIGN_RIGHT, 5 )
 
 		m_cbNetChoices = []
-		self.m_cbNet = wx.ComboBox( self, wx.ID_ANY, wx.EmptyString, wx.DefaultPosition, wx.DefaultSize, m_cbNetChoices, wx.CB_DROPDOWN|wx.CB_READONLY|wx.CB_SORT )
+		self.m_cbNet = wx.ComboBox( self, wx.ID_ANY, wx.EmptyString, wx.DefaultPosition, wx.DefaultSize, m_cbNetChoices, wx.CB_DROPDOWN|wx.CB_SORT )
 		fgOptionsSizer.Add( self.m_cbNet, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL|wx.EXPAND, 5 )
 
+		self.m_lblZones = wx.StaticText( self, wx.ID_ANY, _(u"Zones"), wx.DefaultPosition, wx.DefaultSize, wx.ALIGN_RIGHT )
+		self.m_lblZones.Wrap( -1 )
+
+		fgOptionsSizer.Add( self.m_lblZones, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALIGN_RIGHT|wx.ALL, 5 )
+
+		self.m_chkAllZones = wx.CheckBox( self, wx.ID_ANY, _(u"All zones on this net"), wx.DefaultPosition, wx.DefaultSize, 0 )
+		fgOptionsSizer.Add( self.m_chkAllZones, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
+
 		self.m_lblPattern = wx.StaticText( self, wx.ID_ANY, _(u"Via Pattern"), wx.DefaultPosition, wx.DefaultSize, wx.ALIGN_RIGHT )
 		self.m_lblPattern.Wrap( -1 )
 
 		fgOptionsSizer.Add( self.m_lblPattern, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALIGN_RIGHT|wx.ALL, 5 )
 
-		m_cbPatternChoices = [ _(u"Grid"), _(u"Star") ]
+		m_cbPatternChoices = [ _(u"Grid"), _(u"Star"), _(u"Hex"), _(u"Spiral"), _(u"Fence") ]
 		self.m_cbPattern = wx.ComboBox( self, wx.ID_ANY, _(u"Grid"), wx.DefaultPosition, wx.DefaultSize, m_cbPatternChoices, wx.CB_DROPDOWN|wx.CB_READONLY )
 		self.m_cbPattern.SetSelection( 0 )
 		fgOptionsSizer.Add( self.m_cbPattern, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL|wx.EXPAND, 5 )
@@ -136,6 +144,14 @@ class viastitching_gui ( wx.Dialog ):
 
 		bMainSizer.Add( fgOptionsSizer, 0, wx.EXPAND|wx.ALL, 5 )
 
+		self.m_pnlPreview = wx.Panel( self, wx.ID_ANY, wx.DefaultPosition, wx.Size( 320,200 ), wx.BORDER_SUNKEN|wx.TAB_TRAVERSAL )
+		bMainSizer.Add( self.m_pnlPreview, 0, wx.ALIGN_CENTER_HORIZONTAL|wx.ALL, 5 )
+
+		self.m_lblPreview = wx.StaticText( self, wx.ID_ANY, _(u"Preview"), wx.DefaultPosition, wx.DefaultSize, 0 )
+		self.m_lblPreview.Wrap( -1 )
+
+		bMainSizer.Add( self.m_lblPreview, 0, wx.ALIGN_CENTER_HORIZONTAL|wx.ALL, 5 )
+
 		self.staticHLine1 = wx.StaticLine( self, wx.ID_ANY, wx.DefaultPosition, wx.DefaultSize, wx.LI_HORIZONTAL )
 		bMainSizer.Add( self.staticHLine1, 0, wx.EXPAND |wx.ALL, 5 )
 
@@ -153,6 +169,16 @@ class viastitching_gui ( wx.Dialog ):
 
 		bHSizer5.Add( self.m_chkRemoveAll, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
 
+		self.m_chkStats = wx.CheckBox( self, wx.ID_ANY, _(u"Statistics"), wx.DefaultPosition, wx.DefaultSize, 0 )
+		self.m_chkStats.SetToolTip( _(u"Report timings and rejected candidates of the fill") )
+
+		bHSizer5.Add( self.m_chkStats, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
+
+		self.m_chkRefill = wx.CheckBox( self, wx.ID_ANY, _(u"Refill zones"), wx.DefaultPosition, wx.DefaultSize, 0 )
+		self.m_chkRefill.SetToolTip( _(u"Refill the target areas and the zones touching the added or removed vias, so the board is ready for DRC") )
+
+		bHSizer5.Add( self.m_chkRefill, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
+
 
 		bMainSizer.Add( bHSizer5, 0, wx.ALIGN_CENTER_HORIZONTAL|wx.ALIGN_CENTER_VERTICAL, 5 )
 
@@ -161,6 +187,14 @@ class viastitching_gui ( wx.Dialog ):
 
 		bHSizer6 = wx.BoxSizer( wx.HORIZONTAL )
 
+		self.m_btnOptimize = wx.Button( self, wx.ID_ANY, _(u"Optimi&ze offset"), wx.DefaultPosition, wx.DefaultSize, 0 )
+		self.m_btnOptimize.SetToolTip( _(u"Try a grid of offsets (and the Grid and Star patterns) and keep the one placing the most vias") )
+
+		bHSizer6.Add( self.m_btnOptimize, 0, wx.ALIGN_CENTER|wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
+
+		self.m_btnApplyPlan = wx.Button( self, wx.ID_ANY, _(u"Apply &plan..."), wx.DefaultPosition, wx.DefaultSize, 0 )
+		bHSizer6.Add( self.m_btnApplyPlan, 0, wx.ALIGN_CENTER|wx.ALIGN_CENTER_VERTICAL|wx.ALL, 5 )
+
 		self.m_btnOk = wx.Button( self, wx.ID_ANY, _(u"&Ok"), wx.DefaultPosition, wx.DefaultSize, 0 )
 
 		self.m_btnOk.SetDefault()
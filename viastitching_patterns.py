@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Via patterns: each one lazily generates the candidate positions covering an area, the
+# placement engine runs them through the same filters whatever the pattern
+# (c) Michele Santucci 2019
+#
+
+from math import hypot, inf, sqrt
+
+try:
+    from .viastitching_geometry import (
+        SegmentSet,
+        contour_points,
+        inset_contours,
+        intersect_intervals,
+        lattice_spans,
+        span_points,
+        spiral_turns,
+    )
+except ImportError:
+    # Loaded outside the plugin package (command line, benchmarks)
+    from viastitching_geometry import (
+        SegmentSet,
+        contour_points,
+        inset_contours,
+        intersect_intervals,
+        lattice_spans,
+        span_points,
+        spiral_turns,
+    )
+
+
+class Pattern:
+    """Base class of the via patterns.
+
+    A pattern generates candidate positions inside the filled area, the engine then
+    filters them (tiles, edge clearance, overlap and, if spacing is set, distance from
+    the vias accepted before).
+    """
+
+    # Re-stitching can recompute single tiles (see PlacementEngine.Restitch), patterns
+    # whose positions depend on the whole area are recomputed at once
+    tiled = True
+
+    def __init__(self, engine):
+        """Bind the pattern to an engine.
+
+        Parameters:
+            engine (PlacementEngine): Engine providing area, settings and zone tests
+        """
+
+        self.engine = engine
+        self.area = engine.area
+        self.settings = engine.settings
+        # Smallest distance between two new vias, None if the pattern never gets closer
+        # than its pitch
+        self.spacing = None
+
+    def Batches(self, rows, tiles=None):
+        """Generate the candidate positions inside the filled area, a batch at a time.
+
+        Parameters:
+            rows (int): Batch size, in lattice rows or pattern specific units
+            tiles (set): Positions outside these tiles (see TileOf) may be skipped, the
+                engine filters them anyway
+
+        Returns:
+            generator: (progress, points, count) tuples, progress goes from 0 to 1 and
+                count is the number of generated positions, inside the area or not
+        """
+
+        raise NotImplementedError
+
+    def Lattice(self):
+        """Return the lattice origin and pitch (see on_lattice), None if not a lattice."""
+
+        return None
+
+
+class GridPattern(Pattern):
+    """Uniform grid."""
+
+    star = False
+
+    def Pitch(self):
+        """Return the lattice pitch as (step_x, step_y)."""
+
+        return self.settings.step_x, self.settings.step_y
+
+    def Lattice(self):
+        settings = self.settings
+        left, top = self.area.bbox[:2]
+        step_x, step_y = self.Pitch()
+        return [
+            left,
+            top,
+            step_x,
+            step_y,
+            settings.offset_x,
+            settings.offset_y,
+            self.star,
+        ]
+
+    def Batches(self, rows, tiles=None):
+        """Generate the lattice points lying inside the filled area a few rows at a time.
+
+        Every lattice row is intersected with the edges of the filled area (merged across
+        layers if possible, see PlacementEngine.CopperTesters and
+        PolygonHitTester.Intervals) and only points inside the resulting ranges are
+        generated: work follows the filled area rather than its bounding box, so thin,
+        ring shaped or heavily cut out zones cost little. Rows crossing none of the tiles
+        are skipped altogether (and not counted).
+        """
+
+        right, bottom = self.area.bbox[2:]
+        left, top, step_x, step_y, offset_x, offset_y, star = self.Lattice()
+        total = max(1, int((bottom - top - offset_y) // step_y) + 1)
+        testers = self.engine.CopperTesters()
+        bands = None
+        if tiles is not None:
+            height = self.engine.TileSize()[1]
+            bands = set(int(key.split(",")[1]) for key in tiles)
+        points = []
+        count = 0
+        row = 0
+        for y, x0, span in lattice_spans(
+            left, top, right, bottom, step_x, step_y, offset_x, offset_y, star
+        ):
+            if bands is None or (y - top) // height in bands:
+                count += span
+                intervals = [(-inf, inf)]
+                for tester in testers:
+                    intervals = intersect_intervals(intervals, tester.Intervals(y))
+                    if not intervals:
+                        break
+                if intervals:
+                    points.extend(
+                        (x, y) for x in span_points(x0, step_x, span, intervals)
+                    )
+            row += 1
+            if row % rows == 0:
+                yield min(1.0, row / total), points, count
+                points = []
+                count = 0
+        yield 1.0, points, count
+
+
+class StarPattern(GridPattern):
+    """Grid with every second row shifted by half the horizontal pitch."""
+
+    star = True
+
+
+class HexPattern(StarPattern):
+    """Hexagonal packing: every via is X spacing away from its six neighbours.
+
+    Rows are sqrt(3) / 2 X spacing apart, Y spacing is not used.
+    """
+
+    def Pitch(self):
+        step_x = self.settings.step_x
+        return step_x, max(1, int(round(step_x * sqrt(3) / 2)))
+
+
+class SpiralPattern(Pattern):
+    """Archimedean spiral from the center of the area outwards.
+
+    Vias are X spacing apart along the spiral and turns are Y spacing apart, the offset
+    moves the center away from the middle of the area.
+    """
+
+    def Batches(self, rows, tiles=None):
+        settings = self.settings
+        left, top, right, bottom = self.area.bbox
+        cx = (left + right) / 2 + settings.offset_x
+        cy = (top + bottom) / 2 + settings.offset_y
+        radius = max(hypot(x - cx, y - cy) for x in (left, right) for y in (top, bottom))
+
+        points = []
+        turns = 0
+        for r, turn in spiral_turns(cx, cy, settings.step_x, settings.step_y, radius):
+            for x, y in turn:
+                if left <= x <= right and top <= y <= bottom:
+                    points.append((int(round(x)), int(round(y))))
+            turns += 1
+            if turns % rows == 0:
+                yield min(1.0, (r / radius) ** 2), self.engine.InZone(points), len(points)
+                points = []
+        yield 1.0, self.engine.InZone(points), len(points)
+
+
+class FencePattern(Pattern):
+    """Single row of vias following the area outline, e.g. an RF shielding fence.
+
+    Vias are X spacing apart along the outline moved inwards by the edge clearance (or
+    by the via radius, whichever is bigger), the X offset shifts them along it. Holes of
+    the outline get their own row, moved outwards. The cost only depends on the outline
+    length.
+    """
+
+    tiled = False
+
+    def __init__(self, engine):
+        super().__init__(engine)
+        # Shifted corners may bring vias closer than X spacing
+        self.spacing = self.settings.via_size + engine.clearance
+
+    def Batches(self, rows, tiles=None):
+        settings = self.settings
+        # One unit more so that edge clearance checks pass despite rounding
+        inset = max(settings.edge_clearance, settings.via_size / 2) + 1
+        contours = self.area.outline or [self.area.corners]
+        points = [
+            (int(round(x)), int(round(y)))
+            for contour in inset_contours(contours, inset)
+            for x, y in contour_points(contour, settings.step_x, settings.offset_x)
+        ]
+        # Where the outline is narrower than the inset the moved edges fold over, the
+        # points there are too close to the outline
+        edges = SegmentSet(
+            (contour[i - 1], contour[i])
+            for contour in contours
+            for i in range(len(contour))
+        )
+        keep = edges.Clear(points, inset - 1)
+        clear = [point for point, ok in zip(points, keep) if ok]
+        yield 1.0, self.engine.InZone(clear), len(points)
+
+
+PATTERNS = {
+    "Grid": GridPattern,
+    "Star": StarPattern,
+    "Hex": HexPattern,
+    "Spiral": SpiralPattern,
+    "Fence": FencePattern,
+}
+
+
+def GetPattern(name):
+    """Return the pattern class registered as name.
+
+    Raises:
+        ValueError: If there's no such pattern
+    """
+
+    try:
+        return PATTERNS[name]
+    except KeyError:
+        raise ValueError("unknown via pattern '%s'" % name)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Placement plans: the vias of a fill saved to a compact binary file, so that placement
+# can run headless (see viastitching_cli) and be applied to a board later in one go (see
+# viastitching_board.ApplyPlan). No pcbnew nor wx dependency.
+# (c) Michele Santucci 2019
+#
+# File layout, little endian: the magic and version number, the number of entries, then
+# for every entry via size and drill size, the lengths of net name, layer list and
+# position list, the net name (UTF-8), the layer names (UTF-8, newline separated) and the
+# positions as a flat array of 64 bit x, y pairs.
+
+import struct
+import sys
+
+from array import array
+
+PLAN_MAGIC = b"VSPLAN"
+PLAN_VERSION = 1
+
+_header = struct.Struct("<6sHI")
+_entry = struct.Struct("<qqIII")
+
+
+class PlanEntry:
+    """Vias of a single area in a placement plan."""
+
+    __slots__ = ("netname", "layers", "via_size", "drill_size", "positions")
+
+    def __init__(self, netname, layers, via_size, drill_size, positions):
+        """Initialize the record.
+
+        Parameters:
+            netname (str): Via net
+            layers (list): Via layer names (as shown by pcbnew, e.g. "F.Cu")
+            via_size (int): Via size
+            drill_size (int): Via drill size
+            positions (list): Via positions as (x, y) tuples
+        """
+
+        self.netname = netname
+        self.layers = layers
+        self.via_size = via_size
+        self.drill_size = drill_size
+        self.positions = positions
+
+
+def WritePlan(filename, entries):
+    """Save a placement plan.
+
+    Parameters:
+        filename (str): Plan file
+        entries (list): PlanEntry records
+    """
+
+    with open(filename, "wb") as plan_file:
+        plan_file.write(_header.pack(PLAN_MAGIC, PLAN_VERSION, len(entries)))
+        for entry in entries:
+            netname = entry.netname.encode("utf-8")
+            layers = "\n".join(entry.layers).encode("utf-8")
+            coordinates = array("q", (c for position in entry.positions for c in position))
+            if sys.byteorder == "big":
+                coordinates.byteswap()
+            plan_file.write(
+                _entry.pack(
+                    entry.via_size,
+                    entry.drill_size,
+                    len(netname),
+                    len(layers),
+                    len(entry.positions),
+                )
+            )
+            plan_file.write(netname)
+            plan_file.write(layers)
+            plan_file.write(coordinates.tobytes())
+
+
+def ReadPlan(filename):
+    """Load a placement plan.
+
+    Parameters:
+        filename (str): Plan file
+
+    Returns:
+        list: PlanEntry records
+
+    Raises:
+        ValueError: If the file is not a placement plan or it is truncated
+    """
+
+    with open(filename, "rb") as plan_file:
+        data = plan_file.read()
+
+    try:
+        magic, version, count = _header.unpack_from(data, 0)
+    except struct.error:
+        raise ValueError("not a via placement plan")
+    if magic != PLAN_MAGIC:
+        raise ValueError("not a via placement plan")
+    if version != PLAN_VERSION:
+        raise ValueError("unsupported plan version %d" % version)
+
+    entries = []
+    offset = _header.size
+    try:
+        for i in range(count):
+            via_size, drill_size, name_length, layers_length, positions = (
+                _entry.unpack_from(data, offset)
+            )
+            offset += _entry.size
+            netname = data[offset : offset + name_length].decode("utf-8")
+            offset += name_length
+            layers = data[offset : offset + layers_length].decode("utf-8")
+            offset += layers_length
+            if offset + 16 * positions > len(data):
+                raise ValueError("truncated via placement plan")
+            coordinates = array("q")
+            coordinates.frombytes(data[offset : offset + 16 * positions])
+            offset += 16 * positions
+            if sys.byteorder == "big":
+                coordinates.byteswap()
+            entries.append(
+                PlanEntry(
+                    netname,
+                    layers.split("\n") if layers else [],
+                    via_size,
+                    drill_size,
+                    list(zip(coordinates[0::2], coordinates[1::2])),
+                )
+            )
+    except (struct.error, UnicodeDecodeError):
+        raise ValueError("truncated via placement plan")
+
+    return entries
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+
+# ViaStitching for pcbnew
+# Geometry snapshot: reads the board once through pcbnew and stores what the placement
+# engine needs into plain records (see viastitching_engine)
+# (c) Michele Santucci 2019
+#
+
+import pcbnew
+
+try:
+    from .viastitching_engine import (
+        ARC,
+        KEEPOUT,
+        PAD,
+        STITCH,
+        TRACK,
+        VIA,
+        ZONE,
+        AreaSnapshot,
+        Obstacle,
+    )
+    from .viastitching_geometry import SpatialIndex, arc_from_points, grid_cell_size
+except ImportError:
+    # Loaded outside the plugin package (command line, benchmarks)
+    from viastitching_engine import (
+        ARC,
+        KEEPOUT,
+        PAD,
+        STITCH,
+        TRACK,
+        VIA,
+        ZONE,
+        AreaSnapshot,
+        Obstacle,
+    )
+    from viastitching_geometry import SpatialIndex, arc_from_points, grid_cell_size
+
+# Largest deviation of the arcs rounding the corners of inset outlines from a true arc
+__maxerror__ = getattr(pcbnew, "ARC_HIGH_DEF", 5000)
+# Board items inspected by each batch of SnapshotBatches
+__snapshotbatch__ = 2000
+
+
+def box_tuple(bbox):
+    """Convert a pcbnew.BOX2I into a (left, top, right, bottom) tuple."""
+
+    return (bbox.GetLeft(), bbox.GetTop(), bbox.GetRight(), bbox.GetBottom())
+
+
+def poly_set_contours(poly_set):
+    """Convert a pcbnew.SHAPE_POLY_SET into plain contours.
+
+    Parameters:
+        poly_set (pcbnew.SHAPE_POLY_SET): Polygon set (e.g. a zone filling)
+
+    Returns:
+        list: Outlines and holes, each one a list of (x, y) tuples
+    """
+
+    contours = []
+
+    for i in range(poly_set.OutlineCount()):
+        chains = [poly_set.Outline(i)]
+        chains += [poly_set.Hole(i, j) for j in range(poly_set.HoleCount(i))]
+        for chain in chains:
+            contour = []
+            for j in range(chain.PointCount()):
+                point = chain.CPoint(j)
+                contour.append((point.x, point.y))
+            contours.append(contour)
+
+    return contours
+
+
+def InsetContours(area, distance):
+    """Shrink the outline of area by distance.
+
+    Parameters:
+        area (pcbnew.ZONE): Area
+        distance (int): Inset, corners are rounded
+
+    Returns:
+        list: Contours of the inset outline (see poly_set_contours) or None if pcbnew
+            can't deflate polygons
+    """
+
+    outline = pcbnew.SHAPE_POLY_SET(area.Outline())
+    try:
+        outline.Deflate(
+            int(distance), pcbnew.CORNER_STRATEGY_ROUND_ALL_CORNERS, __maxerror__
+        )
+    except (AttributeError, TypeError):
+        return None
+    return poly_set_contours(outline)
+
+
+def CopperContours(area, layers):
+    """Intersect the fillings of area on all its layers.
+
+    A through via must land on copper on every layer, the intersection lets the placement
+    engine test candidates against a single shape instead of one per layer.
+
+    Parameters:
+        area (pcbnew.ZONE): Area
+        layers (list): Copper layers of the area
+
+    Returns:
+        list: Contours of the intersection (see poly_set_contours) or None if pcbnew
+            can't intersect polygons
+    """
+
+    copper = None
+    for layer in layers:
+        filled = area.GetFilledPolysList(layer)
+        if copper is None:
+            copper = pcbnew.SHAPE_POLY_SET(filled)
+            continue
+        try:
+            copper.BooleanIntersection(filled)
+        except TypeError:
+            # Before KiCad 9 the polygon mode has to be given
+            try:
+                copper.BooleanIntersection(filled, pcbnew.SHAPE_POLY_SET.PM_FAST)
+            except (AttributeError, TypeError):
+                return None
+        except AttributeError:
+            return None
+    if copper is None:
+        return None
+    return poly_set_contours(copper)
+
+
+def SnapshotInset(area, snapshot, distance):
+    """Add the outline of area shrunk by distance to its snapshot, unless already there.
+
+    The placement engine then checks the edge clearance with a point in polygon test
+    (see PlacementEngine.CheckClearance).
+    """
+
+    if distance and distance not in snapshot.insets:
+        inset = InsetContours(area, distance)
+        if inset is not None:
+            snapshot.insets[distance] = inset
+
+
+def SnapshotArea(area, edge_clearance=0):
+    """Read the area to be filled.
+
+    Parameters:
+        area (pcbnew.ZONE): Area
+        edge_clearance (int): If given, the outline shrunk by it is read too
+
+    Returns:
+        AreaSnapshot: Area record
+    """
+
+    layers = list(area.GetLayerSet().Seq())
+    filled = {layer: poly_set_contours(area.GetFilledPolysList(layer)) for layer in layers}
+    corners = []
+    for i in range(0, area.GetNumCorners()):
+        corner = area.GetCornerPosition(i)
+        corners.append((corner.x, corner.y))
+
+    snapshot = AreaSnapshot(
+        area.GetNetname(),
+        area.GetLayer(),
+        layers,
+        box_tuple(area.GetBoundingBox()),
+        corners,
+        filled,
+        copper=filled[layers[0]] if len(layers) == 1 else CopperContours(area, layers),
+        outline=poly_set_contours(area.Outline()),
+    )
+    SnapshotInset(area, snapshot, edge_clearance)
+    return snapshot
+
+
+def NetClearance(board, netname):
+    """Return the clearance of the netclass of a net, 0 if the net is not found."""
+
+    net = board.FindNet(netname)
+    if net is None:
+        return 0
+    return net.GetNetClass().GetClearance()
+
+
+def ItemClearance(item, clearances):
+    """Return the clearance of a track or an arc, resolved by pcbnew once per net.
+
+    Parameters:
+        item (pcbnew.BOARD_CONNECTED_ITEM): Track or arc
+        clearances (dict): Clearances by net name resolved so far, updated
+    """
+
+    netname = item.GetNetname()
+    clearance = clearances.get(netname)
+    if clearance is None:
+        clearance = item.GetOwnClearance(item.GetLayer())
+        clearances[netname] = clearance
+    return clearance
+
+
+def SnapshotItem(item, bbox, layers, group_name=None, clearances=None):
+    """Read a single obstacle.
+
+    Parameters:
+        item (pcbnew.BOARD_ITEM): Track, arc, via, pad, zone or rule area
+        bbox (tuple): Item bounding box (see box_tuple)
+        layers (set): Layers zone fillings are read on
+        group_name (str): Vias of this group are read as STITCH obstacles
+        clearances (dict): Clearances of track nets (see ItemClearance)
+
+    Returns:
+        Obstacle: Obstacle record or None if item isn't a supported obstacle.
+    """
+
+    item_type = type(item)
+    if clearances is None:
+        clearances = {}
+
+    if item_type is pcbnew.PAD:
+        return Obstacle(PAD, bbox)
+    elif item_type is pcbnew.PCB_VIA:
+        # Stitching vias sit in the group itself or in one of its area groups
+        parent = item.GetParentGroup() if group_name is not None else None
+        while parent is not None:
+            if parent.GetName() == group_name:
+                position = item.GetPosition()
+                return Obstacle(
+                    STITCH,
+                    bbox,
+                    (position.x, position.y, item.GetWidth() / 2),
+                    item.GetNetname(),
+                )
+            parent = parent.GetParentGroup()
+        return Obstacle(VIA, bbox)
+    elif item_type is pcbnew.PCB_TRACK:
+        start = item.GetStart()
+        end = item.GetEnd()
+        return Obstacle(
+            TRACK,
+            bbox,
+            (start.x, start.y, end.x, end.y, item.GetWidth() / 2),
+            item.GetNetname(),
+            ItemClearance(item, clearances),
+        )
+    elif item_type is pcbnew.PCB_ARC:
+        start = item.GetStart()
+        mid = item.GetMid()
+        end = item.GetEnd()
+        center = item.GetCenter()
+        arc = arc_from_points(
+            (start.x, start.y),
+            (mid.x, mid.y),
+            (end.x, end.y),
+            (center.x, center.y),
+            item.GetRadius(),
+        )
+        return Obstacle(
+            ARC,
+            bbox,
+            arc + (item.GetWidth() / 2,),
+            item.GetNetname(),
+            ItemClearance(item, clearances),
+        )
+    elif item_type is pcbnew.ZONE:
+        if item.GetIsRuleArea():
+            if not item.GetDoNotAllowVias():
+                return None
+            return Obstacle(KEEPOUT, bbox, poly_set_contours(item.Outline()))
+        filled = {}
+        for layer in layers:
+            if item.IsOnLayer(layer):
+                filled[layer] = poly_set_contours(item.GetFilledPolysList(layer))
+        if not filled:
+            return None
+        return Obstacle(ZONE, bbox, filled, item.GetNetname())
+
+    return None
+
+
+def SnapshotBatches(board, areas, group=None, size=__snapshotbatch__):
+    """Collect overlapping items a batch at a time.
+    Every item found inside the bounding box of one of the areas is a candidate to be
+    inspected for overlapping: tracks, arcs and vias, the pads of footprints, zones and
+    rule areas forbidding vias. Track and arc clearances are resolved once per net.
+    The collection is shared by all the areas, each item is read only once.
+
+    The caller gets back control every size board items, so that reading a big board
+    can be spread over time (see the preview of viastitching_dialog) and dropped.
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        areas (list): Areas to be filled (pcbnew.ZONE)
+        group (pcbnew.PCB_GROUP): Via stitching group (see viastitching_board)
+        size (int): Board items inspected by each batch
+
+    Returns:
+        generator: (progress, batch) pairs, progress grows up to 1 and batch is the
+        list of obstacle records found since the previous pair. Nothing is generated if
+        there are no areas
+    """
+
+    if not areas:
+        return
+
+    area_boxes = [box_tuple(area.GetBoundingBox()) for area in areas]
+    layers = set(area.GetLayer() for area in areas)
+
+    left = min(box[0] for box in area_boxes)
+    top = min(box[1] for box in area_boxes)
+    right = max(box[2] for box in area_boxes)
+    bottom = max(box[3] for box in area_boxes)
+    area_index = SpatialIndex(
+        grid_cell_size(right - left, bottom - top, len(area_boxes))
+    )
+    for box in area_boxes:
+        area_index.Insert(box, *box)
+
+    def overlapping(item):
+        bbox = box_tuple(item.GetBoundingBox())
+        return bbox if area_index.Query(*bbox) else None
+
+    if hasattr(board, "GetModules"):
+        modules = list(board.GetModules())
+    else:
+        modules = list(board.GetFootprints())
+    tracks = list(board.GetTracks())
+    zone_count = board.GetAreaCount()
+
+    def candidates():
+        # One list of (item, bbox) candidates per board item
+        for item in tracks:
+            if type(item) in [pcbnew.PCB_ARC, pcbnew.PCB_TRACK, pcbnew.PCB_VIA]:
+                bbox = overlapping(item)
+                if bbox is not None:
+                    yield [(item, bbox)]
+                    continue
+            yield []
+
+        for item in modules:
+            if overlapping(item) is not None:
+                yield [(pad, box_tuple(pad.GetBoundingBox())) for pad in item.Pads()]
+            else:
+                yield []
+
+        # TODO: change algorithm to 'If one of the candidate area's edges overlaps with target area declare candidate as overlapping'
+        # Zones on the same net of an area are skipped later by the placement engine
+        for i in range(0, zone_count):
+            item = board.GetArea(i)
+            bbox = overlapping(item)
+            yield [(item, bbox)] if bbox is not None else []
+
+    total = len(tracks) + len(modules) + zone_count
+    group_name = group.GetName() if group is not None else None
+    clearances = {}
+    batch = []
+    for count, items in enumerate(candidates(), 1):
+        for item, bbox in items:
+            obstacle = SnapshotItem(item, bbox, layers, group_name, clearances)
+            if obstacle is not None:
+                batch.append(obstacle)
+        if count % size == 0 or count == total:
+            yield count / total, batch
+            batch = []
+
+
+def SnapshotObstacles(board, areas, group=None):
+    """Collect overlapping items all at once (see SnapshotBatches).
+
+    Parameters:
+        board (pcbnew.BOARD): Board
+        areas (list): Areas to be filled (pcbnew.ZONE)
+        group (pcbnew.PCB_GROUP): Via stitching group (see viastitching_board)
+
+    Returns:
+        list: Obstacle records, none if there are no areas
+    """
+
+    obstacles = []
+    for progress, batch in SnapshotBatches(board, areas, group):
+        obstacles.extend(batch)
+    return obstacles